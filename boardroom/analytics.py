@@ -0,0 +1,238 @@
+"""
+Insider trade analytics on the columnar trade and price data.
+
+Trades are the columns of a ``records.TradeBatch`` and prices the columns of
+``pricestore.read_prices``, both sorted by date.  Trades are joined to prices with
+``np.searchsorted`` and every computation is done on whole arrays, so scoring an issuer
+costs a few array operations whatever its number of trades.
+
+Volumes and signals are computed on stock trades only: derivative trades count options
+rather than shares.  A trade filed jointly by several owners is stored once per owner, so
+issuer totals keep only the rows of each form's first owner, see ``stock_trades``.
+"""
+import numpy as np
+
+from boardroom import pricestore, get_trades
+
+DEFAULT_HORIZONS = (5, 20, 60)
+# open market purchases and sales, the trades insiders choose to make
+OPEN_MARKET_CODES = ('P', 'S')
+
+
+def filter_trades(trade_columns, transaction_codes=None):
+    """Returns the trades with one of ``transaction_codes``, all of them if it is None."""
+    if transaction_codes is None:
+        return trade_columns
+    mask = np.isin(trade_columns['transaction_code'], list(transaction_codes))
+    return {name: values[mask] for name, values in trade_columns.items()}
+
+
+def stock_trades(trade_columns, first_owner_only=False):
+    """
+    Returns the non-derivative trades, only those of the first owner of each form if
+    ``first_owner_only``, which counts each trade once.  Columns without 'is_derivative' or
+    'owner_index' are taken as all stock trades of a single owner.
+    """
+    mask = np.ones(len(trade_columns['date']), dtype=bool)
+    if 'is_derivative' in trade_columns:
+        mask &= ~np.asarray(trade_columns['is_derivative'], dtype=bool)
+    if first_owner_only and 'owner_index' in trade_columns:
+        mask &= np.asarray(trade_columns['owner_index']) == 0
+    if mask.all():
+        return trade_columns
+    return {name: values[mask] for name, values in trade_columns.items()}
+
+
+def align_trades_to_prices(trade_dates, price_dates):
+    """
+    Returns the index in ``price_dates`` of the first trading day on or after each trade
+    date, or -1 for trades without a date, before the first price or after the last price.
+    """
+    trade_dates = np.asarray(trade_dates, dtype='datetime64[D]')
+    index = np.searchsorted(price_dates, trade_dates, side='left')
+    index[(index >= len(price_dates)) | np.isnat(trade_dates)] = -1
+    if len(price_dates):
+        # the first price of a later history is not the price at the trade
+        index[trade_dates < price_dates[0]] = -1
+    return index
+
+
+def forward_returns(trade_columns, price_columns, horizons=DEFAULT_HORIZONS):
+    """
+    Returns the close to close return over each of ``horizons`` trading days following
+    each trade, starting at the close of the trade day.
+
+    Returns:
+        dict: mapping each horizon to an array with one return per trade, NaN where the
+        prices do not cover the horizon.
+    """
+    close = np.asarray(price_columns['close'], dtype='f8')
+    index = align_trades_to_prices(trade_columns['date'], price_columns['date'])
+    valid = index >= 0
+    start = np.where(valid, index, 0)
+    returns = {}
+    for horizon in horizons:
+        end = start + horizon
+        has_end = valid & (end < len(close))
+        result = np.full(len(index), np.nan)
+        result[has_end] = close[end[has_end]] / close[start[has_end]] - 1
+        returns[horizon] = result
+    return returns
+
+
+def signed_shares(trade_columns):
+    """Returns the shares of each trade, positive if acquired, negative if disposed."""
+    shares = np.nan_to_num(np.asarray(trade_columns['num_shares'], dtype='f8'))
+    sign = np.where(trade_columns['acquired_disposed_code'] == 'D', -1.0,
+                    np.where(trade_columns['acquired_disposed_code'] == 'A', 1.0, 0.0))
+    return shares * sign
+
+
+def _group_volume(keys, trade_columns):
+    groups, inverse = np.unique(keys, return_inverse=True)
+    shares = signed_shares(trade_columns)
+    return {
+        'key': groups,
+        'buy_shares': np.bincount(inverse, weights=np.maximum(shares, 0),
+                                  minlength=len(groups)),
+        'sell_shares': np.bincount(inverse, weights=np.maximum(-shares, 0),
+                                   minlength=len(groups)),
+        'num_trades': np.bincount(inverse, minlength=len(groups)),
+        'inverse': inverse,
+        }
+
+
+def window_starts(dates, window='M', step=1):
+    """
+    Returns the start of the calendar window of each of ``dates``, in ``window`` units, or
+    days for weeks, which start on Mondays.  Windows of ``step`` units are counted from
+    1970, e.g. 'M' and 3 for calendar quarters.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    if window == 'W':
+        # datetime64 weeks start on Thursdays, 1970-01-01, shift them to Mondays
+        weeks = (dates + 3).astype('datetime64[W]').astype('i8') // step * step
+        return weeks.astype('datetime64[W]').astype('datetime64[D]') - 3
+    unit = 'datetime64[{}]'.format(window)
+    return (dates.astype(unit).astype('i8') // step * step).astype(unit)
+
+
+def volume_by_window(trade_columns, window='M', step=1):
+    """
+    Sums the bought and sold shares per calendar window of the trade dates, counting each
+    stock trade once.
+
+    Args:
+        window (str): numpy datetime unit of the windows, e.g. 'W', 'M' or 'Y'.
+        step (int): number of units per window, see ``window_starts``.
+
+    Returns:
+        dict: of arrays, 'window' the start of each window that has trades, 'buy_shares',
+        'sell_shares', 'net_shares' and 'num_trades'.
+    """
+    trade_columns = stock_trades(trade_columns, first_owner_only=True)
+    dates = np.asarray(trade_columns['date'], dtype='datetime64[D]')
+    has_date = ~np.isnat(dates)
+    trade_columns = {name: values[has_date] for name, values in trade_columns.items()}
+    volume = _group_volume(window_starts(dates[has_date], window, step), trade_columns)
+    return {'window': volume['key'],
+            'buy_shares': volume['buy_shares'],
+            'sell_shares': volume['sell_shares'],
+            'net_shares': volume['buy_shares'] - volume['sell_shares'],
+            'num_trades': volume['num_trades']}
+
+
+def volume_by_insider(trade_columns, returns=None):
+    """
+    Sums the bought and sold shares of each insider, including those of the stock trades
+    filed jointly with other insiders.
+
+    Args:
+        returns (array): optional forward return of each trade, e.g. one horizon of
+            ``forward_returns``, averaged per insider over the trades where it is known,
+            counting sales as the negated return.
+
+    Returns:
+        dict: of arrays, 'insider_cik', 'buy_shares', 'sell_shares', 'net_shares',
+        'num_trades' and, if ``returns`` is given, 'mean_signed_return'.
+    """
+    if returns is not None and 'is_derivative' in trade_columns:
+        returns = returns[~np.asarray(trade_columns['is_derivative'], dtype=bool)]
+    trade_columns = stock_trades(trade_columns)
+    volume = _group_volume(np.asarray(trade_columns['insider_cik']), trade_columns)
+    result = {'insider_cik': volume['key'],
+              'buy_shares': volume['buy_shares'],
+              'sell_shares': volume['sell_shares'],
+              'net_shares': volume['buy_shares'] - volume['sell_shares'],
+              'num_trades': volume['num_trades']}
+    if returns is not None:
+        result['mean_signed_return'] = _group_mean(
+            volume['inverse'], len(volume['key']),
+            np.sign(signed_shares(trade_columns)) * returns)
+    return result
+
+
+def _group_mean(inverse, num_groups, values):
+    known = ~np.isnan(values)
+    total = np.bincount(inverse[known], weights=values[known], minlength=num_groups)
+    count = np.bincount(inverse[known], minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _mean(values):
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else float('nan')
+
+
+def insider_signal(trade_columns, price_columns, horizon=20,
+                   transaction_codes=OPEN_MARKET_CODES):
+    """
+    Summarizes how the stock moved after the insider stock trades of one issuer.
+
+    Returns:
+        dict: 'num_buys', 'num_sells', 'net_shares', and 'buy_return' and 'sell_return',
+        the mean return over ``horizon`` trading days after buys and after sales.  The
+        'score' is the buy return minus the sell return, where known.
+    """
+    trades = filter_trades(stock_trades(trade_columns, first_owner_only=True),
+                           transaction_codes)
+    returns = forward_returns(trades, price_columns, (horizon,))[horizon]
+    shares = signed_shares(trades)
+    buy_return = _mean(returns[shares > 0])
+    sell_return = _mean(returns[shares < 0])
+    if np.isnan(buy_return) and np.isnan(sell_return):
+        score = float('nan')
+    else:
+        score = np.nan_to_num(buy_return) - np.nan_to_num(sell_return)
+    return {'num_buys': int((shares > 0).sum()),
+            'num_sells': int((shares < 0).sum()),
+            'net_shares': float(shares.sum()),
+            'buy_return': buy_return,
+            'sell_return': sell_return,
+            'score': float(score)}
+
+
+def score_issuers(issuers, year_start, year_end, horizon=20,
+                  transaction_codes=OPEN_MARKET_CODES):
+    """
+    Scores issuers from the stored trades and prices, see ``insider_signal``.
+
+    Args:
+        issuers (Iterable): (ticker, cik) pairs.  Issuers without stored trades or prices
+            are skipped.
+
+    Returns:
+        dict: mapping each ticker to its signal.
+    """
+    scores = {}
+    with get_trades.trade_db(sqlite_only=True) as db:
+        for ticker, cik in issuers:
+            if not pricestore.has_prices(ticker):
+                continue
+            trades = get_trades.read_trade_batch(cik, year_start, year_end, db).columns
+            if not len(trades['date']):
+                continue
+            scores[ticker] = insider_signal(trades, pricestore.read_prices(ticker), horizon,
+                                            transaction_codes)
+    return scores
@@ -0,0 +1,157 @@
+"""
+Parses SEC forms from the local form cache in bulk, on all cores.
+
+Each parsed form is written as one JSON line ``{"form_loc": ..., "form": {...}}``, or
+``{"form_loc": ..., "error": "..."}`` if it could not be parsed.  Examples::
+
+    # every form in the cache
+    python -m boardroom.bulk_parse --output forms.jsonl
+
+    # forms listed in the form index for one CIK
+    python -m boardroom.bulk_parse --years 2015 2016 --cik 1131324 --output -
+
+    # with the read and parse latencies of every worker, see boardroom.metrics
+    python -m boardroom.bulk_parse --output forms.jsonl --metrics metrics.json
+"""
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+
+from boardroom import config, utils, ingestdata, parse_secform, metrics
+
+
+def index_form_locs_iter(years, cik=None):
+    """
+    Yields the location of every form in the form index for ``years``, once per form.
+    """
+    for year in years:
+        seen = set()
+        for row in utils.form_loc_iter(year, cik=cik):
+            form_loc = row[4]
+            if form_loc not in seen:
+                seen.add(form_loc)
+                yield form_loc
+
+
+def chunks_iter(iterable, size):
+    """Yields lists of up to ``size`` items of ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parse_chunk(form_locs):
+    """
+    Parses the cached forms at ``form_locs``.
+
+    Runs in the worker processes.  Results are serialized here so the parent process only
+    has to write them out.
+
+    Returns:
+        tuple: number of forms that failed, JSON lines of the results, snapshot of the
+        metrics of the chunk
+    """
+    # forked workers start with the metrics of the parent
+    metrics.REGISTRY.reset()
+    lines = []
+    num_errors = 0
+    for form_loc in form_locs:
+        try:
+            with metrics.timer(metrics.FORM_CACHE_READ_SECONDS):
+                text = ingestdata._get_sec_form_cache(form_loc)
+            result = {'form_loc': form_loc, 'form': parse_secform.parse_form(text)}
+        except Exception as e:
+            num_errors += 1
+            result = {'form_loc': form_loc, 'error': '{}: {}'.format(type(e).__name__, e)}
+        lines.append(json.dumps(result) + '\n')
+    return num_errors, ''.join(lines), metrics.REGISTRY.snapshot()
+
+
+def bulk_parse(form_locs, sink, processes=None, chunksize=config.BULK_PARSE_CHUNKSIZE,
+               report_interval=10, log=sys.stderr):
+    """
+    Parses the cached forms at ``form_locs`` with a pool of processes.
+
+    Form locations are handed to the workers in chunks of ``chunksize`` and results are
+    written to ``sink`` as soon as each chunk is done, in no particular order.  The metrics
+    of the workers are added to those of this process.
+
+    Args:
+        form_locs (Iterable): Locations of forms in the form cache.
+        sink: File-like object the JSON lines are written to.
+        processes (int): Number of worker processes.  Defaults to the number of cores.
+        chunksize (int): Number of forms per work item.
+        report_interval (float): Seconds between progress reports to ``log``.
+        log: File-like object for progress reports, or None.
+
+    Returns:
+        dict: with keys forms, errors, seconds and forms_per_second.
+    """
+    num_forms = num_errors = 0
+    start = last_report = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        for chunk_errors, lines, snapshot in pool.imap_unordered(
+                _parse_chunk, chunks_iter(form_locs, chunksize)):
+            metrics.REGISTRY.merge(snapshot)
+            sink.write(lines)
+            num_forms += lines.count('\n')
+            num_errors += chunk_errors
+            now = time.time()
+            if log is not None and now - last_report >= report_interval:
+                last_report = now
+                log.write('{} forms, {} errors, {:.1f} forms/s\n'.format(
+                    num_forms, num_errors, num_forms / (now - start)))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    seconds = time.time() - start
+    stats = {
+        'forms': num_forms,
+        'errors': num_errors,
+        'seconds': seconds,
+        'forms_per_second': num_forms / seconds if seconds > 0 else 0.0,
+        }
+    if log is not None:
+        log.write('Parsed {forms} forms ({errors} errors) in {seconds:.1f}s, '
+                  '{forms_per_second:.1f} forms/s\n'.format(**stats))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parse cached SEC forms in bulk.')
+    parser.add_argument('--years', nargs='+', type=int,
+                        help='parse the forms in the form index for these years instead of '
+                             'every form in the cache')
+    parser.add_argument('--cik', help='only forms listed under this CIK (requires --years)')
+    parser.add_argument('--output', default='-', help='JSON lines output file, - for stdout')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes, defaults to the number of cores')
+    parser.add_argument('--chunksize', type=int, default=config.BULK_PARSE_CHUNKSIZE)
+    parser.add_argument('--metrics', help='write the metrics of the run to this JSON file')
+    args = parser.parse_args(argv)
+    if args.cik is not None and args.years is None:
+        parser.error('--cik requires --years')
+
+    if args.years is None:
+        form_locs = ingestdata._iter_sec_form_cache()
+    else:
+        form_locs = index_form_locs_iter(args.years, cik=args.cik)
+    if args.output == '-':
+        bulk_parse(form_locs, sys.stdout, args.processes, args.chunksize)
+    else:
+        with open(args.output, 'w') as sink:
+            bulk_parse(form_locs, sink, args.processes, args.chunksize)
+    if args.metrics:
+        metrics.dump_json(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,103 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
 FORM_INDEX_DIR = os.path.join(DATA_DIR, 'form_index')
 FORM_CACHE_DIR = os.path.join(DATA_DIR, 'form_cache')
+FORM_SEGMENT_CACHE_DIR = os.path.join(DATA_DIR, 'form_segments')
 STOCK_PRICE_DIR = os.path.join(DATA_DIR, 'stock_price')
+TRADE_STORE_DIR = os.path.join(DATA_DIR, 'trade_store')
+JOB_QUEUE_DB = os.path.join(DATA_DIR, 'jobs.db')
+TRADE_DB = os.path.join(DATA_DIR, 'trades.db')
+FORM_SEARCH_DB = os.path.join(DATA_DIR, 'form_search.db')
 
 EDGAR_BASEURL = 'https://www.sec.gov/Archives/'
+COMPANY_TICKERS_URL = 'https://www.sec.gov/files/company_tickers.json'
 YAHOO_STRUCTURL = ('https://finance.yahoo.com/quote/{ticker}/history?'
                    'period1={dt_start}&period2={dt_end}&'
                    'interval=1d&filter=history&frequency=1d'
                    )
 
+# EDGAR fair access policy allows at most 10 requests per second
+EDGAR_MAX_REQUESTS_PER_SECOND = 10
+FORM_DOWNLOAD_WORKERS = 8
+
+# stock price refreshes, see ingestdata.refresh_stock_prices_many
+YAHOO_MAX_REQUESTS_PER_SECOND = 2
+PRICE_REFRESH_WORKERS = 4
+
+# 'yahoo' scrapes Yahoo Finance per ticker, 'files' loads the end of day CSV or Parquet
+# dumps matching PRICE_FILES, whose column names are given by PRICE_FILE_COLUMNS
+PRICE_PROVIDER = os.environ.get('BOARDROOM_PRICE_PROVIDER', 'yahoo')
+PRICE_FILES = os.environ.get('BOARDROOM_PRICE_FILES',
+                             os.path.join(DATA_DIR, 'price_files', '*'))
+PRICE_FILE_COLUMNS = {
+    'ticker': 'ticker',
+    'date': 'date',
+    'open': 'open',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close',
+    'volume': 'volume',
+    }
+
+# HTTP transport shared by all downloads.  The SEC fair access policy asks for a User-Agent
+# declaring who downloads, "<company or name> <contact email>", and EDGAR answers others
+# with 403: set BOARDROOM_USER_AGENT to your own, the default is only a placeholder
+DEFAULT_HTTP_USER_AGENT = 'boardroom-user admin@example.com'
+HTTP_USER_AGENT = os.environ.get('BOARDROOM_USER_AGENT', DEFAULT_HTTP_USER_AGENT)
+HTTP_POOL_SIZE = 16
+HTTP_TIMEOUT = 30
+HTTP_NUM_RETRIES = 5
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_MAX = 60
+
+# number of forms in each work item of the bulk parser
+BULK_PARSE_CHUNKSIZE = 64
+
+# 'files' stores one gzip file per form under FORM_CACHE_DIR, 'segments' packs forms into
+# large segment files under FORM_SEGMENT_CACHE_DIR (see boardroom.segmentcache)
+FORM_CACHE_BACKEND = os.environ.get('BOARDROOM_FORM_CACHE_BACKEND', 'files')
+FORM_CACHE_SEGMENT_SIZE = 1 << 30
+
+# set to index the text of forms in FORM_SEARCH_DB as they are cached, off by default (see
+# boardroom.formsearch), the largest number of forms per transaction, and of forms waiting
+# to be indexed
+FORM_SEARCH_INDEX = os.environ.get('BOARDROOM_FORM_SEARCH_INDEX', '0') == '1'
+FORM_SEARCH_BATCH_SIZE = 1000
+FORM_SEARCH_QUEUE_SIZE = 1000
+
+# in-process caches, sizes in entries and time to live in seconds
+TICKER_CIK_CACHE_SIZE = 10000
+TICKER_CIK_CACHE_TTL = 24 * 60 * 60
+FORM_DICT_CACHE_SIZE = 5000
+FORM_DICT_CACHE_TTL = 60 * 60
+
+# seconds before the bulk ticker to CIK map is downloaded again, and before a failed
+# download is retried
+COMPANY_TICKERS_MAX_AGE = 24 * 60 * 60
+COMPANY_TICKERS_RETRY_DELAY = 10 * 60
+
+# background ingest jobs (see boardroom.jobs): seconds between polls of an idle worker,
+# seconds after which a running job whose worker died is queued again, and seconds after
+# which the trades of the current year are ingested again
+JOB_POLL_INTERVAL = 2
+JOB_STALE_AFTER = 60 * 60
+TRADE_REFRESH_AFTER = 60 * 60
+
+# 'columns' keeps ingested trades in the numpy column store under TRADE_STORE_DIR,
+# 'sqlite' in the TRADE_DB database (see boardroom.tradestore and boardroom.tradedb).  The
+# index of filings by insider is in TRADE_DB with either backend.
+TRADE_BACKEND = os.environ.get('BOARDROOM_TRADE_BACKEND', 'columns')
+# number of forms per transaction when bulk loading the trade database
+TRADE_DB_BATCH_SIZE = 10000
+
+# the price series of a graph is reduced to at most PLOT_MAX_POINTS points, and its trades
+# summed into at most PLOT_MAX_TRADE_BARS bars
+PLOT_MAX_POINTS = 1000
+PLOT_MAX_TRADE_BARS = 400
+
+# JSON API: default and largest page sizes, and smallest response body that is gzipped
+API_PAGE_SIZE = 500
+API_MAX_PAGE_SIZE = 5000
+API_GZIP_MIN_SIZE = 1024
+
+# in-process metrics of ingest, parsing and rendering (see boardroom.metrics)
+METRICS_ENABLED = os.environ.get('BOARDROOM_METRICS', '1') == '1'
@@ -0,0 +1,280 @@
+"""
+Full-text search index over the cached SEC forms.
+
+The text of each form a reader looks for, the issuer, the names of its reporting owners,
+its footnotes and remarks, is indexed in an SQLite FTS5 table after the form is saved to
+the form cache, by an ``IndexWriter`` in the background, if ``config.FORM_SEARCH_INDEX``
+is set (see ``ingestdata._save_sec_form_cache``).  Forms without an ownership XML
+section are indexed by their full text.  Queries use the FTS5 syntax, e.g. a phrase in
+double quotes, and return form locations with a snippet of the matching text, best match
+first::
+
+    # index the forms cached before the index existed
+    python -m boardroom.formsearch index
+
+    python -m boardroom.formsearch search '"10b5-1 plan"'
+    python -m boardroom.formsearch search 'owners:baker AND footnotes:option'
+"""
+import os
+import sys
+import queue
+import sqlite3
+import argparse
+import threading
+import itertools
+
+from lxml import etree
+
+from boardroom import config, utils
+
+FORM_SEARCH_SCHEMA = """
+create table if not exists indexed_form (
+    id          integer primary key,
+    form_loc    text unique not null
+);
+create virtual table if not exists form_text using fts5(
+    issuer, owners, footnotes, remarks, body, tokenize='porter unicode61'
+);
+"""
+FORM_TEXT_COLUMNS = ('issuer', 'owners', 'footnotes', 'remarks', 'body')
+# elements of the form xml whose text is indexed, by column
+_TEXT_TAGS = {
+    'issuerName':           'issuer',
+    'issuerTradingSymbol':  'issuer',
+    'rptOwnerName':         'owners',
+    'footnote':             'footnotes',
+    'remarks':              'remarks',
+    }
+
+
+def form_text(content):
+    """
+    Returns the text of the form ``content`` to index, a dict mapping each column of
+    ``FORM_TEXT_COLUMNS`` to a string.
+    """
+    texts = {column: [] for column in FORM_TEXT_COLUMNS}
+    start = content.find('<XML>')
+    end = content.find('</XML>', start)
+    tree = None
+    if start != -1 and end != -1:
+        xml = content[start+len('<XML>'):end].strip().encode('utf8')
+        try:
+            tree = etree.fromstring(xml, etree.XMLParser(recover=True, encoding='utf-8'))
+        except etree.XMLSyntaxError:
+            pass
+    if tree is None:
+        texts['body'].append(content)
+    else:
+        for element in tree.iter(*_TEXT_TAGS):
+            text = ' '.join(''.join(element.itertext()).split())
+            if text:
+                texts[_TEXT_TAGS[element.tag]].append(text)
+    return {column: '\n'.join(values) for column, values in texts.items()}
+
+
+class FormSearchIndex(object):
+    """
+    Full-text index of SEC forms in the SQLite database ``fpath``.
+
+    Connections are shared by the threads of a process, like ``segmentcache.SegmentCache``.
+    """
+    def __init__(self, fpath):
+        self.fpath = fpath
+        utils.makedirs(os.path.dirname(fpath))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(fpath, timeout=30, check_same_thread=False)
+        self._db.execute('pragma journal_mode=wal')
+        self._db.execute('pragma synchronous=normal')
+        self._db.executescript(FORM_SEARCH_SCHEMA)
+
+    def __contains__(self, form_loc):
+        with self._lock:
+            row = self._db.execute('select 1 from indexed_form where form_loc = ?',
+                                   (form_loc,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('select count(*) from indexed_form').fetchone()[0]
+
+    def add(self, form_loc, content):
+        """Indexes the form ``content`` (str or bytes) at ``form_loc``, replacing any before."""
+        self.add_many([(form_loc, content)])
+
+    def add_many(self, form_items):
+        """
+        Indexes the forms of ``form_items``, (form_loc, content) pairs, in one transaction.
+
+        Returns:
+            int: number of forms indexed.
+        """
+        rows = []
+        for form_loc, content in form_items:
+            if isinstance(content, bytes):
+                content = content.decode('utf8', 'replace')
+            text = form_text(content)
+            rows.append((form_loc, tuple(text[column] for column in FORM_TEXT_COLUMNS)))
+        with self._lock, self._db:
+            for form_loc, values in rows:
+                row = self._db.execute('select id from indexed_form where form_loc = ?',
+                                       (form_loc,)).fetchone()
+                if row is None:
+                    form_id = self._db.execute('insert into indexed_form (form_loc) values (?)',
+                                               (form_loc,)).lastrowid
+                else:
+                    form_id = row[0]
+                    self._db.execute('delete from form_text where rowid = ?', (form_id,))
+                self._db.execute('insert into form_text (rowid, {}) values (?, {})'.format(
+                    ', '.join(FORM_TEXT_COLUMNS), ', '.join('?' * len(FORM_TEXT_COLUMNS))),
+                    (form_id,) + values)
+        return len(rows)
+
+    def search(self, query, limit=20, offset=0):
+        """
+        Returns the forms matching the FTS5 ``query``, best match first.
+
+        Returns:
+            list: of dicts with keys form_loc, issuer, owners and snippet, the matching text
+            with the matched terms in square brackets.
+
+        Raises:
+            ValueError: if ``query`` is not a valid FTS5 query.
+        """
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    "select indexed_form.form_loc, form_text.issuer, form_text.owners, "
+                    "snippet(form_text, -1, '[', ']', '...', 16) from form_text "
+                    "join indexed_form on indexed_form.id = form_text.rowid "
+                    "where form_text match ? order by rank limit ? offset ?",
+                    (query, int(limit), int(offset))).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError('Invalid search query {!r}: {}'.format(query, e))
+        return [{'form_loc': form_loc, 'issuer': issuer, 'owners': owners.split('\n'),
+                 'snippet': snippet}
+                for form_loc, issuer, owners, snippet in rows]
+
+    def optimize(self):
+        """Merges the index into a single b-tree, for the fastest queries after a backfill."""
+        with self._lock, self._db:
+            self._db.execute("insert into form_text (form_text) values ('optimize')")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IndexWriter(object):
+    """
+    Indexes forms in ``fpath`` from a thread of its own, in batches of the forms queued
+    meanwhile, so that caching a form neither waits for the index nor fails with it.
+
+    Forms that cannot be indexed, e.g. while another process holds the index locked for
+    longer than the timeout, are reported and left out; ``python -m boardroom.formsearch
+    index`` indexes them later.
+    """
+    def __init__(self, fpath, batch_size=None, queue_size=None):
+        self.fpath = fpath
+        self.batch_size = batch_size or config.FORM_SEARCH_BATCH_SIZE
+        self._queue = queue.Queue(queue_size or config.FORM_SEARCH_QUEUE_SIZE)
+        self._index = None
+        self._thread = threading.Thread(target=self._run, name='formsearch-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, form_loc, content):
+        """Queues the form ``content`` at ``form_loc``, dropping it if the queue is full."""
+        try:
+            self._queue.put_nowait((form_loc, content))
+        except queue.Full:
+            print('Form search queue is full, not indexing {}'.format(form_loc),
+                  file=sys.stderr)
+
+    def flush(self):
+        """Waits until every form queued so far is indexed, or failed to be."""
+        self._queue.join()
+
+    def close(self):
+        """Indexes the forms queued so far and stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                closing = True
+            form_items = [item for item in batch if item is not None]
+            try:
+                if form_items:
+                    if self._index is None:
+                        self._index = FormSearchIndex(self.fpath)
+                    self._index.add_many(form_items)
+            except Exception as e:
+                print('Could not index {} forms in {}: {}'.format(len(form_items), self.fpath,
+                                                                  e), file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        if self._index is not None:
+            self._index.close()
+
+
+def index_forms(index, form_items, batch_size=None):
+    """
+    Indexes the forms of ``form_items``, (form_loc, content) pairs, ``batch_size`` forms per
+    transaction.
+
+    Returns:
+        int: number of forms indexed.
+    """
+    batch_size = batch_size or config.FORM_SEARCH_BATCH_SIZE
+    form_items = iter(form_items)
+    num_forms = 0
+    while True:
+        batch = list(itertools.islice(form_items, batch_size))
+        if not batch:
+            return num_forms
+        num_forms += index.add_many(batch)
+
+
+def main(argv=None):
+    # ingestdata indexes the forms it caches with this module
+    from boardroom import ingestdata
+
+    parser = argparse.ArgumentParser(description='Search the text of the cached SEC forms.')
+    subparsers = parser.add_subparsers(dest='command')
+    index_parser = subparsers.add_parser('index', help='index the cached forms not yet indexed')
+    index_parser.add_argument('--all', action='store_true',
+                              help='index every cached form again')
+    search_parser = subparsers.add_parser('search', help='search the indexed forms')
+    search_parser.add_argument('query', help='FTS5 query, e.g. \'"10b5-1 plan"\'')
+    search_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    index = FormSearchIndex(config.FORM_SEARCH_DB)
+    if args.command == 'index':
+        form_locs = (form_loc for form_loc in ingestdata._iter_sec_form_cache()
+                     if args.all or form_loc not in index)
+        num_forms = index_forms(index, ((form_loc, ingestdata._get_sec_form_cache(form_loc))
+                                        for form_loc in form_locs))
+        index.optimize()
+        print('Indexed {} forms'.format(num_forms))
+    elif args.command == 'search':
+        for result in index.search(args.query, args.limit):
+            print('{form_loc}\t{issuer}\t{snippet}'.format(
+                form_loc=result['form_loc'], issuer=result['issuer'].replace('\n', ' '),
+                snippet=' '.join(result['snippet'].split())))
+    else:
+        parser.print_help()
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 from boardroom import ingestdata
 
 
-def get_stock_price_timeseries(ticker):
+def get_stock_price_timeseries(ticker, allow_download=True, date_start=None, date_end=None):
+    """
+    Returns the dates and close prices of ``ticker`` from ``date_start`` to ``date_end``,
+    as views of the memory-mapped arrays of the price store.
+    """
     ticker = ticker.upper()
-    stock_dicts = ingestdata.get_stock_price_dicts(ticker)
-    dates_prices = [(d['date'],d['close']) for d in stock_dicts if 'close' in d]
-    dates, prices = zip(*dates_prices)
-    return dates, prices
+    columns = ingestdata.get_stock_price_columns(ticker, date_start, date_end, allow_download)
+    return columns['date'], columns['close']
@@ -1,36 +1,275 @@
 import time
+import collections
+import contextlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from boardroom import utils, ingestdata, parse_secform
+from boardroom import utils, config, ingestdata, parse_secform, tradestore, tradedb
 
 
-def forms_from_ticker_iter(ticker, year_start, year_end, cache_files=False,
-                            download_delay=0.5):
+@contextlib.contextmanager
+def trade_db(db=None, sqlite_only=False):
     """
-    Retrieve trades of stock ticker in year range.
+    Yields ``db``, or if it is None a trade database connection that is closed on exit, see
+    ``tradedb.get_trade_db``.  With ``sqlite_only``, None is yielded instead of a new
+    connection when ``config.TRADE_BACKEND`` is not 'sqlite'.
+    """
+    if db is not None or (sqlite_only and config.TRADE_BACKEND != 'sqlite'):
+        yield db
+        return
+    with contextlib.closing(tradedb.get_trade_db()) as db:
+        yield db
+
+
+def forms_from_locs_iter(form_locs, cache_files=False,
+                         max_workers=config.FORM_DOWNLOAD_WORKERS, ordered=False,
+                         with_locs=False):
+    """
+    Retrieves and parses the SEC forms at ``form_locs`` using a pool of threads.
+
+    Downloads go through ``ingestdata.download_sec_file``, whose rate limiter is shared
+    by all threads, so the total request rate to EDGAR stays within the allowed limit no
+    matter how many workers are used.  At most ``2 * max_workers`` forms are in flight at
+    a time, so ``form_locs`` can be a lazy iterable of any length.
+
+    Args:
+        form_locs (Iterable): Locations of forms on SEC's EDGAR site.
+        cache_files (bool): If True, downloaded forms are saved to the local cache.
+        max_workers (int): Number of forms downloaded and parsed concurrently.
+        ordered (bool): If True, forms are yielded in the order of ``form_locs``,
+            otherwise each one is yielded as soon as it is parsed.
+        with_locs (bool): If True, (form_loc, form dict) pairs are yielded.
+
+    Yields:
+        dict: form dict as returned by ``parse_secform.get_form_dict``.
+    """
+    form_locs = iter(form_locs)
+    future_locs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(form_loc):
+            future = executor.submit(parse_secform.get_form_dict, form_loc,
+                                     cache_file=cache_files)
+            future_locs[future] = form_loc
+            return future
+        pending = collections.deque(submit(form_loc) for form_loc in
+                                    itertools.islice(form_locs, 2 * max_workers))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done_set, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [f for f in pending if f in done_set]
+                pending = collections.deque(f for f in pending if f not in done_set)
+            for future in done:
+                form_dict, used_cache = future.result()
+                form_loc = future_locs.pop(future)
+                yield (form_loc, form_dict) if with_locs else form_dict
+            pending.extend(submit(form_loc) for form_loc in
+                           itertools.islice(form_locs, len(done)))
+
+
+def form_locs_from_cik_iter(cik, year_start, year_end):
+    """
+    Yields the location of every form filed for ``cik`` in the year range.
     """
-    cik = ingestdata.ticker_to_cik(ticker)
     for year in range(int(year_start), int(year_end)+1):
         year = str(year)
         for row in utils.form_loc_iter(year, cik=cik):
-            company_name = row[1]
-            form_loc = row[4]
-            form_dict, used_cache = parse_secform.get_form_dict(form_loc,
-                                                        cache_file=cache_files)
-            yield form_dict
-            if used_cache is False:
-                time.sleep(download_delay)
-
-
-def get_trades_from_ticker(ticker, year_start, year_end):
-    forms = forms_from_ticker_iter(ticker, year_start, year_end,
-                                   cache_files=True)
-    trades_all = []
-    for form in forms:
-        trades = form['nonderivative']['trades']
-        for t in trades:
-            t['issuer_cik'] = list(form['issuer'].keys())[0]
-            t['insider_cik'] = list(form['owner'].keys())[0]
-        trades_all.extend(trades)
-    return trades_all
+            yield row[4]
+
+
+def forms_from_ticker_iter(ticker, year_start, year_end, cache_files=False,
+                           max_workers=config.FORM_DOWNLOAD_WORKERS, ordered=False):
+    """
+    Retrieve trades of stock ticker in year range.
+
+    Forms are downloaded concurrently, see ``forms_from_locs_iter``.
+    """
+    cik = ingestdata.ticker_to_cik(ticker)
+    form_locs = form_locs_from_cik_iter(cik, year_start, year_end)
+    return forms_from_locs_iter(form_locs, cache_files=cache_files,
+                                max_workers=max_workers, ordered=ordered)
+
+
+def ingest_trades(cik, year, cache_files=True, db=None):
+    """
+    Parses every form filed under ``cik`` in ``year`` and writes its trades to the
+    trade store, or the trade database if ``config.TRADE_BACKEND`` is 'sqlite'.  The
+    reporting owners of the forms are added to the insider index of the trade database
+    either way.
+
+    ``db`` is an open trade database connection, to ingest many partitions with one.
+
+    Returns:
+        int: number of trades written.
+    """
+    form_locs = form_locs_from_cik_iter(cik, year, year)
+    form_items = forms_from_locs_iter(form_locs, cache_files=cache_files, ordered=True,
+                                      with_locs=True)
+    with trade_db(db) as db:
+        if config.TRADE_BACKEND == 'sqlite':
+            return tradedb.write_partition(year, cik, form_items, db)
+        # the forms stream into the trade store, only their issuers and owners are kept
+        owner_items = []
+
+        def forms():
+            for form_loc, form in form_items:
+                owner_items.append((form_loc, {'issuer': form['issuer'],
+                                               'owner': form['owner']}))
+                yield form
+        num_trades = tradestore.write_partition(year, cik, forms())
+        tradedb.write_owner_index(year, cik, owner_items, db)
+        return num_trades
+
+
+def stored_partitions(db=None):
+    """Returns the (year, cik) partitions ingested with ``config.TRADE_BACKEND``, sorted."""
+    if config.TRADE_BACKEND == 'sqlite':
+        with trade_db(db) as db:
+            return tradedb.ingested_partitions(db)
+    return list(tradestore.iter_partitions())
+
+
+def index_owners(cache_files=True, db=None):
+    """
+    Rebuilds the insider index of every stored partition, e.g. of those ingested before it
+    existed, which ``years_to_ingest`` never ingests again.
+
+    The forms of each partition are those of the form index, parsed again from the form
+    cache, or downloaded if they are not cached.
+
+    Returns:
+        int: number of partitions indexed.
+    """
+    with trade_db(db) as db:
+        partitions = stored_partitions(db)
+        for year, cik in partitions:
+            form_items = forms_from_locs_iter(form_locs_from_cik_iter(cik, year, year),
+                                              cache_files=cache_files, ordered=True,
+                                              with_locs=True)
+            tradedb.write_owner_index(year, cik, form_items, db)
+    return len(partitions)
 
 
+def _partition_mtime(year, cik, db):
+    if config.TRADE_BACKEND == 'sqlite':
+        return tradedb.partition_mtime(year, cik, db)
+    return tradestore.partition_mtime(year, cik)
+
+
+def read_trade_batch(cik, year_start, year_end, db=None, transaction_codes=None,
+                     first_owner_only=False):
+    """
+    Returns the stored trades of ``cik`` in the year range as a ``records.TradeBatch``.
+
+    Both backends read the forms ingested for ``cik`` in the form index years of the range,
+    see ``ingest_trades``, so a trade is in the year it was filed whatever its trade date.
+    Trades are recorded once per reporting owner of their form, ``first_owner_only`` keeps
+    those of the first owner so that a joint filing lists each trade once.
+    """
+    if config.TRADE_BACKEND == 'sqlite':
+        with trade_db(db) as db:
+            return tradedb.read_trade_batch(cik, year_start, year_end, db, transaction_codes,
+                                            first_owner_only)
+    return tradestore.read_trade_batch(cik, year_start, year_end, transaction_codes,
+                                       first_owner_only)
+
+
+def data_version(cik, year_start, year_end, db=None):
+    """
+    Returns a value that changes whenever the stored trades of ``cik`` in the year range
+    change, without reading them.
+    """
+    with trade_db(db, sqlite_only=True) as db:
+        return [_partition_mtime(year, cik, db)
+                for year in range(int(year_start), int(year_end)+1)]
+
+
+def years_to_ingest(cik, year_start, year_end, refresh_after=None, db=None):
+    """
+    Returns the years in the range whose trades for ``cik`` are missing from the trade store.
+
+    The current year keeps receiving new filings, so it is also returned if it was ingested
+    more than ``refresh_after`` seconds ago, or at all if ``refresh_after`` is None.
+    """
+    years = []
+    with trade_db(db, sqlite_only=True) as db:
+        for year in range(int(year_start), int(year_end)+1):
+            mtime = _partition_mtime(year, cik, db)
+            if mtime is None:
+                years.append(year)
+            elif not tradestore.is_partition_final(year):
+                if refresh_after is None or time.time() - mtime > refresh_after:
+                    years.append(year)
+    return years
+
+
+def stored_trades_from_ticker(ticker, year_start, year_end, db=None, transaction_codes=None,
+                              first_owner_only=False):
+    """
+    Returns the trades filed under ``ticker`` in the year range that are already stored,
+    without downloading anything.
+
+    ``db`` is an open trade database connection to use with the 'sqlite' backend.  If
+    ``first_owner_only``, a trade filed jointly by several owners is returned once, as
+    reported by the first owner.
+
+    Returns:
+        tuple: ``records.TradeBatch`` of the trades, list of years that are missing or out of
+        date, see ``years_to_ingest``.
+
+    Raises:
+        KeyError: if the CIK of ``ticker`` is not known locally.
+    """
+    cik = ingestdata.ticker_to_cik(ticker, allow_download=False)
+    with trade_db(db, sqlite_only=True) as db:
+        missing_years = years_to_ingest(cik, year_start, year_end,
+                                        refresh_after=config.TRADE_REFRESH_AFTER, db=db)
+        trades = read_trade_batch(cik, year_start, year_end, db, transaction_codes,
+                                  first_owner_only)
+    return trades, missing_years
+
+
+def get_trades_from_ticker(ticker, year_start, year_end, transaction_codes=None, db=None):
+    """
+    Returns the trades filed under ``ticker`` in the year range as a ``records.TradeBatch``,
+    only those with one of ``transaction_codes`` if it is given.
+
+    Trades are read from the trade store or database, see ``config.TRADE_BACKEND``.  Years
+    that have not been ingested yet, and the current year which keeps receiving new
+    filings, are parsed and stored first.  ``db`` is an open trade database connection, one
+    is opened for the call if it is None.
+    """
+    cik = ingestdata.ticker_to_cik(ticker)
+    with trade_db(db) as db:
+        for year in years_to_ingest(cik, year_start, year_end, db=db):
+            ingest_trades(cik, year, db=db)
+        return read_trade_batch(cik, year_start, year_end, db,
+                                transaction_codes=transaction_codes)
+
+
+def get_trades_from_insider(insider_cik, year_start, year_end, transaction_codes=None,
+                            db=None):
+    """
+    Returns the trades reported by ``insider_cik`` in the year range across every issuer,
+    as a ``records.TradeBatch``, only those with one of ``transaction_codes`` if it is given.
+
+    Trades are looked up through the insider index of the trade database, so only the
+    filings ingested so far are covered, see ``ingest_trades``.  As with issuers, years are
+    those of the form index, see ``read_trade_batch``.
+    """
+    with trade_db(db) as db:
+        if config.TRADE_BACKEND == 'sqlite':
+            return tradedb.read_insider_trades(insider_cik, year_start, year_end, db,
+                                               transaction_codes)
+        partitions = tradedb.owner_partitions(insider_cik, db, year_start, year_end)
+    return tradestore.read_insider_trades(insider_cik, partitions, transaction_codes)
+
+
+def get_issuers_from_insider(insider_cik, db=None):
+    """
+    Returns the issuers of the ingested filings of ``insider_cik``, see
+    ``tradedb.insider_issuers``.
+    """
+    with trade_db(db) as db:
+        return tradedb.insider_issuers(insider_cik, db)
@@ -1,60 +1,225 @@
 import os
+import io
 import gzip
 import csv
+import glob
+import atexit
 import json
 import time
+import shutil
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from lxml import etree
 import requests
-try:
-    from StringIO import StringIO
-except:
-    from io import StringIO, BytesIO
+import numpy as np
+from contextlib import closing
 
 from boardroom import utils
 from boardroom import config
+from boardroom import transport
+from boardroom import segmentcache
+from boardroom import formsearch
+from boardroom import metrics
+from boardroom import pricestore
+
+try:
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:
+    pyarrow_parquet = None
 
 try:
     basestring
 except NameError:
     basestring = str
 
+# Shared by every thread downloading from EDGAR so the combined request rate stays
+# within the SEC's fair access policy.
+EDGAR_RATE_LIMITER = utils.TokenBucket(config.EDGAR_MAX_REQUESTS_PER_SECOND)
 
-def download_url(url, num_retries=3, retry_time_delay=1,
-                 accept_status_codes=(200,)):
-    headers = {"Connection" : "close"}
-    for i in range(num_retries):
-        try:
-            r = requests.get(url, headers=headers)
-            assert(r.status_code in accept_status_codes)
-        except Exception as e:
-            print('There was an error with request: {}'.format(e))
-            if i == num_retries-1:
-                raise
-            time.sleep(retry_time_delay)
-    return r
+# Shared by every thread downloading stock prices.
+YAHOO_RATE_LIMITER = utils.TokenBucket(config.YAHOO_MAX_REQUESTS_PER_SECOND)
 
+# Shared by every request of the process, so lookups don't re-read ticker_cik.json.
+TICKER_CIK_CACHE = utils.LRUCache(config.TICKER_CIK_CACHE_SIZE, config.TICKER_CIK_CACHE_TTL)
 
-def download_sec_file(file_loc):
-    """Downloads SEC form from EDGAR system using HTTPS"""
+
+def download_url(url, num_retries=config.HTTP_NUM_RETRIES, accept_status_codes=(200,),
+                 rate_limiter=None, stream=False):
+    """
+    Downloads ``url`` through the shared, pooled HTTP transport.
+
+    If ``stream`` is True the body is left unread, the caller must read it from ``r.raw``
+    or ``r.iter_content`` and close the response.
+    """
+    return transport.get(url, accept_status_codes=accept_status_codes,
+                         num_retries=num_retries, rate_limiter=rate_limiter, stream=stream)
+
+
+def _sec_file_url(file_loc):
     if file_loc.startswith('/'):
         file_loc = file_loc[1:]
-    url = config.EDGAR_BASEURL + file_loc
-    r = download_url(url, accept_status_codes=(200,404))
-    content = r.content
+    return config.EDGAR_BASEURL + file_loc
+
+
+def download_sec_file(file_loc):
+    """Downloads SEC form from EDGAR system using HTTPS"""
+    url = _sec_file_url(file_loc)
+    with metrics.timer(metrics.DOWNLOAD_SECONDS):
+        r = download_url(url, accept_status_codes=(200,404),
+                         rate_limiter=EDGAR_RATE_LIMITER)
+        content = r.content
+    metrics.DOWNLOAD_BYTES.inc(len(content))
     if r.status_code == 404:
         r.raise_for_status()
     return content
 
 
-def ticker_to_cik(ticker, use_cache=True, remove_leading_zeros=True):
+def stream_sec_file(file_loc):
+    """
+    Opens SEC file on EDGAR system as a stream, without reading the body.
+
+    Returns:
+        binary file object over the (transfer-decoded) body.  Once read to the end, the
+        connection goes back to the pool; the caller must close it in any case.
+    """
+    url = _sec_file_url(file_loc)
+    r = download_url(url, accept_status_codes=(200,404),
+                     rate_limiter=EDGAR_RATE_LIMITER, stream=True)
+    if r.status_code == 404:
+        r.close()
+        r.raise_for_status()
+    r.raw.decode_content = True
+    return r.raw
+
+
+class TickerCikMap(object):
+    """
+    In-memory map between tickers and CIKs, built from the SEC's company_tickers.json file.
+
+    The file lists every ticker with its CIK.  It is downloaded on first use, saved to
+    ``config.DATA_DIR`` and downloaded again once the saved copy is older than ``max_age``
+    seconds, so lookups never go to the network except for those refreshes.  If a download
+    fails, the map keeps its current data and retries after ``retry_delay`` seconds.
+
+    Args:
+        max_age (float): Seconds before the saved file is refreshed.
+        retry_delay (float): Seconds before a failed download is retried.
+        fname (str): Name of the saved file in ``config.DATA_DIR``.
+    """
+    def __init__(self, max_age=config.COMPANY_TICKERS_MAX_AGE,
+                 retry_delay=config.COMPANY_TICKERS_RETRY_DELAY,
+                 fname='company_tickers.json'):
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.fname = fname
+        self._ticker_to_cik = {}
+        self._cik_to_tickers = {}
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def _fpath(self):
+        return os.path.join(config.DATA_DIR, self.fname)
+
+    def _build(self, company_tickers):
+        ticker_to_cik = {}
+        cik_to_tickers = {}
+        for entry in company_tickers.values():
+            ticker = entry['ticker'].upper()
+            cik = '{:010d}'.format(int(entry['cik_str']))
+            ticker_to_cik[ticker] = cik
+            cik_to_tickers.setdefault(cik, []).append(ticker)
+        self._ticker_to_cik = ticker_to_cik
+        self._cik_to_tickers = cik_to_tickers
+
+    def refresh(self, force=False):
+        """
+        Loads the saved file, downloading it first if it is missing, stale or ``force``.
+        """
+        with self._lock:
+            fpath = self._fpath()
+            now = time.time()
+            is_stale = (not os.path.exists(fpath)
+                        or now - os.path.getmtime(fpath) > self.max_age)
+            if force or is_stale:
+                try:
+                    r = download_url(config.COMPANY_TICKERS_URL,
+                                     rate_limiter=EDGAR_RATE_LIMITER)
+                    company_tickers = json.loads(r.content.decode('utf8'))
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    print('Could not download company tickers: {}'.format(e))
+                    self._next_refresh = now + self.retry_delay
+                    if self._ticker_to_cik or not os.path.exists(fpath):
+                        return
+                    # fall back to the stale saved copy
+                    company_tickers = utils.load_cache_dict(self.fname, config.DATA_DIR)
+                else:
+                    utils.makedirs(config.DATA_DIR)
+                    utils.save_cache_dict(company_tickers, self.fname, config.DATA_DIR)
+                    self._next_refresh = now + self.max_age
+            else:
+                company_tickers = utils.load_cache_dict(self.fname, config.DATA_DIR)
+                self._next_refresh = os.path.getmtime(fpath) + self.max_age
+            self._build(company_tickers)
+
+    def _ensure_fresh(self, allow_download=True):
+        if time.time() >= self._next_refresh:
+            if allow_download:
+                self.refresh()
+            elif not self._ticker_to_cik and os.path.exists(self._fpath()):
+                with self._lock:
+                    self._build(utils.load_cache_dict(self.fname, config.DATA_DIR))
+
+    def get(self, ticker, allow_download=True):
+        """
+        Returns the 10 digit CIK of ``ticker``, or None if it is unknown.
+
+        If ``allow_download`` is False, a stale or missing map is not refreshed.
+        """
+        self._ensure_fresh(allow_download)
+        return self._ticker_to_cik.get(ticker.upper())
+
+    def get_many(self, tickers):
+        """Returns a dict mapping each of ``tickers`` to its CIK, or None if unknown."""
+        self._ensure_fresh()
+        return {ticker: self._ticker_to_cik.get(ticker.upper()) for ticker in tickers}
+
+    def tickers(self, cik):
+        """Returns the tickers of the company with ``cik``."""
+        self._ensure_fresh()
+        return list(self._cik_to_tickers.get('{:010d}'.format(int(cik)), []))
+
+
+# Loaded on first use and shared by every request of the process.
+COMPANY_TICKERS = TickerCikMap()
+
+
+def tickers_to_ciks(tickers, remove_leading_zeros=True):
+    """
+    Returns a dict mapping each of ``tickers`` to its CIK, or None if it is unknown.
+
+    Looks the tickers up in ``COMPANY_TICKERS`` only, so it makes no network requests other
+    than the periodic refresh of the map.
+    """
+    ciks = COMPANY_TICKERS.get_many(tickers)
+    if remove_leading_zeros is True:
+        ciks = {ticker: str(int(cik)) if cik is not None else None
+                for ticker, cik in ciks.items()}
+    return ciks
+
+
+def ticker_to_cik(ticker, use_cache=True, remove_leading_zeros=True, allow_download=True):
     """
     Returns a company's CIK with their ticker symbol as input.
 
-    The CIK (Central Index Key) is used by the SEC for data lookup for company.
+    The CIK (Central Index Key) is used by the SEC for data lookup for company.  With
+    ``use_cache`` the CIK is looked up in memory, then in the bulk ticker map
+    ``COMPANY_TICKERS``, then in ``ticker_cik.json``, and only then queried from EDGAR.
 
     Args:
         ticker (str): company stock ticker symbol
+        allow_download (bool): If False, only local data is used and a KeyError is raised
+            if the ticker is not found there.
 
     Examples:
         >>> ticker_to_cik('KO')
@@ -66,20 +231,32 @@ def ticker_to_cik(ticker, use_cache=True, remove_leading_zeros=True):
     if not isinstance(ticker, basestring):
         raise TypeError('ticker needs to be a string')
     if use_cache:
-        ticker_cik_dict = utils.load_cache_dict('ticker_cik.json')
-        if ticker in ticker_cik_dict:
-            cik = ticker_cik_dict[ticker]
+        cik = TICKER_CIK_CACHE.get(ticker)
+        if cik is None:
+            cik = COMPANY_TICKERS.get(ticker, allow_download=allow_download)
+            if cik is not None:
+                TICKER_CIK_CACHE.set(ticker, cik)
+        if cik is None:
+            ticker_cik_dict = utils.load_cache_dict('ticker_cik.json')
+            cik = ticker_cik_dict.get(ticker)
+            if cik is not None:
+                TICKER_CIK_CACHE.set(ticker, cik)
+        if cik is not None:
             if remove_leading_zeros is True:
                 cik = str(int(cik))
             return cik
+    if not allow_download:
+        raise KeyError('The CIK of {} is not known locally'.format(ticker))
     query = 'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&' \
             'CIK={}&count=100&output=xml'.format(ticker)
-    r = requests.get(query)
+    r = download_url(query, rate_limiter=EDGAR_RATE_LIMITER)
     xml = r.content
     tree = etree.fromstring(xml)
     cik = tree.xpath('//CIK//text()')[0]
     # if use_cache is True, then add the data to the cached dictionary
     if use_cache:
+        TICKER_CIK_CACHE.set(ticker, cik)
+        ticker_cik_dict = utils.load_cache_dict('ticker_cik.json')
         ticker_cik_dict[ticker] = cik
         utils.save_cache_dict(ticker_cik_dict, 'ticker_cik.json')
     if remove_leading_zeros is True:
@@ -87,6 +264,13 @@ def ticker_to_cik(ticker, use_cache=True, remove_leading_zeros=True):
     return cik
 
 
+def _normalize_index_date(date):
+    """Daily indices write dates as YYYYMMDD, full indices as YYYY-MM-DD."""
+    if len(date) == 8 and date.isdigit():
+        return '{}-{}-{}'.format(date[:4], date[4:6], date[6:])
+    return date
+
+
 def write_forms_index(input_src, output_path, form_types=('3','4','5'), output_delimiter='|'):
     """
     Parses input from SEC form index files and writes to csv.
@@ -104,7 +288,10 @@ def write_forms_index(input_src, output_path, form_types=('3','4','5'), output_d
         output_delimiter (char): Single character delimiter (as required by python's csv package).
             Defaults to '|'.
 
+    Returns:
+        str: The latest submission date written (YYYY-MM-DD), or None if no line was written.
     """
+    max_date = None
     with open(output_path, 'a') as writecsv:
         csvwriter = csv.writer(writecsv, delimiter=output_delimiter)
         csvreader = csv.reader(input_src, delimiter=' ', skipinitialspace=True)
@@ -116,7 +303,42 @@ def write_forms_index(input_src, output_path, form_types=('3','4','5'), output_d
             company_name = ' '.join(row[1:-3])
             line = [row[0], company_name]
             line.extend(row[-3:])
+            line[3] = _normalize_index_date(line[3])
             csvwriter.writerow(line)
+            if max_date is None or line[3] > max_date:
+                max_date = line[3]
+    return max_date
+
+
+def _download_forms_index(index_loc, output_path, form_types=('3','4','5'),
+                          output_delimiter='|'):
+    """
+    Downloads the EDGAR form index at ``index_loc`` and appends its rows to ``output_path``.
+
+    The body is streamed through an incremental gzip decoder into ``write_forms_index``, so
+    memory use does not depend on the size of the index.  Rows go to a temporary file first
+    and are appended to ``output_path`` only once the whole body was read, so a download
+    that fails part way leaves ``output_path`` as it was.
+
+    Returns:
+        str: The latest submission date written, see ``write_forms_index``.
+    """
+    utils.makedirs(os.path.dirname(output_path))
+    tmp_path = output_path + '.part'
+    utils.silentremove(tmp_path)
+    try:
+        with closing(stream_sec_file(index_loc)) as raw:
+            fileobj = gzip.GzipFile(fileobj=raw) if index_loc.endswith('.gz') else raw
+            input_src = io.TextIOWrapper(fileobj, encoding='utf8')
+            max_date = write_forms_index(input_src,
+                                         output_path=tmp_path,
+                                         form_types=form_types,
+                                         output_delimiter=output_delimiter)
+        with open(tmp_path, 'r') as rows, open(output_path, 'a') as output:
+            shutil.copyfileobj(rows, output)
+    finally:
+        utils.silentremove(tmp_path)
+    return max_date
 
 
 def get_forms_index(years=range(1993,datetime.datetime.now().year+1),
@@ -130,7 +352,9 @@ def get_forms_index(years=range(1993,datetime.datetime.now().year+1),
 
     In this function, the indices are collected for each year in ``years`` and output to the
     directory ``output_dir``, one csv file for each year. This only needs to be run once when
-    building a local index.
+    building a local index, afterwards use ``sync_forms_index`` to keep it up to date.  Each
+    year's rows are also loaded into the form index database, which ``utils.form_loc_iter``
+    uses for lookups by CIK.
 
     Writes a delimited file to ``output_path``.  Each line is:
         <form type>|<company name>|<CIK>|<form submission date>|<location on ftp.sec.gov>
@@ -147,41 +371,237 @@ def get_forms_index(years=range(1993,datetime.datetime.now().year+1),
             Defaults to '|'.
 
     """
+    sync_marks = _load_sync_marks()
     for year in years:
         output_path = utils.get_form_index_fpath(year)
         if overwrite is True:
             utils.silentremove(output_path)
-        quarter_folders = ['QTR{}'.format(i) for i in range(1,5)]
-        for quarter in quarter_folders:
+        for quarter in range(1,5):
             try:
-                index_loc = 'edgar/full-index/{YYYY}/{quarter}/form.gz'.format(
+                index_loc = 'edgar/full-index/{YYYY}/QTR{quarter}/form.gz'.format(
                     YYYY=year, quarter=quarter)
-                content_gz = download_sec_file(index_loc)
-                content = gzip.decompress(content_gz).decode('utf8')
-                input_src = StringIO(content)
-                output_dir = os.path.dirname(output_path)
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
-                write_forms_index(input_src,
-                                  output_path=output_path,
-                                  form_types=form_types,
-                                  output_delimiter=output_delimiter)
+                max_date = _download_forms_index(index_loc,
+                                                 output_path=output_path,
+                                                 form_types=form_types,
+                                                 output_delimiter=output_delimiter)
             except requests.exceptions.HTTPError:
-                pass
+                continue
+            start, end = _quarter_date_range(year, quarter)
+            sync_marks[_sync_mark_key(year, quarter)] = max_date or _prev_day(start)
+            _save_sync_marks(sync_marks)
+        if os.path.exists(output_path):
+            utils.build_form_index_db(year, delimiter=output_delimiter)
+
+
+FORM_INDEX_SYNC_MARKS_FNAME = 'sync_marks.json'
+
+
+def _load_sync_marks():
+    return utils.load_cache_dict(FORM_INDEX_SYNC_MARKS_FNAME, config.FORM_INDEX_DIR)
+
+
+def _save_sync_marks(sync_marks):
+    utils.makedirs(config.FORM_INDEX_DIR)
+    utils.save_cache_dict(sync_marks, FORM_INDEX_SYNC_MARKS_FNAME, config.FORM_INDEX_DIR)
+
+
+def _sync_mark_key(year, quarter):
+    return '{}/QTR{}'.format(year, quarter)
+
+
+def _quarter_date_range(year, quarter):
+    """Returns the first and last day of ``quarter`` in ``year``."""
+    start = datetime.date(int(year), 3*(quarter-1)+1, 1)
+    if quarter == 4:
+        end = datetime.date(int(year), 12, 31)
+    else:
+        end = datetime.date(int(year), 3*quarter+1, 1) - datetime.timedelta(days=1)
+    return start, end
+
+
+def _prev_day(date):
+    return (date - datetime.timedelta(days=1)).isoformat()
+
+
+def _is_not_found(error):
+    """True if the HTTPError ``error`` is a 404, i.e. EDGAR has no index for the period."""
+    return error.response is not None and error.response.status_code == 404
+
+
+def _form_index_max_dates(year, delimiter='|'):
+    """Returns the latest submission date in the form index file per quarter of ``year``."""
+    max_dates = {}
+    for row in utils.form_loc_iter(year, delimiter=delimiter):
+        quarter = (int(row[3][5:7]) - 1) // 3 + 1
+        if row[3] > max_dates.get(quarter, ''):
+            max_dates[quarter] = row[3]
+    return max_dates
+
+
+def sync_forms_index(years=None, form_types=('3','4','5'), output_delimiter='|', today=None):
+    """
+    Brings the local form index up to date, downloading only what is new since the last sync.
+
+    A high-water mark, the last submission date already in the index, is kept per quarter.
+    Each sync downloads the EDGAR daily index of every business day after the mark and
+    appends its rows, so no row is written twice.  A quarter without a mark is started from
+    the latest date already in the year's file or, if there is none, from the full quarterly
+    index.
+
+    Args:
+        years (Iterable): Years to sync.  Defaults to the current year and any earlier year
+            with a quarter that has not been synced to its end.
+        form_types (Iterable): Form types to ingest, see ``write_forms_index``.
+        output_delimiter (char): Delimiter of the form index files.
+        today (datetime.date): Defaults to the current date.
+
+    Raises:
+        requests.exceptions.HTTPError: for any error but a 404, a day without an index.  The
+            marks are saved up to the day before, so the next sync retries from there.
+    """
+    today = today or datetime.date.today()
+    sync_marks = _load_sync_marks()
+    if years is None:
+        years = {today.year}
+        for key, mark in sync_marks.items():
+            year, quarter = int(key[:4]), int(key[-1])
+            if mark < _quarter_date_range(year, quarter)[1].isoformat():
+                years.add(year)
+        years = sorted(years)
+    for year in years:
+        output_path = utils.get_form_index_fpath(year)
+        file_max_dates = None
+        changed = False
+        for quarter in range(1,5):
+            start, end = _quarter_date_range(year, quarter)
+            if start > today:
+                break
+            key = _sync_mark_key(year, quarter)
+            if key not in sync_marks:
+                if file_max_dates is None:
+                    file_max_dates = (_form_index_max_dates(year, output_delimiter)
+                                      if os.path.exists(output_path) else {})
+                if quarter in file_max_dates:
+                    sync_marks[key] = file_max_dates[quarter]
+                else:
+                    index_loc = 'edgar/full-index/{YYYY}/QTR{quarter}/form.gz'.format(
+                        YYYY=year, quarter=quarter)
+                    try:
+                        max_date = _download_forms_index(index_loc, output_path, form_types,
+                                                         output_delimiter)
+                    except requests.exceptions.HTTPError as e:
+                        if not _is_not_found(e):
+                            raise
+                        max_date = None
+                    sync_marks[key] = max_date or _prev_day(start)
+                    changed = True
+                _save_sync_marks(sync_marks)
+            day = utils.date_str_to_datetime(sync_marks[key]).date()
+            while day < min(end, today):
+                day += datetime.timedelta(days=1)
+                if day.weekday() < 5:
+                    index_loc = 'edgar/daily-index/{YYYY}/QTR{quarter}/form.{date}.idx'.format(
+                        YYYY=year, quarter=quarter, date=day.strftime('%Y%m%d'))
+                    try:
+                        _download_forms_index(index_loc, output_path, form_types,
+                                              output_delimiter)
+                        changed = True
+                    except requests.exceptions.HTTPError as e:
+                        # the latest days may not be published yet, earlier ones are
+                        # holidays; any other error leaves the mark before the day to retry
+                        if not _is_not_found(e):
+                            raise
+                        if (today - day).days <= 1:
+                            break
+                sync_marks[key] = day.isoformat()
+                _save_sync_marks(sync_marks)
+        if changed and os.path.exists(output_path):
+            utils.build_form_index_db(year, delimiter=output_delimiter)
+
+
+_segment_cache = None
+_segment_cache_lock = threading.Lock()
+
+
+def _get_segment_cache():
+    """
+    Returns the segment cache of this process, opening it on first use (and again in
+    processes forked from one that had it open).
+    """
+    global _segment_cache
+    with _segment_cache_lock:
+        if _segment_cache is None or _segment_cache[0] != os.getpid():
+            cache = segmentcache.SegmentCache(config.FORM_SEGMENT_CACHE_DIR,
+                                              segment_size=config.FORM_CACHE_SEGMENT_SIZE)
+            _segment_cache = (os.getpid(), cache)
+        return _segment_cache[1]
+
+
+_form_index_writer = None
+_form_index_writer_lock = threading.Lock()
+
+
+def _get_form_index_writer():
+    """
+    Returns the form search index writer of this process, starting it on first use (and
+    again in processes forked from one that had it, or if ``config.FORM_SEARCH_DB`` changed,
+    closing the writer of the previous database).  The forms it has queued are indexed
+    before the process exits.
+    """
+    global _form_index_writer
+    with _form_index_writer_lock:
+        if (_form_index_writer is None or _form_index_writer[0] != os.getpid() or
+                _form_index_writer[1].fpath != config.FORM_SEARCH_DB):
+            # the writer of a parent process has no thread in this one
+            if _form_index_writer is not None and _form_index_writer[0] == os.getpid():
+                atexit.unregister(_form_index_writer[1].flush)
+                _form_index_writer[1].close()
+            writer = formsearch.IndexWriter(config.FORM_SEARCH_DB)
+            atexit.register(writer.flush)
+            _form_index_writer = (os.getpid(), writer)
+        return _form_index_writer[1]
 
 
 def _get_sec_form_cache(form_loc):
     """Retrieves saved form of saved SEC form"""
+    if config.FORM_CACHE_BACKEND == 'segments':
+        try:
+            content = _get_segment_cache().get(form_loc)
+        except KeyError:
+            raise FileNotFoundError('Form not in cache: {}'.format(form_loc))
+        return content.decode('utf8')
     fpath = os.path.join(config.FORM_CACHE_DIR, form_loc)
     text = utils.read_file(fpath)
     return text
 
 
 def _save_sec_form_cache(form_loc, text):
-    """Saves contents of SEC form"""
-    outpath = os.path.join(config.FORM_CACHE_DIR, form_loc)
-    utils.makedirs(os.path.dirname(outpath))
-    utils.save_file(outpath, text, compress=True)
+    """
+    Saves contents of SEC form, and queues its text to index if ``config.FORM_SEARCH_INDEX``
+    """
+    if config.FORM_CACHE_BACKEND == 'segments':
+        _get_segment_cache().put(form_loc, text)
+    else:
+        outpath = os.path.join(config.FORM_CACHE_DIR, form_loc)
+        utils.makedirs(os.path.dirname(outpath))
+        utils.save_file(outpath, text, compress=True)
+    if config.FORM_SEARCH_INDEX:
+        _get_form_index_writer().add(form_loc, text)
+
+
+def _iter_sec_form_cache():
+    """Yields location of every SEC form saved in the cache"""
+    if config.FORM_CACHE_BACKEND == 'segments':
+        for form_loc in _get_segment_cache().iter_form_locs():
+            yield form_loc
+        return
+    for dirpath, dirnames, filenames in os.walk(config.FORM_CACHE_DIR):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.endswith('.gz'):
+                fname = fname[:-len('.gz')]
+            fpath = os.path.join(dirpath, fname)
+            yield os.path.relpath(fpath, config.FORM_CACHE_DIR).replace(os.sep, '/')
 
 
 def get_sec_form(form_loc, cache_file=False):
@@ -195,10 +615,15 @@ def get_sec_form(form_loc, cache_file=False):
     Returns:
         string, boolean
     """
+    start = time.perf_counter()
     try:
         text = _get_sec_form_cache(form_loc)
+        # misses are not reads, they are timed as downloads
+        metrics.FORM_CACHE_READ_SECONDS.observe(time.perf_counter() - start)
         used_cache = True
+        metrics.FORM_CACHE_REQUESTS.inc(result='hit')
     except FileNotFoundError:
+        metrics.FORM_CACHE_REQUESTS.inc(result='miss')
         content = download_sec_file(form_loc)
         text = content.decode('utf8')
         used_cache = False
@@ -222,26 +647,28 @@ def download_stock_prices_yahoo_page(ticker, date_range=None):
     else:
         date_range_epoch = tuple(map(utils.date_str_to_epoch_time, date_range))
     url = _get_yahoo_finance_url(ticker, date_range_epoch)
-    r = download_url(url)
+    r = download_url(url, rate_limiter=YAHOO_RATE_LIMITER)
     return r.content
 
 
 def parse_stock_prices_yahoo(content):
+    """
+    Returns the price dicts embedded in a Yahoo Finance history page.
+
+    Raises:
+        ValueError: if the page has no prices.
+    """
     text = content.decode('utf8')
-    start_str = '"prices":['
-    len_start_str = len(start_str) - 1
-    prices_text = text[text.find(start_str)+len_start_str:]
-    end_str = ']'
-    prices_text = prices_text[:prices_text.find(end_str)+1]
-    price_dicts = json.loads(prices_text)
+    start_str = '"prices":'
+    start = text.find(start_str + '[')
+    if start == -1:
+        raise ValueError('No prices in the Yahoo Finance page')
+    price_dicts, _ = json.JSONDecoder().raw_decode(text, start + len(start_str))
     return price_dicts
 
 
 def save_stock_prices(ticker, price_dicts):
-    fname = '{}.json'.format(ticker.upper())
-    outpath = os.path.join(config.STOCK_PRICE_DIR, fname)
-    with open(outpath, 'w') as o:
-        json.dump(price_dicts, o)
+    return pricestore.write_prices(ticker, price_dicts)
 
 
 def download_and_save_stock_prices(ticker, date_range=None):
@@ -251,34 +678,251 @@ def download_and_save_stock_prices(ticker, date_range=None):
     return price_dict
 
 
+class PriceProvider(object):
+    """
+    Source of daily stock prices.
+
+    Prices are returned as dicts mapping each of ``pricestore.PRICE_COLUMN_NAMES`` to an
+    array, sorted by date.  Providers with ``bulk`` set load every ticker at once, so
+    ``get_prices_many`` should be used rather than ``get_prices`` per ticker.
+    """
+    bulk = False
+
+    def get_prices(self, ticker, date_start=None):
+        """Returns the prices of ``ticker`` from ``date_start``, or its full history."""
+        raise NotImplementedError
+
+    def get_prices_many(self, tickers, date_start=None):
+        """
+        Returns a dict mapping each of ``tickers`` the provider has prices for to its
+        prices.  ``tickers`` may be None for every ticker of a bulk provider.
+        """
+        return {ticker: self.get_prices(ticker, date_start) for ticker in tickers}
+
+
+class YahooPriceProvider(PriceProvider):
+    """Scrapes the price history page of each ticker from Yahoo Finance."""
+    def get_prices(self, ticker, date_start=None):
+        if date_start is None:
+            content = download_stock_prices_yahoo_page(ticker)
+        else:
+            date_range = (str(date_start), datetime.date.today().isoformat())
+            content = download_stock_prices_yahoo_page(ticker, date_range)
+        return pricestore.price_dicts_to_columns(parse_stock_prices_yahoo(content))
+
+
+class FilePriceProvider(PriceProvider):
+    """
+    Loads end of day price dumps covering many tickers, CSV or Parquet files with one row
+    per ticker and day.
+
+    Every file matching ``pattern`` is read in one pass into typed arrays, which are then
+    sorted by ticker and date and split into per-ticker views.  Parquet files require the
+    ``pyarrow`` package.  The files are read again when they change.
+
+    Args:
+        pattern (str): glob pattern of the dump files.
+        column_map (dict): maps ticker, date, open, high, low, close and volume to the
+            column names used in the files.
+    """
+    bulk = True
+
+    def __init__(self, pattern, column_map=None):
+        self.pattern = pattern
+        self.column_map = column_map or config.PRICE_FILE_COLUMNS
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._prices = {}
+
+    def _fpaths(self):
+        return sorted(glob.glob(self.pattern))
+
+    def _read_csv(self, fpath):
+        with open(fpath, 'r') as f:
+            header = next(csv.reader(f))
+            names = ('ticker',) + pricestore.PRICE_COLUMN_NAMES
+            usecols = [header.index(self.column_map[name]) for name in names]
+            values = np.loadtxt(f, delimiter=',', quotechar='"', usecols=usecols, dtype=str,
+                                ndmin=2)
+        return dict(zip(names, values.T))
+
+    def _read_parquet(self, fpath):
+        if pyarrow_parquet is None:
+            raise ImportError('Reading Parquet price files requires the pyarrow package')
+        names = ('ticker',) + pricestore.PRICE_COLUMN_NAMES
+        table = pyarrow_parquet.read_table(fpath,
+                                           columns=[self.column_map[n] for n in names])
+        return {name: table.column(self.column_map[name]).to_numpy(zero_copy_only=False)
+                for name in names}
+
+    def _typed(self, raw):
+        columns = {'ticker': np.char.upper(raw['ticker'].astype(str))}
+        for name, dtype in pricestore.PRICE_COLUMNS:
+            values = raw[name]
+            if name == 'date':
+                columns[name] = values.astype(dtype)
+                continue
+            if values.dtype.kind in 'US':
+                values = np.where(values == '', 'nan', values)
+            values = values.astype('f8')
+            if dtype == 'i8':
+                values = np.nan_to_num(values).astype(dtype)
+            columns[name] = values
+        # as with Yahoo Finance, days without a close price are skipped
+        has_close = ~np.isnan(columns['close'])
+        return {name: values[has_close] for name, values in columns.items()}
+
+    def _load(self):
+        fpaths = self._fpaths()
+        stamp = [(fpath, os.path.getmtime(fpath)) for fpath in fpaths]
+        with self._lock:
+            if stamp == self._stamp:
+                return self._prices
+            parts = [self._typed(self._read_parquet(fpath) if fpath.endswith('.parquet')
+                                 else self._read_csv(fpath)) for fpath in fpaths]
+            names = ('ticker',) + pricestore.PRICE_COLUMN_NAMES
+            columns = {name: np.concatenate([part[name] for part in parts])
+                       for name in names} if parts else dict(pricestore.empty_columns(),
+                                                             ticker=np.array([], dtype=str))
+            order = np.lexsort((columns['date'], columns['ticker']))
+            columns = {name: values[order] for name, values in columns.items()}
+            tickers, starts = np.unique(columns['ticker'], return_index=True)
+            ends = list(starts[1:]) + [len(columns['ticker'])]
+            self._prices = {ticker: {name: columns[name][start:end]
+                                     for name in pricestore.PRICE_COLUMN_NAMES}
+                            for ticker, start, end in zip(tickers.tolist(), starts, ends)}
+            self._stamp = stamp
+            return self._prices
+
+    def get_prices(self, ticker, date_start=None):
+        prices = self._load().get(ticker.upper())
+        if prices is None:
+            raise ValueError('No prices for {} in {}'.format(ticker, self.pattern))
+        return pricestore.slice_by_date(prices, date_start)
+
+    def get_prices_many(self, tickers, date_start=None):
+        prices = self._load()
+        if tickers is None:
+            tickers = prices.keys()
+        return {ticker.upper(): pricestore.slice_by_date(prices[ticker.upper()], date_start)
+                for ticker in tickers if ticker.upper() in prices}
+
+
+_PRICE_PROVIDERS = {}
+
+
+def get_price_provider():
+    """Returns the provider selected by ``config.PRICE_PROVIDER``, 'yahoo' or 'files'."""
+    key = (config.PRICE_PROVIDER, config.PRICE_FILES)
+    provider = _PRICE_PROVIDERS.get(key)
+    if provider is None:
+        if config.PRICE_PROVIDER == 'files':
+            provider = FilePriceProvider(config.PRICE_FILES)
+        elif config.PRICE_PROVIDER == 'yahoo':
+            provider = YahooPriceProvider()
+        else:
+            raise ValueError('Unknown price provider: {}'.format(config.PRICE_PROVIDER))
+        _PRICE_PROVIDERS[key] = provider
+    return provider
+
+
+def refresh_stock_prices(ticker, provider=None):
+    """
+    Gets the prices of ``ticker`` since its last stored day, or its full history if none is
+    stored, and merges them into the price store.  The last stored day is fetched again in
+    case it was saved before the close.
+
+    Returns:
+        int: number of days added.
+    """
+    provider = provider or get_price_provider()
+    prices = provider.get_prices(ticker, pricestore.last_date(ticker))
+    return pricestore.merge_columns(ticker, prices)
+
+
+def refresh_stock_prices_many(tickers=None, max_workers=config.PRICE_REFRESH_WORKERS,
+                              provider=None):
+    """
+    Refreshes the prices of ``tickers``, see ``refresh_stock_prices``.
+
+    A bulk provider loads every ticker in one pass.  Others are called concurrently, their
+    downloads share ``YAHOO_RATE_LIMITER`` so the request rate stays the same however many
+    workers are used.
+
+    Args:
+        tickers (Iterable): Tickers to refresh.  If None, every ticker of a bulk provider,
+            or every ticker with stored prices.
+
+    Returns:
+        dict: mapping each ticker to the number of days added, or None if it failed.
+    """
+    provider = provider or get_price_provider()
+    results = {}
+    if provider.bulk:
+        prices = provider.get_prices_many(tickers)
+        for ticker in (prices if tickers is None else tickers):
+            columns = prices.get(ticker.upper())
+            if columns is None:
+                print('No stock prices for {}'.format(ticker))
+                results[ticker] = None
+                continue
+            columns = pricestore.slice_by_date(columns, pricestore.last_date(ticker))
+            results[ticker] = pricestore.merge_columns(ticker, columns)
+        return results
+    if tickers is None:
+        tickers = pricestore.tickers()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(refresh_stock_prices, ticker, provider): ticker
+                   for ticker in tickers}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                results[ticker] = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print('Could not refresh the stock prices of {}: {}'.format(ticker, e))
+                results[ticker] = None
+    return results
+
+
 def _get_stock_price_cache(ticker):
-    fname = '{}.json'.format(ticker.upper())
-    fpath = os.path.join(config.STOCK_PRICE_DIR, fname)
-    with open(fpath, 'r') as f:
-        stock_prices = json.load(f)
-    return stock_prices
+    """
+    Returns the memory-mapped price columns of ``ticker``.
+
+    Prices saved as JSON by earlier versions are copied to the price store on first read.
+
+    Raises:
+        FileNotFoundError: if no prices are stored for ``ticker``.
+    """
+    if not pricestore.has_prices(ticker):
+        fpath = os.path.join(config.STOCK_PRICE_DIR, '{}.json'.format(ticker.upper()))
+        with open(fpath, 'r') as f:
+            pricestore.write_prices(ticker, json.load(f))
+    return pricestore.read_prices(ticker)
 
 
-def _get_raw_stock_prices(ticker):
+def _get_raw_stock_prices(ticker, allow_download=True):
     try:
         stock_prices = _get_stock_price_cache(ticker)
     except FileNotFoundError:
-        stock_prices = download_and_save_stock_prices(ticker)
+        if not allow_download:
+            raise
+        refresh_stock_prices(ticker)
+        stock_prices = _get_stock_price_cache(ticker)
     return stock_prices
 
 
-def _process_stock_prices(raw_stock_prices):
-    new_stock_prices = []
-    for d in raw_stock_prices:
-        date_epoch = d['date']
-        d['date'] = utils.epoch_time_to_date_str(date_epoch)
-        new_stock_prices.append(d)
-    return new_stock_prices
-
-
-def get_stock_price_dicts(ticker):
-    raw_stock_prices = _get_raw_stock_prices(ticker)
-    return _process_stock_prices(raw_stock_prices)
-
+def get_stock_price_columns(ticker, date_start=None, date_end=None, allow_download=True):
+    """
+    Returns the daily prices of ``ticker`` from ``date_start`` to ``date_end``, as a dict
+    mapping each of ``pricestore.PRICE_COLUMN_NAMES`` to a view of its memory-mapped array.
+    """
+    columns = _get_raw_stock_prices(ticker, allow_download)
+    return pricestore.slice_by_date(columns, date_start, date_end)
 
 
+def get_stock_price_dicts(ticker, allow_download=True):
+    columns = _get_raw_stock_prices(ticker, allow_download)
+    values = {name: columns[name].tolist() for name in pricestore.PRICE_COLUMN_NAMES}
+    values['date'] = np.datetime_as_string(columns['date'], unit='D').tolist()
+    return [dict(zip(pricestore.PRICE_COLUMN_NAMES, row))
+            for row in zip(*(values[name] for name in pricestore.PRICE_COLUMN_NAMES))]
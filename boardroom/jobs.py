@@ -0,0 +1,236 @@
+"""
+Queue of ingest jobs run by a local worker process, outside of the web requests.
+
+A job downloads and ingests the trades and stock prices of a ticker for a range of years.
+Jobs are kept in an SQLite database shared by the web app, which queues them, and any
+number of workers, which claim and run them one at a time::
+
+    # run a worker
+    python -m boardroom.jobs worker
+
+    # ingest a ticker ahead of time
+    python -m boardroom.jobs enqueue KO 2015 2017
+
+    # nightly: fetch the days missing from the stored prices of every ticker
+    python -m boardroom.jobs refresh-prices --all
+"""
+import sys
+import time
+import sqlite3
+import argparse
+import traceback
+from contextlib import closing
+
+from boardroom import config, utils, ingestdata, get_trades, tradedb, metrics
+
+JOB_QUEUE_SCHEMA = """
+create table if not exists job (
+    id          integer primary key autoincrement,
+    ticker      text not null,
+    year_start  integer not null,
+    year_end    integer not null,
+    status      text not null,
+    error       text,
+    created     real not null,
+    started     real,
+    finished    real
+);
+create index if not exists job_status_idx on job (status, id);
+"""
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def open_job_queue_db():
+    """
+    Connects to the existing job queue without checking its schema, e.g. once per web
+    request.  See ``connect_job_queue_db``.
+    """
+    db = sqlite3.connect(config.JOB_QUEUE_DB, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+def connect_job_queue_db():
+    """
+    Connects to the job queue, creating it if needed.
+
+    The connection is in autocommit mode, writes that must be atomic open their own
+    ``begin immediate`` transaction.
+    """
+    utils.makedirs(config.DATA_DIR)
+    db = open_job_queue_db()
+    db.execute('pragma journal_mode=wal')
+    db.executescript(JOB_QUEUE_SCHEMA)
+    return db
+
+
+def _row_to_dict(row):
+    return dict(zip(row.keys(), row)) if row is not None else None
+
+
+def enqueue(ticker, year_start, year_end, db=None):
+    """
+    Queues a job ingesting ``ticker`` for the year range.
+
+    If the same job is already queued or running, it is not queued again.
+
+    Returns:
+        int: id of the job.
+    """
+    db = db or connect_job_queue_db()
+    ticker = ticker.upper()
+    db.execute('begin immediate')
+    try:
+        row = db.execute('select id from job where ticker = ? and year_start = ? and '
+                         'year_end = ? and status in (?, ?)',
+                         (ticker, int(year_start), int(year_end), QUEUED, RUNNING)).fetchone()
+        if row is not None:
+            job_id = row['id']
+        else:
+            cursor = db.execute('insert into job (ticker, year_start, year_end, status, '
+                                'created) values (?, ?, ?, ?, ?)',
+                                (ticker, int(year_start), int(year_end), QUEUED, time.time()))
+            job_id = cursor.lastrowid
+        db.execute('commit')
+    except:
+        db.execute('rollback')
+        raise
+    return job_id
+
+
+def get_job(job_id, db=None):
+    """Returns the job with ``job_id`` as a dict, or None if there is no such job."""
+    db = db or connect_job_queue_db()
+    row = db.execute('select * from job where id = ?', (job_id,)).fetchone()
+    return _row_to_dict(row)
+
+
+def claim_next(db=None, stale_after=None):
+    """
+    Marks the oldest queued job as running and returns it, or None if the queue is empty.
+
+    Jobs that have been running for more than ``stale_after`` seconds are assumed to have
+    lost their worker and are queued again first.
+    """
+    db = db or connect_job_queue_db()
+    if stale_after is None:
+        stale_after = config.JOB_STALE_AFTER
+    now = time.time()
+    db.execute('begin immediate')
+    try:
+        db.execute('update job set status = ?, started = null where status = ? and '
+                   'started < ?', (QUEUED, RUNNING, now - stale_after))
+        row = db.execute('select * from job where status = ? order by id limit 1',
+                         (QUEUED,)).fetchone()
+        if row is not None:
+            db.execute('update job set status = ?, started = ? where id = ?',
+                       (RUNNING, now, row['id']))
+        db.execute('commit')
+    except:
+        db.execute('rollback')
+        raise
+    job = _row_to_dict(row)
+    if job is not None:
+        job.update(status=RUNNING, started=now)
+    return job
+
+
+def finish(job_id, error=None, db=None):
+    """Marks the job as done, or as failed with ``error`` if it is given."""
+    db = db or connect_job_queue_db()
+    db.execute('update job set status = ?, error = ?, finished = ? where id = ?',
+               (FAILED if error else DONE, error, time.time(), job_id))
+
+
+def run_job(job, trade_db=None):
+    """
+    Downloads and ingests the trades and the new stock prices of ``job``, with the trade
+    database connection ``trade_db`` if it is given.
+    """
+    cik = ingestdata.ticker_to_cik(job['ticker'])
+    with get_trades.trade_db(trade_db) as trade_db:
+        for year in get_trades.years_to_ingest(cik, job['year_start'], job['year_end'],
+                                               db=trade_db):
+            get_trades.ingest_trades(cik, year, db=trade_db)
+    ingestdata.refresh_stock_prices(job['ticker'])
+
+
+def run_worker(poll_interval=None, once=False, log=sys.stderr, metrics_path=None):
+    """
+    Runs queued jobs one at a time, waiting ``poll_interval`` seconds when the queue is empty.
+
+    Args:
+        once (bool): If True, returns once the queue is empty instead of waiting.
+        metrics_path (str): If given, the metrics of the worker are written to this JSON
+            file after every job, see ``metrics.dump_json``.
+
+    Returns:
+        int: number of jobs run.
+    """
+    if poll_interval is None:
+        poll_interval = config.JOB_POLL_INTERVAL
+    with closing(connect_job_queue_db()) as db, \
+            closing(tradedb.connect_trade_db()) as trade_db:
+        num_jobs = 0
+        while True:
+            job = claim_next(db)
+            if job is None:
+                if once:
+                    return num_jobs
+                time.sleep(poll_interval)
+                continue
+            log.write('Running job {id}: {ticker} {year_start}-{year_end}\n'.format(**job))
+            try:
+                run_job(job, trade_db)
+            except Exception:
+                error = traceback.format_exc()
+                log.write(error)
+                finish(job['id'], error=error, db=db)
+            else:
+                finish(job['id'], db=db)
+            num_jobs += 1
+            if metrics_path:
+                metrics.dump_json(metrics_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run or queue ingest jobs.')
+    subparsers = parser.add_subparsers(dest='command')
+    worker = subparsers.add_parser('worker', help='run queued jobs')
+    worker.add_argument('--once', action='store_true',
+                        help='exit once the queue is empty')
+    worker.add_argument('--poll-interval', type=float, default=config.JOB_POLL_INTERVAL)
+    worker.add_argument('--metrics', help='write the metrics of the worker to this JSON file '
+                                          'after every job')
+    enqueue_parser = subparsers.add_parser('enqueue', help='queue a job')
+    enqueue_parser.add_argument('ticker')
+    enqueue_parser.add_argument('year_start', type=int)
+    enqueue_parser.add_argument('year_end', type=int)
+    refresh = subparsers.add_parser('refresh-prices',
+                                    help='download the missing days of stored stock prices')
+    refresh.add_argument('tickers', nargs='*')
+    refresh.add_argument('--all', action='store_true',
+                         help='every ticker with stored prices, or every ticker in the price '
+                              'files with the files provider')
+    refresh.add_argument('--workers', type=int, default=config.PRICE_REFRESH_WORKERS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        run_worker(args.poll_interval, once=args.once, metrics_path=args.metrics)
+    elif args.command == 'enqueue':
+        print(enqueue(args.ticker, args.year_start, args.year_end))
+    elif args.command == 'refresh-prices':
+        tickers = None if args.all else args.tickers
+        results = ingestdata.refresh_stock_prices_many(tickers, args.workers)
+        num_failed = sum(1 for n in results.values() if n is None)
+        print('Added {} days of prices for {} tickers, {} failed'.format(
+            sum(n for n in results.values() if n), len(results), num_failed))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,28 @@
 import shutil
 import os
+import time
+import gzip
+import hashlib
 import datetime
 import json
 
 import sqlite3
 from flask import Flask, request, session, g, redirect, url_for, \
-                  abort, render_template, flash
+                  abort, render_template, flash, jsonify, make_response
 from contextlib import closing
 
 import plotly
 
-from boardroom import get_trades, get_stock_prices, plot_data
+import numpy as np
+
+from boardroom import config, ingestdata, get_trades, get_stock_prices, plot_data, jobs, \
+                      tradedb, pricestore, metrics
 
 
 app = Flask(__name__)
 
 # configuration
-DATABASE = os.path.join(app.root_path, 'db.db')
+DATABASE = config.TRADE_DB
 SECRET_KEY = os.environ.get('SECRET_KEY', 'development')
 DEBUG = True if SECRET_KEY == 'development' else False
 
@@ -24,13 +30,33 @@ DEBUG = True if SECRET_KEY == 'development' else False
 app.config.from_object(__name__)
 
 
+# job queues created by this process, see tradedb.get_trade_db for the trade database
+_initialized_dbs = set()
+
+
 def connect_db():
-    """Connects to the specific database."""
-    rv = sqlite3.connect(app.config['DATABASE'])
+    """
+    Connects to the trade database.  Its tables are created or migrated on the first
+    connection of the process only, see ``tradedb.get_trade_db``, or by ``flask initdb``.
+    """
+    rv = tradedb.get_trade_db(app.config['DATABASE'])
     rv.row_factory = sqlite3.Row
     return rv
 
 
+def get_job_db():
+    """
+    Returns the job queue connection of the request, opened on first use.  The queue is
+    created on the first connection of the process only.
+    """
+    if getattr(g, 'job_db', None) is None:
+        if config.JOB_QUEUE_DB not in _initialized_dbs:
+            jobs.connect_job_queue_db().close()
+            _initialized_dbs.add(config.JOB_QUEUE_DB)
+        g.job_db = jobs.open_job_queue_db()
+    return g.job_db
+
+
 def get_db():
     """Opens a new database connection if there is none yet for the
     current application context.
@@ -48,10 +74,7 @@ def close_db(error):
 
 
 def init_db():
-    db = get_db()
-    with app.open_resource('schema.sql', mode='r') as f:
-        db.cursor().executescript(f.read())
-    db.commit()
+    tradedb.connect_trade_db(app.config['DATABASE']).close()
 
 
 @app.cli.command('initdb')
@@ -63,31 +86,223 @@ def initdb_command():
 
 @app.before_request
 def before_request():
-    g.db = connect_db()
+    g.request_start = time.perf_counter()
+    # the column store backend reads no database
+    g.db = connect_db() if config.TRADE_BACKEND == 'sqlite' else None
+
+
+@app.after_request
+def after_request(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint,
+                                        status=response.status_code)
+    return response
 
 
 @app.teardown_request
 def teardown_request(exception):
-    db = getattr(g, 'db', None)
-    if db is not None:
-        db.close()
+    for name in ('db', 'job_db'):
+        db = getattr(g, name, None)
+        if db is not None:
+            db.close()
 
 
 @app.route('/', methods=['GET', 'POST'])
 def show_homepage():
+    """
+    Shows the trades and stock prices already stored for the ticker.
+
+    Nothing is downloaded while the request waits, missing or out of date data is queued
+    for the ingest worker, see ``boardroom.jobs``.
+    """
     if request.method == 'POST':
         ticker = request.form['ticker']
         year_start = request.form['year_start']
         year_end = request.form['year_end']
-        trades = get_trades.get_trades_from_ticker(ticker, year_start, year_end)
-        dates, prices = get_stock_prices.get_stock_price_timeseries(ticker)
+        try:
+            trades, missing_years = get_trades.stored_trades_from_ticker(
+                ticker, year_start, year_end, db=g.db, first_owner_only=True)
+            needs_ingest = bool(missing_years)
+        except KeyError:
+            trades, needs_ingest = [], True
+        try:
+            dates, prices = get_stock_prices.get_stock_price_timeseries(ticker,
+                                                                        allow_download=False)
+        except FileNotFoundError:
+            dates, prices = (), ()
+            needs_ingest = True
+        if needs_ingest:
+            job_id = jobs.enqueue(ticker, year_start, year_end, db=get_job_db())
+            flash('Data for {} is being retrieved, check back shortly '
+                  '(job {}: {})'.format(ticker.upper(), job_id,
+                                        url_for('show_job', job_id=job_id)))
         graph_ids = ['graph-1']
-        graph = [plot_data.build_graph(ticker, dates, prices, trades)]
-        graphJSON = json.dumps(graph, cls=plotly.utils.PlotlyJSONEncoder)
+        graph = [plot_data.build_graph(ticker, dates, prices, trades,
+                                       date_start='{}-01-01'.format(year_start),
+                                       date_end='{}-12-31'.format(year_end))]
+        with metrics.timer(metrics.RENDER_SECONDS, view='home'):
+            graphJSON = json.dumps(graph, cls=plotly.utils.PlotlyJSONEncoder)
         return render_template('home.html', form=request.form, trades=trades,
                                graphJSON=graphJSON, graph_ids=graph_ids)
     return render_template('home.html', form=None)
 
 
+@app.route('/jobs/<int:job_id>')
+def show_job(job_id):
+    """Returns the status of an ingest job as JSON."""
+    job = jobs.get_job(job_id, db=get_job_db())
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
+@app.route('/metrics')
+def show_metrics():
+    """Returns the metrics of this process in the Prometheus text format."""
+    response = make_response(metrics.REGISTRY.prometheus_text())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
+def _etag(*parts):
+    """Returns the ETag of a response built from ``parts``, the request and data versions."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str)
+                        .encode('utf8')).hexdigest()
+
+
+def _not_modified(etag):
+    """Returns a 304 response if the client already has the response with ``etag``."""
+    # weak, since the same data is sent gzipped or not
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def _json_response(payload, etag):
+    """
+    Returns ``payload`` as JSON with ``etag``, gzipped if the client accepts it and the body
+    is large enough for it to pay off.
+    """
+    with metrics.timer(metrics.RENDER_SECONDS, view=request.endpoint):
+        body = json.dumps(payload, cls=plotly.utils.PlotlyJSONEncoder).encode('utf8')
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if (len(body) >= config.API_GZIP_MIN_SIZE and
+            'gzip' in request.headers.get('Accept-Encoding', '')):
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _page_args():
+    """Returns the 1-based page and the page size requested, 400 if they are invalid."""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', config.API_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= per_page <= config.API_MAX_PAGE_SIZE:
+        abort(400)
+    return page, per_page
+
+
+def _year_args():
+    today = datetime.date.today()
+    year_start = request.args.get('year_start', today.year, type=int)
+    year_end = request.args.get('year_end', year_start, type=int)
+    if year_end < year_start:
+        abort(400)
+    return year_start, year_end
+
+
+def _ticker_cik(ticker):
+    try:
+        return ingestdata.ticker_to_cik(ticker, allow_download=False)
+    except KeyError:
+        abort(404)
+
+
+@app.route('/api/trades/<ticker>')
+def api_trades(ticker):
+    """
+    Returns a page of the stored trades of ``ticker`` in the years ``year_start`` to
+    ``year_end``, and the years not ingested yet.  Trades of a joint filing are listed once,
+    for its first owner, and options and other derivatives have ``is_derivative`` set.
+    """
+    year_start, year_end = _year_args()
+    page, per_page = _page_args()
+    cik = _ticker_cik(ticker)
+    etag = _etag('trades', ticker.upper(), year_start, year_end, page, per_page,
+                 config.TRADE_BACKEND,
+                 get_trades.data_version(cik, year_start, year_end, g.db))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    trades, missing_years = get_trades.stored_trades_from_ticker(ticker, year_start,
+                                                                 year_end, db=g.db,
+                                                                 first_owner_only=True)
+    start = (page - 1) * per_page
+    return _json_response({'ticker': ticker.upper(), 'year_start': year_start,
+                           'year_end': year_end, 'missing_years': missing_years,
+                           'page': page, 'per_page': per_page, 'total': len(trades),
+                           'trades': trades[start:start+per_page].to_dicts()}, etag)
+
+
+@app.route('/api/prices/<ticker>')
+def api_prices(ticker):
+    """
+    Returns a page of the stored daily prices of ``ticker`` from ``start`` to ``end``,
+    dates as YYYY-MM-DD.
+    """
+    date_start = request.args.get('start')
+    date_end = request.args.get('end')
+    page, per_page = _page_args()
+    version = pricestore.data_version(ticker)
+    if version is None:
+        abort(404)
+    etag = _etag('prices', ticker.upper(), date_start, date_end, page, per_page, version)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    try:
+        columns = ingestdata.get_stock_price_columns(ticker, date_start, date_end,
+                                                     allow_download=False)
+    except ValueError:
+        abort(400)
+    total = len(columns['date'])
+    start = (page - 1) * per_page
+    columns = {name: values[start:start+per_page] for name, values in columns.items()}
+    columns['date'] = np.datetime_as_string(columns['date'], unit='D')
+    return _json_response({'ticker': ticker.upper(), 'start': date_start, 'end': date_end,
+                           'page': page, 'per_page': per_page, 'total': total,
+                           'prices': columns}, etag)
+
+
+@app.route('/api/graph/<ticker>')
+def api_graph(ticker):
+    """Returns the plotly graph of ``ticker`` for the years ``year_start`` to ``year_end``."""
+    year_start, year_end = _year_args()
+    cik = _ticker_cik(ticker)
+    etag = _etag('graph', ticker.upper(), year_start, year_end, config.TRADE_BACKEND,
+                 get_trades.data_version(cik, year_start, year_end, g.db),
+                 pricestore.data_version(ticker))
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    trades, _ = get_trades.stored_trades_from_ticker(ticker, year_start, year_end, db=g.db,
+                                                     first_owner_only=True)
+    try:
+        dates, prices = get_stock_prices.get_stock_price_timeseries(ticker,
+                                                                    allow_download=False)
+    except FileNotFoundError:
+        dates, prices = (), ()
+    graph = plot_data.build_graph(ticker, dates, prices, trades,
+                                  date_start='{}-01-01'.format(year_start),
+                                  date_end='{}-12-31'.format(year_end))
+    return _json_response(graph, etag)
+
+
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,259 @@
+"""
+Counters and latency histograms of the stages of ingest, parsing and rendering.
+
+Metrics are kept in memory by each process and cost a lock and a few additions per event,
+so they are left on in production; set ``BOARDROOM_METRICS=0`` to turn them off.  The web
+app serves them in the Prometheus text format at ``/metrics``, and batch runs write them as
+JSON with ``dump_json``::
+
+    with metrics.timer(metrics.FORM_PARSE_SECONDS):
+        form_dict = parse_form(content)
+    metrics.DOWNLOAD_BYTES.inc(len(content))
+
+Histograms use fixed buckets, ``LATENCY_BUCKETS`` by default, in seconds.  Latencies are
+measured with ``time.perf_counter``, which never goes back like the wall clock can.
+"""
+import json
+import time
+import bisect
+import threading
+
+from boardroom import config
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                          .replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Counter(object):
+    """A count of events or bytes, per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value}
+                    for key, value in sorted(self._values.items())]
+
+    def merge(self, samples):
+        for sample in samples:
+            self.inc(sample['value'], **sample['labels'])
+
+    def prometheus_lines(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(key), value)
+                for key, value in items]
+
+
+class Histogram(object):
+    """
+    Distribution of observed values, e.g. latencies, as counts per bucket of ``buckets``
+    upper bounds, plus their number and sum, per combination of label values.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # counts per bucket, the last for values above every bound, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(_label_key(labels))
+            return sum(state[0]) if state is not None else 0
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'buckets': list(counts), 'sum': total,
+                     'count': sum(counts)}
+                    for key, (counts, total) in sorted(self._values.items())]
+
+    def merge(self, samples):
+        for sample in samples:
+            key = _label_key(sample['labels'])
+            with self._lock:
+                state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                state[0] = [a + b for a, b in zip(state[0], sample['buckets'])]
+                state[1] += sample['sum']
+
+    def prometheus_lines(self):
+        lines = []
+        for sample in self.snapshot():
+            key = _label_key(sample['labels'])
+            cumulative = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, sample['buckets']):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(key, [('le', bound)]), cumulative))
+            lines.append('{}_sum{} {!r}'.format(self.name, _format_labels(key), sample['sum']))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(key),
+                                                sample['count']))
+        return lines
+
+
+class Registry(object):
+    """The metrics of a process, by name."""
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.perf_counter()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """Returns every metric as a JSON serializable dict, see ``merge``."""
+        return {name: {'type': metric.kind, 'samples': metric.snapshot()}
+                for name, metric in sorted(self.metrics.items())}
+
+    def merge(self, snapshot):
+        """Adds the ``snapshot`` of another process, e.g. a worker of a process pool."""
+        for name, data in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(data['samples'])
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+        self.started = time.perf_counter()
+
+    def prometheus_text(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append('# HELP {} {}'.format(name, metric.help))
+            lines.append('# TYPE {} {}'.format(name, metric.kind))
+            lines.extend(metric.prometheus_lines())
+        lines.append('# HELP boardroom_uptime_seconds Seconds since the metrics were started')
+        lines.append('# TYPE boardroom_uptime_seconds gauge')
+        lines.append('boardroom_uptime_seconds {!r}'.format(time.perf_counter() -
+                                                            self.started))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help):
+    return REGISTRY.register(Counter(name, help))
+
+
+def histogram(name, help, buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, buckets))
+
+
+def timer(histogram, **labels):
+    """
+    Returns a context manager observing the seconds spent in its block in ``histogram``,
+    with ``labels``.  A 'result' label, e.g. ``result='ok'``, is observed as 'error' if
+    the block raises.
+    """
+    return Timer(histogram, labels)
+
+
+class Timer(object):
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        labels = self.labels
+        if exc_type is not None and 'result' in labels:
+            labels = dict(labels, result='error')
+        self.histogram.observe(time.perf_counter() - self.start, **labels)
+        return False
+
+
+def dump_json(fpath, registry=REGISTRY):
+    """
+    Writes the metrics of ``registry`` to ``fpath`` as JSON, with the seconds since they
+    were started and, if any forms were parsed, the forms parsed per second.
+    """
+    elapsed = time.perf_counter() - registry.started
+    form_parse_seconds = registry.metrics.get(FORM_PARSE_SECONDS.name)
+    num_forms = form_parse_seconds.count(result='ok') if form_parse_seconds else 0
+    data = {'seconds': elapsed,
+            'forms_per_second': num_forms / elapsed if elapsed > 0 else 0.0,
+            'metrics': registry.snapshot()}
+    with open(fpath, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+# Metrics of the stages, by module
+DOWNLOAD_SECONDS = histogram('boardroom_download_seconds',
+                             'Seconds per EDGAR download, waiting for the rate limiter '
+                             'included')
+DOWNLOAD_BYTES = counter('boardroom_download_bytes_total', 'Bytes downloaded from EDGAR')
+FORM_CACHE_REQUESTS = counter('boardroom_form_cache_requests_total',
+                              'Form cache lookups by result, hit or miss')
+FORM_CACHE_READ_SECONDS = histogram('boardroom_form_cache_read_seconds',
+                                    'Seconds per form read and decompressed from the cache')
+FORM_DICT_CACHE_REQUESTS = counter('boardroom_form_dict_cache_requests_total',
+                                   'In-memory parsed form cache lookups by result, hit or miss')
+FORM_PARSE_SECONDS = histogram('boardroom_form_parse_seconds',
+                               'Seconds per form parse, XML extraction and lxml parse, by '
+                               'result, ok or error')
+RENDER_SECONDS = histogram('boardroom_render_seconds',
+                           'Seconds per graph or JSON response encoded with '
+                           'PlotlyJSONEncoder, by view')
+REQUEST_SECONDS = histogram('boardroom_request_seconds',
+                            'Seconds per web request, by endpoint and status')
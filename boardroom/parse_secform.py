@@ -1,19 +1,23 @@
 import re
-from six import iteritems
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO, BytesIO
+
+from six import iteritems, string_types
 from lxml import etree
 
-from boardroom import ingestdata
+from boardroom import config, ingestdata, utils, metrics
+
+# Parsed forms shared by every request of the process, keyed by form location.
+FORM_DICT_CACHE = utils.LRUCache(config.FORM_DICT_CACHE_SIZE, config.FORM_DICT_CACHE_TTL)
 
 
 def get_xml(form):
     '''
     Parses out XML section of file within tag <XML>...</XML>
     '''
-    return re.search('<XML>((.|\n)*?)<\/XML>', form).groups()[0].strip()
+    start = form.find('<XML>')
+    end = form.find('</XML>', start)
+    if start == -1 or end == -1:
+        raise ValueError('There is no <XML> section in the form')
+    return form[start+len('<XML>'):end].strip()
 
 def _get_single_xml_element(element, xpath_str):
     '''
@@ -62,6 +66,75 @@ def _xpath_to_value_mapping(element, mapping):
     return parsed_dict
 
 
+# Fields of each record in the form xml: data key -> (xpath relative to the record
+# element, default value).  A default of None means the field is required.
+HOLDING_MAPPING = {
+    'sec_type':             ('./securityTitle/value', None),
+    'shares_owned_after':   ('.//sharesOwnedFollowingTransaction/value', None),
+    'direct_or_indirect':   ('.//directOrIndirectOwnership/value', None),
+    }
+
+TRANSACTION_MAPPING = {
+    'sec_type':                 ('./securityTitle/value', None),
+    'date':                     ('./transactionDate/value', None),
+    'transaction_code':         ('.//transactionCode', None),
+    'num_shares':               ('.//transactionShares/value', None),
+    'price_per_share':          ('.//transactionPricePerShare/value', '0'),
+    'acquired_disposed_code':   ('.//transactionAcquiredDisposedCode/value', None),
+    'shares_owned_after':       ('.//sharesOwnedFollowingTransaction/value', None),
+    'direct_or_indirect':       ('.//directOrIndirectOwnership/value', None),
+    }
+
+DERIVATIVE_HOLDING_MAPPING = {
+    'sec_type':             ('./securityTitle/value', None),
+    'conversion_price':     ('./conversionOrExercisePrice/value', ''),
+    'exercise_date':        ('./exerciseDate/value', ''),
+    'expiration_date':      ('./expirationDate/value', ''),
+    'underlying_sec_type':  ('.//underlyingSecurityTitle/value', None),
+    'underlying_shares':    ('.//underlyingSecurityShares/value', ''),
+    'shares_owned_after':   ('.//sharesOwnedFollowingTransaction/value', ''),
+    'direct_or_indirect':   ('.//directOrIndirectOwnership/value', None),
+    }
+
+# Amounts of derivative securities may be given as a value instead of a number of shares,
+# and dates only in a footnote, so those fields are optional.
+DERIVATIVE_TRANSACTION_MAPPING = {
+    'sec_type':                 ('./securityTitle/value', None),
+    'conversion_price':         ('./conversionOrExercisePrice/value', ''),
+    'date':                     ('./transactionDate/value', None),
+    'transaction_code':         ('.//transactionCode', None),
+    'num_shares':               ('.//transactionShares/value', ''),
+    'price_per_share':          ('.//transactionPricePerShare/value', '0'),
+    'acquired_disposed_code':   ('.//transactionAcquiredDisposedCode/value', None),
+    'exercise_date':            ('./exerciseDate/value', ''),
+    'expiration_date':          ('./expirationDate/value', ''),
+    'underlying_sec_type':      ('.//underlyingSecurityTitle/value', None),
+    'underlying_shares':        ('.//underlyingSecurityShares/value', ''),
+    'shares_owned_after':       ('.//sharesOwnedFollowingTransaction/value', ''),
+    'direct_or_indirect':       ('.//directOrIndirectOwnership/value', None),
+    }
+
+OWNER_MAPPING = {
+    'cik':                      ('.//rptOwnerCik', None),
+    'name':                     ('.//rptOwnerName', None),
+    'addr1':                    ('.//rptOwnerStreet1', None),
+    'addr2':                    ('.//rptOwnerStreet2', None),
+    'city':                     ('.//rptOwnerCity', None),
+    'state':                    ('.//rptOwnerState', None),
+    'zipcode':                  ('.//rptOwnerZipCode', None),
+    'is_director':              ('.//isDirector', ''),
+    'is_officer':               ('.//isOfficer', ''),
+    'is_ten_percent_owner':     ('.//isTenPercentOwner', ''),
+    'is_other_exec_type':       ('.//isOther', ''),
+    }
+
+ISSUER_MAPPING = {
+    'cik':      ('.//issuerCik', None),
+    'name':     ('.//issuerName', None),
+    'symbol':   ('.//issuerTradingSymbol', None),
+    }
+
+
 def get_trade_holdings_dict(holding_element):
     '''
     Returns dictionary with data values for trade holdings contained in the xml of the SEC form.
@@ -75,12 +148,7 @@ def get_trade_holdings_dict(holding_element):
             shares_owned_after: Number of shares owners owns after transaction
             direct_or_indirect: Whether the owner owned the shares directly or indirectly
     '''
-    mapping = {
-            'sec_type':             ('./securityTitle/value', None),
-            'shares_owned_after':   ('.//sharesOwnedFollowingTransaction/value', None),
-            'direct_or_indirect':   ('.//directOrIndirectOwnership/value', None),
-            }
-    return _xpath_to_value_mapping(holding_element, mapping)
+    return _xpath_to_value_mapping(holding_element, HOLDING_MAPPING)
 
 
 def get_transaction_dict(transaction_element):
@@ -101,17 +169,40 @@ def get_transaction_dict(transaction_element):
             shares_owned_after: Number of shares owners owns after transaction
             direct_or_indirect: Whether the owner owned the shares directly or indirectly
     '''
-    mapping = {
-            'sec_type':                 ('./securityTitle/value', None),
-            'date':                     ('./transactionDate/value', None),
-            'transaction_code':         ('.//transactionCode', None),
-            'num_shares':               ('.//transactionShares/value', None),
-            'price_per_share':          ('.//transactionPricePerShare/value', '0'),
-            'acquired_disposed_code':   ('.//transactionAcquiredDisposedCode/value', None),
-            'shares_owned_after':       ('.//sharesOwnedFollowingTransaction/value', None),
-            'direct_or_indirect':       ('.//directOrIndirectOwnership/value', None),
-            }
-    return _xpath_to_value_mapping(transaction_element, mapping)
+    return _xpath_to_value_mapping(transaction_element, TRANSACTION_MAPPING)
+
+def get_derivative_holding_dict(holding_element):
+    '''
+    Returns dictionary with data values for derivative holdings contained in the xml of the
+    SEC form.
+
+    Args:
+        holding_element: lxml element (e.g. result of xpath search) of derivative holdings data.
+
+    Returns:
+        dict: with the keys of ``get_trade_holdings_dict`` and
+            conversion_price: Conversion or exercise price of the derivative security
+            exercise_date: Date the derivative security can first be exercised
+            expiration_date: Date the derivative security expires
+            underlying_sec_type: Type of the underlying security (e.g. Common Stock)
+            underlying_shares: Number of underlying shares
+    '''
+    return _xpath_to_value_mapping(holding_element, DERIVATIVE_HOLDING_MAPPING)
+
+def get_derivative_transaction_dict(transaction_element):
+    '''
+    Returns dictionary with data values for derivative transactions (e.g. options granted or
+    exercised) contained in the xml of the SEC form.
+
+    Args:
+        transaction_element: lxml element (e.g. result of xpath search) of transaction data.
+
+    Returns:
+        dict: with the keys of ``get_transaction_dict`` and those of
+            ``get_derivative_holding_dict``.  num_shares is the number of derivative
+            securities, e.g. options.
+    '''
+    return _xpath_to_value_mapping(transaction_element, DERIVATIVE_TRANSACTION_MAPPING)
 
 def get_owner_dict(owner_element):
     '''
@@ -134,20 +225,7 @@ def get_owner_dict(owner_element):
             is_ten_percent_owner: 1 if owner owns 10% of company in transaction, else 0
             is_other: 1 if owner is affiliated in another way with company in transaction, else 0
     '''
-    mapping = {
-            'cik':                      ('.//rptOwnerCik', None),
-            'name':                     ('.//rptOwnerName', None),
-            'addr1':                    ('.//rptOwnerStreet1', None),
-            'addr2':                    ('.//rptOwnerStreet2', None),
-            'city':                     ('.//rptOwnerCity', None),
-            'state':                    ('.//rptOwnerState', None),
-            'zipcode':                  ('.//rptOwnerZipCode', None),
-            'is_director':              ('.//isDirector', ''),
-            'is_officer':               ('.//isOfficer', ''),
-            'is_ten_percent_owner':     ('.//isTenPercentOwner', ''),
-            'is_other_exec_type':       ('.//isOther', ''),
-            }
-    return _xpath_to_value_mapping(owner_element, mapping)
+    return _xpath_to_value_mapping(owner_element, OWNER_MAPPING)
 
 def get_issuer_dict(issuer_element):
     '''
@@ -162,12 +240,7 @@ def get_issuer_dict(issuer_element):
             name: Name of issuer
             symbol: Trading symbol of issuer
     '''
-    mapping = {
-            'cik':      ('.//issuerCik', None),
-            'name':     ('.//issuerName', None),
-            'symbol':   ('.//issuerTradingSymbol', None),
-            }
-    return _xpath_to_value_mapping(issuer_element, mapping)
+    return _xpath_to_value_mapping(issuer_element, ISSUER_MAPPING)
 
 def get_issuer_dict_from_xmltree(tree):
     '''
@@ -191,30 +264,267 @@ def get_owner_dict_from_xmltree(tree):
         owner_dict_all[owner_dict['cik']] = owner_dict
     return owner_dict_all
 
+def _get_table_info_dict_from_xmltree(tree, table_tag, holding_tag, transaction_tag,
+                                     get_holding_dict, get_transaction_dict):
+    table = _get_single_xml_element(tree, '//' + table_tag)
+    return {'holdings': [get_holding_dict(holding)
+                         for holding in table.xpath('./' + holding_tag)],
+            'trades': [get_transaction_dict(transaction)
+                       for transaction in table.xpath('./' + transaction_tag)]}
+
 def get_nonderivative_info_dict_from_xmltree(tree):
     '''
     Parses transaction trade information from SEC Filing xml
     '''
-    info_dict = {}
     try:
-        nonderiv_trade_info = _get_single_xml_element(tree, '//nonDerivativeTable')
+        return _get_table_info_dict_from_xmltree(tree, 'nonDerivativeTable',
+                                                 'nonDerivativeHolding',
+                                                 'nonDerivativeTransaction',
+                                                 get_trade_holdings_dict, get_transaction_dict)
     except IndexError:
-        # There is no non-derivative table
-        assert(len(tree.xpath('//derivativeTable')) > 0)
+        # There is no non-derivative table, a Form 3 may report that nothing is owned
+        assert(len(tree.xpath('//derivativeTable')) > 0 or
+               (tree.findtext('noSecuritiesOwned') or '').strip() in ('1', 'true'))
         return {'holdings': [], 'trades': []}
-    nonderiv_trade_holdings = nonderiv_trade_info.xpath('//nonDerivativeHolding')
-    holdings_all = []
-    for holding in nonderiv_trade_holdings:
-        nonderiv_trade_holdings_dict = get_trade_holdings_dict(holding)
-        holdings_all.append(nonderiv_trade_holdings_dict)
-    nonderiv_trade_transactions = nonderiv_trade_info.xpath('.//nonDerivativeTransaction')
-    transactions_all = []
-    for transaction in nonderiv_trade_transactions:
-        transaction_dict = get_transaction_dict(transaction)
-        transactions_all.append(transaction_dict)
-    info_dict['holdings'] = holdings_all
-    info_dict['trades'] = transactions_all
-    return info_dict
+
+def get_derivative_info_dict_from_xmltree(tree):
+    '''
+    Parses derivative transaction and holding information from SEC Filing xml
+    '''
+    try:
+        return _get_table_info_dict_from_xmltree(tree, 'derivativeTable', 'derivativeHolding',
+                                                 'derivativeTransaction',
+                                                 get_derivative_holding_dict,
+                                                 get_derivative_transaction_dict)
+    except IndexError:
+        # There is no derivative table
+        return {'holdings': [], 'trades': []}
+
+def _compile_mapping(mapping):
+    '''
+    Compiles the relative xpaths of ``mapping`` for matching elements while walking the tree.
+
+    Supports the two forms of xpath used in the mappings: ``./a/b`` matches the elements at
+    exactly that path below the record element, ``.//a/b`` the elements anywhere below it
+    whose path ends with ``a/b``.
+
+    Returns:
+        dict: last tag of each xpath -> list of (key, tags of the xpath, anchored)
+    '''
+    compiled = {}
+    for key, (xpath_str, default) in iteritems(mapping):
+        if xpath_str.startswith('.//'):
+            steps, anchored = xpath_str[3:], False
+        elif xpath_str.startswith('./'):
+            steps, anchored = xpath_str[2:], True
+        else:
+            raise ValueError('Unsupported relative xpath: {}'.format(xpath_str))
+        steps = tuple(steps.split('/'))
+        compiled.setdefault(steps[-1], []).append((key, steps, anchored))
+    return compiled
+
+# Record elements of the form xml: tag -> (record type, mapping)
+_RECORD_TYPES = {
+    'issuer':                   ('issuer', ISSUER_MAPPING),
+    'reportingOwner':           ('owner', OWNER_MAPPING),
+    'nonDerivativeTransaction': ('nonderivative_trade', TRANSACTION_MAPPING),
+    'nonDerivativeHolding':     ('nonderivative_holding', HOLDING_MAPPING),
+    'derivativeTransaction':    ('derivative_trade', DERIVATIVE_TRANSACTION_MAPPING),
+    'derivativeHolding':        ('derivative_holding', DERIVATIVE_HOLDING_MAPPING),
+    }
+# Records that are only read inside their table, as the xpath parsers do
+_RECORD_TABLES = {
+    'nonDerivativeTransaction': 'nonDerivativeTable',
+    'nonDerivativeHolding':     'nonDerivativeTable',
+    'derivativeTransaction':    'derivativeTable',
+    'derivativeHolding':        'derivativeTable',
+    }
+
+# Forms 3, 4 and 5 and their amendments are all ownership documents
+DOCUMENT_TYPES = ('3', '3/A', '4', '4/A', '5', '5/A')
+
+# Fields that the ownership schemas before X0301 leave out of some filings:
+# record tag -> {data key: (xpath, default)}
+_PRE_X0301_OVERRIDES = {
+    'issuer': {
+        'symbol':   ('.//issuerTradingSymbol', ''),
+        },
+    'reportingOwner': {
+        'addr1':    ('.//rptOwnerStreet1', ''),
+        'addr2':    ('.//rptOwnerStreet2', ''),
+        'city':     ('.//rptOwnerCity', ''),
+        'state':    ('.//rptOwnerState', ''),
+        'zipcode':  ('.//rptOwnerZipCode', ''),
+        },
+    }
+
+# Extractor of each supported schema version, filled by ``register_schema``
+SCHEMA_EXTRACTORS = {}
+
+
+class SchemaExtractor(object):
+    '''
+    Field mappings of one version of the ownership document schema, compiled for
+    ``parse_form_xml``.
+
+    Args:
+        version (str): schemaVersion of the forms, e.g. X0306.
+        overrides (dict): record tag -> {data key: (xpath, default)}, fields that differ
+            from the mappings of ``_RECORD_TYPES`` in this version.
+        document_types (tuple): documentType values the version is used for.
+    '''
+    def __init__(self, version, overrides=None, document_types=DOCUMENT_TYPES):
+        self.version = version
+        self.document_types = document_types
+        self.record_types = {}
+        for tag, (record_type, mapping) in iteritems(_RECORD_TYPES):
+            mapping = dict(mapping, **(overrides or {}).get(tag, {}))
+            self.record_types[tag] = (record_type, mapping, _compile_mapping(mapping))
+
+
+def register_schema(versions, overrides=None, document_types=DOCUMENT_TYPES):
+    '''
+    Registers an extractor for each of the schema ``versions``, see ``SchemaExtractor``.
+    '''
+    for version in versions:
+        SCHEMA_EXTRACTORS[version] = SchemaExtractor(version, overrides, document_types)
+
+register_schema(('X0101', 'X0201', 'X0202', 'X0203'), _PRE_X0301_OVERRIDES)
+register_schema(('X0301', 'X0302', 'X0303', 'X0304', 'X0305', 'X0306', 'X0407', 'X0508',
+                 'X0609'))
+SUPPORTED_SCHEMA_VERSIONS = tuple(sorted(SCHEMA_EXTRACTORS))
+
+# The header elements come first in the document, a few hundred bytes in
+_HEADER_PEEK_SIZE = 2048
+_SCHEMA_VERSION_RE = re.compile(r'<schemaVersion>\s*([^<\s]+)\s*</schemaVersion>')
+_DOCUMENT_TYPE_RE = re.compile(r'<documentType>\s*([^<\s]+)\s*</documentType>')
+
+def peek_header(xmlcontent):
+    '''
+    Returns the schema version and document type of the xml section of a form, read from
+    its first bytes without parsing it.  Either is None if it is not found there.
+    '''
+    head = xmlcontent[:_HEADER_PEEK_SIZE]
+    version = _SCHEMA_VERSION_RE.search(head)
+    document_type = _DOCUMENT_TYPE_RE.search(head)
+    return (version.group(1) if version else None,
+            document_type.group(1) if document_type else None)
+
+def get_schema_extractor(xmlcontent):
+    '''
+    Returns the ``SchemaExtractor`` for the xml section of a form, from a peek at its header.
+
+    Raises:
+        ValueError: if the schema version or document type is not supported.
+    '''
+    schema_version, document_type = peek_header(xmlcontent)
+    extractor = SCHEMA_EXTRACTORS.get(schema_version)
+    if extractor is None:
+        raise ValueError('Schema version not yet supported:\n'
+                         '{}'.format(schema_version))
+    if document_type not in extractor.document_types:
+        raise ValueError('Document type not supported:\n'
+                         '{}'.format(document_type))
+    return extractor
+
+def _record_values(record_tag, mapping, matches):
+    '''
+    Returns the dict of a record from the element texts matched for each of its keys, with
+    the same rules as ``_xpath_to_value_mapping``.
+    '''
+    values = {}
+    for key, (xpath_str, default) in iteritems(mapping):
+        found = matches.get(key, ())
+        if len(found) > 1:
+            raise ValueError('Only 1 value was expected in\n'
+                             'xpath: {}\n'
+                             'element: {}\n'
+                             'but more were returned'.format(xpath_str, record_tag))
+        if found:
+            values[key] = found[0]
+        elif default is not None:
+            values[key] = default
+        else:
+            raise ValueError('There are no elements of type {} in the element {}'
+                             ' and no default value is set.'.format(xpath_str, record_tag))
+    return values
+
+def parse_form_xml(xmlcontent):
+    '''
+    Returns dictionary with data values contained in the xml section of an SEC form.
+
+    Produces the same dict as the per-record ``get_*_from_xmltree`` functions, but walks the
+    tree once, derivative and non-derivative tables alike, matching each element against the
+    precompiled mapping of the record it is in, instead of running a separate xpath search
+    for every field.  The mappings are those of the schema version of the form, read from
+    its header before the tree is parsed, so forms of unsupported versions cost no parsing.
+
+    Args:
+        xmlcontent (str): xml section of the form, see ``get_xml``.
+
+    Returns:
+        dict: see ``get_form_dict``.
+    '''
+    extractor = get_schema_extractor(xmlcontent)
+    record_types = extractor.record_types
+    tree = etree.fromstring(xmlcontent)
+    records = {record_type: [] for record_type, _, _ in record_types.values()}
+    table_counts = {'nonDerivativeTable': 0, 'derivativeTable': 0}
+    path = []
+    record = None
+    for event, element in etree.iterwalk(tree, events=('start', 'end')):
+        tag = element.tag
+        if not isinstance(tag, string_types):
+            # comments and processing instructions
+            continue
+        if event == 'start':
+            path.append(tag)
+            if record is None and tag in record_types:
+                if tag not in _RECORD_TABLES or path[-2:-1] == [_RECORD_TABLES[tag]]:
+                    record = (tag, len(path), {})
+            continue
+        if record is not None:
+            record_tag, depth, matches = record
+            record_type, mapping, compiled = record_types[record_tag]
+            rel_depth = len(path) - depth
+            if rel_depth == 0:
+                records[record_type].append(_record_values(record_tag, mapping, matches))
+                record = None
+            else:
+                for key, steps, anchored in compiled.get(tag, ()):
+                    n = len(steps)
+                    if ((rel_depth == n if anchored else rel_depth >= n)
+                            and tuple(path[-n:]) == steps):
+                        matches.setdefault(key, []).append(element.text)
+        elif tag in table_counts:
+            table_counts[tag] += 1
+        path.pop()
+    for table_tag, count in iteritems(table_counts):
+        if count > 1:
+            raise ValueError('Only 1 value was expected in\n'
+                             'xpath: //{}\n'
+                             'but more were returned'.format(table_tag))
+    if table_counts['nonDerivativeTable'] == 0:
+        # There is no non-derivative table, a Form 3 may report that nothing is owned
+        assert(table_counts['derivativeTable'] > 0 or
+               (tree.findtext('noSecuritiesOwned') or '').strip() in ('1', 'true'))
+    form_dict = {
+        'issuer':           {d['cik']: d for d in records['issuer']},
+        'owner':            {d['cik']: d for d in records['owner']},
+        'nonderivative':    {'holdings': records['nonderivative_holding'],
+                             'trades': records['nonderivative_trade']},
+        'derivative':       {'holdings': records['derivative_holding'],
+                             'trades': records['derivative_trade']},
+        }
+    return form_dict
+
+def parse_form(content):
+    '''
+    Returns dictionary with data values contained in the full text of an SEC form, see
+    ``get_form_dict``.
+    '''
+    with metrics.timer(metrics.FORM_PARSE_SECONDS, result='ok'):
+        return parse_form_xml(get_xml(content))
 
 def get_form_dict(form_loc, cache_file=False):
     '''
@@ -229,23 +539,20 @@ def get_form_dict(form_loc, cache_file=False):
     Returns:
         dict: with data for issuer, owners, and transactions in SEC form.
             issuer: Issuer of form
-            owners: Owners of securities that were traded
-            trades: Transaction data for trades
+            owner: Owners of securities that were traded, keyed by CIK in the order of
+                the form.  Every trade of the form is reported by all of them.
+            nonderivative: Holdings and trades of stock
+            derivative: Holdings and trades of derivative securities, e.g. options
+
+        The dict is kept in ``FORM_DICT_CACHE`` and shared with later calls, so it must not
+        be modified.  ``used_cache`` is True if it came from the in-memory or file cache.
     '''
+    form_dict = FORM_DICT_CACHE.get(form_loc)
+    if form_dict is not None:
+        metrics.FORM_DICT_CACHE_REQUESTS.inc(result='hit')
+        return form_dict, True
+    metrics.FORM_DICT_CACHE_REQUESTS.inc(result='miss')
     content, used_cache = ingestdata.get_sec_form(form_loc, cache_file=cache_file)
-    xmlcontent = get_xml(content)
-    tree = etree.fromstring(xmlcontent)
-    schema_version = tree.xpath('//schemaVersion')[0].text
-    supported_schema_versions = ['X0306']
-    if schema_version not in supported_schema_versions:
-        raise ValueError('Schema version not yet supported:\n'
-                         '{}'.format(schema_version))
-    # Eventually support for forms 3,4,5
-    form_type = tree.xpath('//documentType')[0].text
-    form_dict = {
-        'issuer':           get_issuer_dict_from_xmltree(tree),
-        'owner':            get_owner_dict_from_xmltree(tree),
-        'nonderivative':    get_nonderivative_info_dict_from_xmltree(tree)
-        #'derivative':       get_derivative_info_dict_from_xmltree(tree)
-        }
+    form_dict = parse_form(content)
+    FORM_DICT_CACHE.set(form_loc, form_dict)
     return form_dict, used_cache
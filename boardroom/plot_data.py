@@ -1,36 +1,108 @@
+import numpy as np
 
+from boardroom import config, analytics, pricestore
 
-def trade_to_line_shape(trade):
-    buycolor = 'rgba(191, 128, 55, 0.3)'
-    sellcolor = 'rgba(55, 191, 128, 0.3)'
-    unkcolor = 'rgba(128, 128, 128, 0.3)'
-    if trade['acquired_disposed_code'] == 'A':
-        color = buycolor
-    elif trade['acquired_disposed_code'] == 'D':
-        color = sellcolor
-    else:
-        color = unkcolor
-    line = {
-        'type': 'line',
-        'xref': 'x',
-        'yref': 'paper',
-        'x0': trade['date'],
-        'y0': 0,
-        'x1': trade['date'],
-        'y1': 1,
-        'line': {
-            'color': color,
-            'width': 1,
-        },
-    }
-    return line
-
-
-def build_graph(ticker, dates, prices, trades):
-    graph = {'data': [{'x': dates, 'y': prices}],
+BUY_COLOR = 'rgba(191, 128, 55, 0.3)'
+SELL_COLOR = 'rgba(55, 191, 128, 0.3)'
+
+
+def downsample_minmax(dates, values, max_points):
+    """
+    Reduces a series to at most ``max_points`` points by keeping the minimum and maximum of
+    each of ``max_points // 2`` equal buckets, in date order, so peaks and troughs survive.
+    """
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype='f8')
+    num_buckets = max(max_points // 2, 1)
+    if len(values) <= max_points:
+        return dates, values
+    size = -(-len(values) // num_buckets)
+    num_buckets = -(-len(values) // size)
+    padding = num_buckets * size - len(values)
+    lows = np.concatenate([np.where(np.isnan(values), np.inf, values),
+                           np.full(padding, np.inf)]).reshape(num_buckets, size)
+    highs = np.concatenate([np.where(np.isnan(values), -np.inf, values),
+                            np.full(padding, -np.inf)]).reshape(num_buckets, size)
+    offsets = np.arange(num_buckets) * size
+    index = np.concatenate([offsets + lows.argmin(axis=1), offsets + highs.argmax(axis=1)])
+    index = np.unique(index[index < len(values)])
+    return dates[index], values[index]
+
+
+def _num_windows(date_start, date_end, window, step):
+    starts = analytics.window_starts([date_start, date_end], window, step).astype('i8')
+    return int(starts[1] - starts[0]) // (7 * step if window == 'W' else step) + 1
+
+
+def _trade_window(date_start, date_end, max_bars):
+    """
+    Returns the (window, step) of the smallest of day, week, month, quarter or year windows,
+    or of as many years as needed, giving at most ``max_bars`` bars from ``date_start`` to
+    ``date_end``, see ``analytics.window_starts``.
+    """
+    for window, step in (('D', 1), ('W', 1), ('M', 1), ('M', 3), ('Y', 1)):
+        if _num_windows(date_start, date_end, window, step) <= max_bars:
+            return window, step
+    step = 2
+    while _num_windows(date_start, date_end, 'Y', step) > max(max_bars, 1):
+        step += 1
+    return 'Y', step
+
+
+def trade_bars(trade_columns, date_start, date_end, max_bars):
+    """
+    Returns bar traces of the shares bought and sold per day, week, month, quarter or years,
+    whichever keeps the number of bars within ``max_bars`` for the date range.
+    """
+    volume = analytics.volume_by_window(trade_columns,
+                                        *_trade_window(date_start, date_end, max_bars))
+    x = volume['window'].astype('datetime64[D]')
+    return [{'type': 'bar', 'name': 'Bought', 'x': x, 'y': volume['buy_shares'],
+             'yaxis': 'y2', 'marker': {'color': BUY_COLOR}},
+            {'type': 'bar', 'name': 'Sold', 'x': x, 'y': -volume['sell_shares'],
+             'yaxis': 'y2', 'marker': {'color': SELL_COLOR}}]
+
+
+def build_graph(ticker, dates, prices, trades, date_start=None, date_end=None,
+                max_points=None, max_bars=None):
+    """
+    Builds the plotly graph of the prices and insider trades of ``ticker``.
+
+    The price series is cut to the viewport from ``date_start`` to ``date_end`` and reduced
+    to at most ``max_points`` points, and trades are summed into at most ``max_bars`` bars
+    of shares bought and sold, so the size of the graph does not grow with the history.
+
+    Args:
+        dates, prices: sorted price dates (datetime64) and close prices.
+        trades: ``records.TradeBatch`` of the trades.
+    """
+    max_points = max_points or config.PLOT_MAX_POINTS
+    max_bars = max_bars or config.PLOT_MAX_TRADE_BARS
+    viewport = pricestore.slice_by_date({'date': np.asarray(dates, dtype='datetime64[D]'),
+                                         'close': np.asarray(prices, dtype='f8')},
+                                        date_start, date_end)
+    dates, prices = downsample_minmax(viewport['date'], viewport['close'], max_points)
+    data = [{'type': 'scatter', 'name': 'Close', 'x': dates, 'y': prices}]
+    trade_columns = getattr(trades, 'columns', None)
+    if trade_columns is not None and len(trades):
+        trade_dates = trade_columns['date']
+        mask = ~np.isnat(trade_dates)
+        if date_start is not None:
+            mask &= trade_dates >= np.datetime64(date_start, 'D')
+        if date_end is not None:
+            mask &= trade_dates <= np.datetime64(date_end, 'D')
+        if mask.any():
+            trade_columns = {name: values[mask] for name, values in trade_columns.items()}
+            data.extend(trade_bars(trade_columns,
+                                   date_start or trade_columns['date'].min(),
+                                   date_end or trade_columns['date'].max(), max_bars))
+    graph = {'data': data,
              'layout': {
                  'title': '{}'.format(ticker.upper()),
-                 'shapes': [trade_to_line_shape(trade) for trade in trades]
+                 'barmode': 'relative',
+                 'yaxis': {'title': 'Price'},
+                 'yaxis2': {'title': 'Shares', 'overlaying': 'y', 'side': 'right',
+                            'showgrid': False},
              }
              }
     return graph
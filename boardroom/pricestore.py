@@ -0,0 +1,156 @@
+"""
+Columnar on-disk store of daily stock prices.
+
+Each ticker's history is kept as one ``.npy`` array per column, sorted by date::
+
+    <STOCK_PRICE_DIR>/<TICKER>/<column>.npy
+
+Reads memory-map the columns, and ``slice_by_date`` selects a date range with a binary
+search, returning views of the mapped arrays rather than copies.
+"""
+import os
+import shutil
+
+import numpy as np
+
+from boardroom import config, utils
+
+PRICE_COLUMNS = (
+    ('date',    'datetime64[D]'),
+    ('open',    'f8'),
+    ('high',    'f8'),
+    ('low',     'f8'),
+    ('close',   'f8'),
+    ('volume',  'i8'),
+    )
+PRICE_COLUMN_NAMES = tuple(name for name, _ in PRICE_COLUMNS)
+
+
+def ticker_dir(ticker):
+    return os.path.join(config.STOCK_PRICE_DIR, ticker.upper())
+
+
+def has_prices(ticker):
+    return os.path.isdir(ticker_dir(ticker))
+
+
+def data_version(ticker):
+    """Returns when the prices of ``ticker`` were last written, or None."""
+    try:
+        return os.path.getmtime(ticker_dir(ticker))
+    except OSError:
+        return None
+
+
+def tickers():
+    """Returns the tickers with stored prices."""
+    if not os.path.isdir(config.STOCK_PRICE_DIR):
+        return []
+    return sorted(name for name in os.listdir(config.STOCK_PRICE_DIR)
+                  if not name.endswith(('.tmp', '.old')) and
+                  os.path.isdir(os.path.join(config.STOCK_PRICE_DIR, name)))
+
+
+def last_date(ticker):
+    """Returns the last stored date of ``ticker`` as a datetime64, or None."""
+    if not has_prices(ticker):
+        return None
+    dates = read_prices(ticker, columns=('date',))['date']
+    return dates[-1] if len(dates) else None
+
+
+def price_dicts_to_columns(price_dicts):
+    """
+    Converts Yahoo Finance price dicts, with dates as epoch seconds, to columns sorted by
+    date.  Entries without a close price, e.g. dividends, are skipped.
+    """
+    price_dicts = [d for d in price_dicts if d.get('close') is not None]
+    dates = np.array([d['date'] for d in price_dicts], dtype='i8').astype('datetime64[s]')
+    order = np.argsort(dates, kind='mergesort')
+    columns = {'date': dates[order].astype('datetime64[D]')}
+    for name, dtype in PRICE_COLUMNS[1:]:
+        if dtype == 'i8':
+            values = [d.get(name) or 0 for d in price_dicts]
+        else:
+            values = [np.nan if d.get(name) is None else d[name] for d in price_dicts]
+        columns[name] = np.array(values, dtype=dtype)[order]
+    return columns
+
+
+def write_prices(ticker, price_dicts):
+    """
+    Writes the prices of ``ticker``, replacing any stored before.
+
+    Returns:
+        int: number of days written.
+    """
+    columns = price_dicts_to_columns(price_dicts)
+    _write_columns(ticker, columns)
+    return len(columns['date'])
+
+
+def merge_prices(ticker, price_dicts):
+    """Adds the prices of ``price_dicts`` to those stored for ``ticker``, see ``merge_columns``."""
+    return merge_columns(ticker, price_dicts_to_columns(price_dicts))
+
+
+def merge_columns(ticker, new):
+    """
+    Adds the price columns ``new``, sorted by date, to those stored for ``ticker``.  Days
+    already stored are replaced by the new prices, e.g. the last day if it was saved before
+    the close.
+
+    Returns:
+        int: number of days that were not stored before.
+    """
+    if not has_prices(ticker):
+        _write_columns(ticker, new)
+        return len(new['date'])
+    old = read_prices(ticker)
+    keep = ~np.isin(old['date'], new['date'])
+    num_new_days = len(new['date']) - (len(old['date']) - int(keep.sum()))
+    dates = np.concatenate([old['date'][keep], new['date']])
+    order = np.argsort(dates, kind='mergesort')
+    columns = {name: np.concatenate([old[name][keep], new[name]])[order]
+               for name in PRICE_COLUMN_NAMES}
+    _write_columns(ticker, columns)
+    return num_new_days
+
+
+def _write_columns(ticker, columns):
+    outdir = ticker_dir(ticker)
+    tmpdir = outdir + '.tmp'
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    utils.makedirs(tmpdir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmpdir, name + '.npy'), values)
+    utils.replace_dir(tmpdir, outdir)
+
+
+def read_prices(ticker, columns=PRICE_COLUMN_NAMES):
+    """
+    Returns a dict mapping each name in ``columns`` to its memory-mapped array.
+
+    Raises:
+        FileNotFoundError: if no prices are stored for ``ticker``.
+    """
+    indir = ticker_dir(ticker)
+    return {name: np.load(os.path.join(indir, name + '.npy'), mmap_mode='r')
+            for name in columns}
+
+
+def empty_columns():
+    return {name: np.array([], dtype=dtype) for name, dtype in PRICE_COLUMNS}
+
+
+def slice_by_date(columns, date_start=None, date_end=None):
+    """
+    Returns views of ``columns`` limited to the dates from ``date_start`` to ``date_end``
+    inclusive, either of which may be None.  ``columns`` must include 'date'.
+    """
+    dates = columns['date']
+    start = 0 if date_start is None else \
+        np.searchsorted(dates, np.datetime64(date_start, 'D'), side='left')
+    end = len(dates) if date_end is None else \
+        np.searchsorted(dates, np.datetime64(date_end, 'D'), side='right')
+    return {name: values[start:end] for name, values in columns.items()}
@@ -0,0 +1,243 @@
+"""
+Compact, typed records of the trades parsed from SEC forms.
+
+A form reports its trades on behalf of every one of its reporting owners, e.g. a fund and
+its managers filing jointly, so each trade is recorded once per owner.  ``owner_index`` is
+the position of the owner in the form, the rows with 0 count each trade once.
+
+Form dicts hold every value as the string found in the filing.  Trades are converted once,
+when a form is ingested, into ``Trade`` records of typed values (dates as days since
+1970-01-01, numbers as floats, CIKs as ints), or into a ``TradeBatch`` holding many trades
+as one numpy array per column, which is what the trade store reads and writes.
+"""
+import math
+import datetime
+
+import numpy as np
+
+TRADE_COLUMNS = (
+    ('date',                    'datetime64[D]'),
+    ('num_shares',              'f8'),
+    ('price_per_share',         'f8'),
+    ('shares_owned_after',      'f8'),
+    ('sec_type',                'U'),
+    ('transaction_code',        'U'),
+    ('acquired_disposed_code',  'U'),
+    ('direct_or_indirect',      'U'),
+    ('issuer_cik',              'i8'),
+    ('insider_cik',             'i8'),
+    ('conversion_price',        'f8'),
+    ('underlying_shares',       'f8'),
+    ('is_derivative',           '?'),
+    ('owner_index',             'i8'),
+    )
+TRADE_COLUMN_NAMES = tuple(name for name, _ in TRADE_COLUMNS)
+
+EPOCH = datetime.date(1970, 1, 1)
+# int64 value of a missing datetime64 (NaT)
+NAT_DAYS = np.datetime64('NaT', 'D').astype('i8')
+
+
+def parse_date(value):
+    """
+    Returns the date string ``value`` as days since 1970-01-01, or None if it is empty.
+
+    Dates sometimes carry a timezone offset, e.g. 2011-03-01-05:00, which is ignored.
+    """
+    if not value:
+        return None
+    return (datetime.datetime.strptime(value[:10], '%Y-%m-%d').date() - EPOCH).days
+
+
+def parse_float(value):
+    """Returns ``value`` as a float, NaN if it is missing."""
+    if value is None or value == '':
+        return float('nan')
+    return float(value)
+
+
+def _format_float(value):
+    if math.isnan(value):
+        return None
+    return str(value) if value != int(value) else str(int(value))
+
+
+class Trade(object):
+    """
+    One trade of a form, as reported by one of its owners.
+
+    For derivative securities, e.g. options, ``num_shares`` is the number of derivative
+    securities and ``underlying_shares`` the number of shares they convert to at
+    ``conversion_price``, both NaN for stock.  Missing dates are None and missing numbers NaN.
+    """
+    __slots__ = TRADE_COLUMN_NAMES
+
+    def __init__(self, date, num_shares, price_per_share, shares_owned_after, sec_type,
+                 transaction_code, acquired_disposed_code, direct_or_indirect, issuer_cik,
+                 insider_cik, conversion_price=float('nan'), underlying_shares=float('nan'),
+                 is_derivative=False, owner_index=0):
+        self.date = date
+        self.num_shares = num_shares
+        self.price_per_share = price_per_share
+        self.shares_owned_after = shares_owned_after
+        self.sec_type = sec_type
+        self.transaction_code = transaction_code
+        self.acquired_disposed_code = acquired_disposed_code
+        self.direct_or_indirect = direct_or_indirect
+        self.issuer_cik = issuer_cik
+        self.insider_cik = insider_cik
+        self.conversion_price = conversion_price
+        self.underlying_shares = underlying_shares
+        self.is_derivative = is_derivative
+        self.owner_index = owner_index
+
+    @classmethod
+    def from_dict(cls, trade, issuer_cik, insider_cik, is_derivative=False, owner_index=0):
+        """Builds a record from a trade dict of ``parse_secform.get_form_dict``."""
+        return cls(parse_date(trade['date']),
+                   parse_float(trade['num_shares']),
+                   parse_float(trade['price_per_share']),
+                   parse_float(trade['shares_owned_after']),
+                   trade['sec_type'] or '',
+                   trade['transaction_code'] or '',
+                   trade['acquired_disposed_code'] or '',
+                   trade['direct_or_indirect'] or '',
+                   int(issuer_cik),
+                   int(insider_cik),
+                   parse_float(trade.get('conversion_price')),
+                   parse_float(trade.get('underlying_shares')),
+                   is_derivative,
+                   owner_index)
+
+    @property
+    def isodate(self):
+        """The date as YYYY-MM-DD, or None."""
+        if self.date is None:
+            return None
+        return (EPOCH + datetime.timedelta(days=self.date)).isoformat()
+
+    @property
+    def num_shares_display(self):
+        """``num_shares`` as formatted by ``to_dict``, or '' if it is missing."""
+        return _format_float(self.num_shares) or ''
+
+    def to_dict(self):
+        """
+        Returns the trade as a dict of the values as found in the filing, strings but for
+        ``is_derivative`` and ``owner_index``.
+        """
+        d = {name: getattr(self, name) for name in TRADE_COLUMN_NAMES}
+        d['date'] = self.isodate
+        for name in ('num_shares', 'price_per_share', 'shares_owned_after', 'conversion_price',
+                     'underlying_shares'):
+            d[name] = _format_float(d[name])
+        for name in ('issuer_cik', 'insider_cik'):
+            d[name] = '{:010d}'.format(d[name])
+        return d
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in TRADE_COLUMN_NAMES)
+
+    def __eq__(self, other):
+        if not isinstance(other, Trade):
+            return NotImplemented
+        # NaN != NaN, compare the formatted values instead
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return 'Trade({})'.format(', '.join('{}={!r}'.format(name, value) for name, value in
+                                            zip(TRADE_COLUMN_NAMES, self._values())))
+
+
+def trades_from_form(form):
+    """
+    Yields a ``Trade`` for each trade of the form dict ``form`` and each of its owners, the
+    non-derivative trades first.
+
+    Forms have a single issuer.  Form dicts parsed before derivative tables were, have no
+    'derivative' key.
+    """
+    issuer_cik = next(iter(form['issuer']))
+    derivative_trades = form.get('derivative', {}).get('trades', ())
+    for owner_index, insider_cik in enumerate(form['owner']):
+        for trade in form['nonderivative']['trades']:
+            yield Trade.from_dict(trade, issuer_cik, insider_cik, False, owner_index)
+        for trade in derivative_trades:
+            yield Trade.from_dict(trade, issuer_cik, insider_cik, True, owner_index)
+
+
+def empty_columns(columns=TRADE_COLUMN_NAMES):
+    dtypes = dict(TRADE_COLUMNS)
+    return {name: np.array([], dtype='U1' if dtypes[name] == 'U' else dtypes[name])
+            for name in columns}
+
+
+# Values of the columns added after trades were first stored, for reading older data
+COLUMN_DEFAULTS = {
+    'conversion_price':     np.nan,
+    'underlying_shares':    np.nan,
+    'is_derivative':        False,
+    'owner_index':          0,
+    }
+
+
+def default_column(name, length):
+    """Returns a column of ``length`` trades stored before column ``name`` existed."""
+    return np.full(length, COLUMN_DEFAULTS[name], dtype=dict(TRADE_COLUMNS)[name])
+
+
+class TradeBatch(object):
+    """
+    Trades held as one numpy array per column, e.g. as read from the trade store.
+
+    Indexing and iterating yield ``Trade`` records built on the fly, so a batch of millions
+    of trades costs only the size of its arrays.  Slicing returns a batch of views.
+
+    Args:
+        columns (dict): mapping of column name to array, every array of the same length.
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_trades(cls, trades):
+        """Builds a batch from an iterable of ``Trade`` records."""
+        trades = list(trades)
+        if not trades:
+            return cls(empty_columns())
+        columns = {}
+        for name, dtype in TRADE_COLUMNS:
+            values = [getattr(trade, name) for trade in trades]
+            if name == 'date':
+                values = [NAT_DAYS if v is None else v for v in values]
+                columns[name] = np.array(values, dtype='i8').view(dtype)
+            elif dtype == 'U':
+                columns[name] = np.array(values)
+            else:
+                columns[name] = np.array(values, dtype=dtype)
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return TradeBatch({name: values[i] for name, values in self.columns.items()})
+        values = [self.columns[name][i].item() for name in TRADE_COLUMN_NAMES[1:]]
+        date = self.columns['date'][i]
+        date = None if np.isnat(date) else int(date.astype('i8'))
+        return Trade(date, *values)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_dicts(self):
+        """Returns the trades as dicts of strings, see ``Trade.to_dict``."""
+        return [trade.to_dict() for trade in self]
@@ -1,39 +1,97 @@
-drop table if exists issuer;
-create table issuer (
+create table if not exists issuer (
     cik     integer primary key,
     name    text not null,
-    ticker  text not null
+    ticker  text
 );
 
-drop table if exists insider;
-create table insider (
+create table if not exists insider (
     cik                   integer primary key,
     name                  text not null,
-    addr1                 text not null,
-    addr2                 text not null,
-    city                  text not null,
-    state                 text not null,
-    zipcode               text not null,
+    addr1                 text,
+    addr2                 text,
+    city                  text,
+    state                 text,
+    zipcode               text,
     is_officer            text,
     is_director           text,
     is_ten_percent_owner  text,
     is_other_exec_type    text
 );
 
-drop table if exists trade;
-create table trade (
+-- year and index_cik are the form index partition the filing was ingested with, they are
+-- null for filings loaded from bulk parser output
+create table if not exists filing (
+    form_loc     text primary key,
+    year         integer,
+    index_cik    integer,
+    issuer_cik   integer not null,
+    insider_cik  integer not null,
+      foreign key (issuer_cik) references issuer(cik),
+      foreign key (insider_cik) references insider(cik)
+);
+create index if not exists filing_partition on filing (year, index_cik);
+
+-- dates are YYYY-MM-DD, missing numbers are null.  A trade has one row per reporting owner
+-- of its filing, owner_index 0 for the first.  Columns added to an existing table are also
+-- listed in tradedb.TRADE_MIGRATIONS.
+create table if not exists trade (
     id                      integer primary key autoincrement,
-    date                    text not null,
-    num_shares              real not null,
-    price_per_share         real not null,
+    form_loc                text not null,
+    date                    text,
+    num_shares              real,
+    price_per_share         real,
     sec_type                text not null,
     direct_or_indirect      text not null,
     acquired_disposed_code  text not null,
     transaction_code        text not null,
-    shares_owned_after      real not null,
-    issuer_cik              integer not NULL,
-    insider_cik             integer not NULL,
+    shares_owned_after      real,
+    issuer_cik              integer not null,
+    insider_cik             integer not null,
+    conversion_price        real,
+    underlying_shares       real,
+    is_derivative           integer not null default 0,
+    owner_index             integer not null default 0,
+      foreign key (form_loc) references filing(form_loc) on delete cascade,
       foreign key (issuer_cik) references issuer(cik),
       foreign key (insider_cik) references insider(cik)
 );
+create index if not exists trade_issuer_date on trade (issuer_cik, date);
+create index if not exists trade_insider on trade (insider_cik);
+create index if not exists trade_form_loc on trade (form_loc);
+
+-- the insider index: every reporting owner of every ingested filing, with the backend of
+-- either config.TRADE_BACKEND, and the relationship to the issuer reported in the filing
+create table if not exists filing_owner (
+    form_loc              text not null,
+    year                  integer,
+    index_cik             integer,
+    issuer_cik            integer not null,
+    insider_cik           integer not null,
+    owner_index           integer not null,
+    is_officer            text,
+    is_director           text,
+    is_ten_percent_owner  text,
+    is_other_exec_type    text,
+      primary key (form_loc, insider_cik)
+);
+create index if not exists filing_owner_insider on filing_owner (insider_cik, year);
+create index if not exists filing_owner_partition on filing_owner (year, index_cik);
 
+-- the forms of each form index partition, in the order of the index.  A form is listed
+-- under its issuer and each reporting owner, so it can be in several partitions while its
+-- filing and trades are stored once.  Partitions are read as the column store reads them.
+create table if not exists partition_filing (
+    year       integer not null,
+    index_cik  integer not null,
+    position   integer not null,
+    form_loc   text not null,
+      primary key (year, index_cik, form_loc)
+);
+create index if not exists partition_filing_form_loc on partition_filing (form_loc);
+
+create table if not exists ingested_partition (
+    year    integer not null,
+    cik     integer not null,
+    mtime   real not null,
+      primary key (year, cik)
+);
@@ -0,0 +1,224 @@
+"""
+Form cache backend packing filings into large append-only segment files.
+
+Instead of one small gzip file per filing, filings are compressed one by one and appended to
+``segment-NNNNN.dat`` files of up to ``segment_size`` bytes.  An SQLite index maps each form
+location to its segment, offset and length, and segments are read through ``mmap``.  If the
+``zstandard`` package is installed and a dictionary has been trained with
+``train_zstd_dictionary``, filings are compressed with zstd using that shared dictionary,
+which gets much of the benefit of compressing similar filings together; otherwise zlib is
+used.
+
+Any number of processes may read and write a cache, e.g. the ingest workers of
+``boardroom.jobs``: an append holds an ``flock`` on the lock file of the cache from choosing
+its segment and offset until it is in the index.  Where ``fcntl`` is not available, only
+one process should write to a cache at a time.
+"""
+import os
+import mmap
+import zlib
+import sqlite3
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from boardroom import utils
+
+SEGMENT_INDEX_SCHEMA = """
+create table if not exists form (
+    form_loc    text primary key,
+    segment     integer not null,
+    offset      integer not null,
+    length      integer not null,
+    codec       text not null
+);
+"""
+ZSTD_DICT_FNAME = 'zstd.dict'
+WRITE_LOCK_FNAME = 'write.lock'
+
+
+class SegmentCache(object):
+    """
+    Cache of SEC forms stored in segment files under ``directory``.
+
+    Args:
+        directory (str): Directory of the segment files and index.
+        segment_size (int): A new segment is started once the current one reaches this size.
+        compress_level (int): Compression level for zlib or zstd.
+    """
+    def __init__(self, directory, segment_size=1 << 30, compress_level=6):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compress_level = compress_level
+        utils.makedirs(directory)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._db.execute('pragma journal_mode=wal')
+        self._db.execute('pragma synchronous=normal')
+        self._db.executescript(SEGMENT_INDEX_SCHEMA)
+        self._maps = {}
+        self._local = threading.local()
+        self._zstd_dict = None
+        dict_path = os.path.join(directory, ZSTD_DICT_FNAME)
+        if zstandard is not None and os.path.exists(dict_path):
+            with open(dict_path, 'rb') as f:
+                self._zstd_dict = zstandard.ZstdCompressionDict(f.read())
+        row = self._db.execute('select max(segment) from form').fetchone()
+        self._segment = row[0] if row[0] is not None else 0
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, 'segment-{:05d}.dat'.format(segment))
+
+    def _compress(self, content):
+        if self._zstd_dict is not None:
+            compressor = zstandard.ZstdCompressor(level=self.compress_level,
+                                                  dict_data=self._zstd_dict)
+            return compressor.compress(content), 'zstd'
+        return zlib.compress(content, self.compress_level), 'zlib'
+
+    def _decompress(self, blob, codec):
+        if codec == 'zlib':
+            return zlib.decompress(blob)
+        if codec == 'zstd':
+            decompressor = getattr(self._local, 'zstd_decompressor', None)
+            if decompressor is None:
+                if self._zstd_dict is None:
+                    raise ValueError('zstd compressed form but no zstd dictionary available')
+                decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dict)
+                self._local.zstd_decompressor = decompressor
+            return decompressor.decompress(blob)
+        raise ValueError('Unknown codec: {}'.format(codec))
+
+    def _map(self, segment, end):
+        """Returns an mmap of ``segment`` covering at least ``end`` bytes."""
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < end:
+                # the old map is left for readers still using it to be garbage collected
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment] = mapped
+            return mapped
+
+    def __contains__(self, form_loc):
+        with self._lock:
+            row = self._db.execute('select 1 from form where form_loc = ?',
+                                   (form_loc,)).fetchone()
+        return row is not None
+
+    def get(self, form_loc):
+        """
+        Returns the content of the form at ``form_loc``.
+
+        Raises:
+            KeyError: if the form is not in the cache.
+        """
+        with self._lock:
+            row = self._db.execute('select segment, offset, length, codec from form '
+                                   'where form_loc = ?', (form_loc,)).fetchone()
+        if row is None:
+            raise KeyError(form_loc)
+        segment, offset, length, codec = row
+        mapped = self._map(segment, offset + length)
+        return self._decompress(mapped[offset:offset+length], codec)
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        """Holds the lock of the cache shared by every process writing to it."""
+        if fcntl is None:
+            yield
+            return
+        # opened on every write, a descriptor inherited by a forked process shares its lock
+        with open(os.path.join(self.directory, WRITE_LOCK_FNAME), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def put(self, form_loc, content):
+        """Appends ``content`` (bytes) of the form at ``form_loc`` to the current segment."""
+        blob, codec = self._compress(content)
+        with self._lock, self._write_lock():
+            # other processes may have started a new segment since
+            row = self._db.execute('select max(segment) from form').fetchone()
+            self._segment = max(self._segment, row[0] or 0)
+            path = self._segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+                self._segment += 1
+                path = self._segment_path(self._segment)
+            with open(path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(blob)
+            with self._db:
+                self._db.execute('insert or replace into form values (?, ?, ?, ?, ?)',
+                                 (form_loc, self._segment, offset, len(blob), codec))
+
+    def iter_form_locs(self):
+        """Yields the location of every form in the cache, in order of location."""
+        with self._lock:
+            rows = self._db.execute('select form_loc from form order by form_loc').fetchall()
+        for (form_loc,) in rows:
+            yield form_loc
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+            self._db.close()
+
+
+def pack_file_cache(cache, cache_dir):
+    """
+    Copies every form of the per-file cache in ``cache_dir`` into ``cache``.
+
+    Returns:
+        int: number of forms copied.
+    """
+    num_forms = 0
+    for dirpath, dirnames, filenames in os.walk(cache_dir):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if not fname.endswith('.gz'):
+                continue
+            fpath = os.path.join(dirpath, fname)
+            form_loc = os.path.relpath(fpath[:-len('.gz')], cache_dir).replace(os.sep, '/')
+            if form_loc in cache:
+                continue
+            cache.put(form_loc, utils.read_file(fpath).encode('utf8'))
+            num_forms += 1
+    return num_forms
+
+
+def train_zstd_dictionary(cache, dict_size=112640, max_samples=5000):
+    """
+    Trains a zstd dictionary on forms already in ``cache`` and saves it in the cache
+    directory.  Forms added afterwards are compressed with it.
+
+    Requires the ``zstandard`` package.  A cache has only one dictionary for its lifetime,
+    since the forms compressed with it cannot be read without it.
+    """
+    if zstandard is None:
+        raise ImportError('train_zstd_dictionary requires the zstandard package')
+    dict_path = os.path.join(cache.directory, ZSTD_DICT_FNAME)
+    if os.path.exists(dict_path):
+        raise ValueError('The cache already has a zstd dictionary: {}'.format(dict_path))
+    samples = []
+    for form_loc in cache.iter_form_locs():
+        samples.append(cache.get(form_loc))
+        if len(samples) >= max_samples:
+            break
+    zstd_dict = zstandard.train_dictionary(dict_size, samples)
+    with open(dict_path, 'wb') as f:
+        f.write(zstd_dict.as_bytes())
+    cache._zstd_dict = zstd_dict
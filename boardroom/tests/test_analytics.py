@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from boardroom import analytics
+
+
+def _prices(closes, start='2017-01-02'):
+    dates = np.datetime64(start) + np.arange(len(closes))
+    return {'date': dates, 'close': np.array(closes, dtype='f8')}
+
+
+def _trades(rows):
+    """rows of (date, num_shares, acquired_disposed_code, transaction_code, insider_cik)"""
+    dates, shares, ad_codes, codes, insiders = zip(*rows)
+    return {'date': np.array(dates, dtype='datetime64[D]'),
+            'num_shares': np.array(shares, dtype='f8'),
+            'acquired_disposed_code': np.array(ad_codes),
+            'transaction_code': np.array(codes),
+            'insider_cik': np.array(insiders, dtype='i8')}
+
+
+PRICES = _prices([10, 11, 12, 13, 14, 15])
+TRADES = _trades([
+    ('2017-01-02', 100, 'A', 'P', 1),
+    ('2017-01-03', 50, 'D', 'S', 2),
+    ('2017-01-06', 10, 'A', 'A', 1),
+    ('2017-02-01', 20, 'D', 'S', 1),    # after the last price
+    ('NaT', 5, 'A', 'P', 2),
+    ])
+
+
+class TestAnalytics(unittest.TestCase):
+    def test_align(self):
+        index = analytics.align_trades_to_prices(TRADES['date'], PRICES['date'])
+        self.assertEqual(index.tolist(), [0, 1, 4, -1, -1])
+
+    def test_trades_before_prices(self):
+        trades = _trades([('2005-03-01', 100, 'A', 'P', 1), ('2016-12-31', 10, 'A', 'P', 1),
+                          ('2017-01-03', 10, 'A', 'P', 1)])
+        index = analytics.align_trades_to_prices(trades['date'], PRICES['date'])
+        self.assertEqual(index.tolist(), [-1, -1, 1])
+        returns = analytics.forward_returns(trades, PRICES, horizons=(1,))[1]
+        np.testing.assert_allclose(returns, [np.nan, np.nan, 1/11.])
+        index = analytics.align_trades_to_prices(trades['date'], PRICES['date'][:0])
+        self.assertEqual(index.tolist(), [-1, -1, -1])
+
+    def test_forward_returns(self):
+        returns = analytics.forward_returns(TRADES, PRICES, horizons=(1, 2))
+        np.testing.assert_allclose(returns[1], [0.1, 1/11., 15/14. - 1, np.nan, np.nan])
+        np.testing.assert_allclose(returns[2], [0.2, 2/11., np.nan, np.nan, np.nan])
+
+    def test_volume_by_window(self):
+        volume = analytics.volume_by_window(TRADES, window='M')
+        self.assertEqual(volume['window'].astype(str).tolist(), ['2017-01', '2017-02'])
+        self.assertEqual(volume['buy_shares'].tolist(), [110, 0])
+        self.assertEqual(volume['sell_shares'].tolist(), [50, 20])
+        self.assertEqual(volume['num_trades'].tolist(), [3, 1])
+        weeks = analytics.volume_by_window(TRADES, window='W')['window']
+        self.assertEqual(weeks.astype(str).tolist(), ['2017-01-02', '2017-01-30'])
+
+    def test_volume_by_insider(self):
+        returns = analytics.forward_returns(TRADES, PRICES, horizons=(1,))[1]
+        volume = analytics.volume_by_insider(TRADES, returns)
+        self.assertEqual(volume['insider_cik'].tolist(), [1, 2])
+        self.assertEqual(volume['net_shares'].tolist(), [90, -45])
+        np.testing.assert_allclose(volume['mean_signed_return'],
+                                   [(0.1 + 15/14. - 1) / 2, -1/11.])
+
+    def test_joint_and_derivative_trades(self):
+        trades = dict(TRADES, is_derivative=np.array([False, False, False, False, True]),
+                      owner_index=np.array([0, 0, 1, 0, 0]))
+        volume = analytics.volume_by_window(trades, window='M')
+        self.assertEqual(volume['buy_shares'].tolist(), [100, 0])
+        self.assertEqual(volume['num_trades'].tolist(), [2, 1])
+        volume = analytics.volume_by_insider(trades, np.zeros(5))
+        self.assertEqual(volume['net_shares'].tolist(), [90, -50])
+
+    def test_insider_signal(self):
+        signal = analytics.insider_signal(TRADES, PRICES, horizon=2)
+        self.assertEqual((signal['num_buys'], signal['num_sells']), (2, 2))
+        self.assertAlmostEqual(signal['buy_return'], 0.2)
+        self.assertAlmostEqual(signal['sell_return'], 2/11.)
+        self.assertAlmostEqual(signal['score'], 0.2 - 2/11.)
+        signal = analytics.insider_signal(TRADES, _prices([10]), horizon=2)
+        self.assertTrue(np.isnan(signal['score']))
@@ -0,0 +1,60 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import bulk_parse, ingestdata, metrics
+from boardroom.tests.utils import TEST_DIRECTORY
+
+
+class TestBulkParse(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        for name, value in (('FORM_CACHE_DIR', self.cache_dir),
+                            ('FORM_SEARCH_INDEX', False)):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(os.path.join(TEST_DIRECTORY, 'data_tests', 'sample_form4.txt'), 'rb') as f:
+            form4 = f.read()
+        with open(os.path.join(TEST_DIRECTORY, 'data_tests', 'form4_dict.json'), 'r') as f:
+            self.form4_dict = json.load(f)
+        self.form_locs = ['edgar/data/1551138/{}.txt'.format(i) for i in range(5)]
+        for form_loc in self.form_locs:
+            ingestdata._save_sec_form_cache(form_loc, form4)
+        ingestdata._save_sec_form_cache('edgar/data/1/bad.txt', b'not a form')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_chunks_iter(self):
+        self.assertEqual(list(bulk_parse.chunks_iter(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_iter_cache(self):
+        self.assertEqual(list(ingestdata._iter_sec_form_cache()),
+                         ['edgar/data/1/bad.txt'] + self.form_locs)
+
+    def test_bulk_parse(self):
+        sink = io.StringIO()
+        form_locs = self.form_locs + ['edgar/data/1/bad.txt', 'edgar/data/1/missing.txt']
+        num_parsed = metrics.FORM_PARSE_SECONDS.count(result='ok')
+        stats = bulk_parse.bulk_parse(form_locs, sink, processes=2, chunksize=2, log=None)
+        self.assertEqual(stats['forms'], 7)
+        self.assertEqual(stats['errors'], 2)
+        # the parse latencies of the workers are merged into this process
+        self.assertEqual(metrics.FORM_PARSE_SECONDS.count(result='ok'), num_parsed + 5)
+        results = {}
+        for line in sink.getvalue().splitlines():
+            result = json.loads(line)
+            results[result['form_loc']] = result
+        for form_loc in self.form_locs:
+            self.assertEqual(results[form_loc]['form'], self.form4_dict)
+        self.assertIn('error', results['edgar/data/1/bad.txt'])
+        self.assertIn('FileNotFoundError', results['edgar/data/1/missing.txt']['error'])
+
@@ -0,0 +1,125 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import formsearch, ingestdata
+from boardroom.tests.utils import TEST_DIRECTORY
+
+
+class TestFormSearch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = formsearch.FormSearchIndex(os.path.join(self.directory, 'search.db'))
+        with open(os.path.join(TEST_DIRECTORY, 'data_tests', 'sample_form4.txt'), 'r') as f:
+            self.form4 = f.read()
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_form_text(self):
+        text = formsearch.form_text(self.form4)
+        self.assertIn('GENOMIC HEALTH INC', text['issuer'])
+        self.assertIn('BAKER FELIX', text['owners'].split('\n'))
+        self.assertIn('Rule 10b5-1 plan', text['footnotes'])
+        self.assertEqual(text['body'], '')
+        self.assertEqual(formsearch.form_text('plain text filing')['body'], 'plain text filing')
+
+    def test_search(self):
+        self.index.add('edgar/data/1131324/1.txt', self.form4)
+        self.index.add('edgar/data/1/2.txt', b'<html>annual report</html>')
+        results = self.index.search('"10b5-1 plan"')
+        self.assertEqual([r['form_loc'] for r in results], ['edgar/data/1131324/1.txt'])
+        self.assertIn('Rule [10b5-1 plan] adopted', results[0]['snippet'])
+        self.assertIn('BAKER FELIX', results[0]['owners'])
+        results = self.index.search('owners:baker AND footnotes:options')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(self.index.search('annual')), 1)
+        self.assertEqual(self.index.search('issuer:annual'), [])
+        self.assertRaises(ValueError, self.index.search, '"unterminated')
+
+    def test_reindex_replaces(self):
+        self.index.add('edgar/data/1/2.txt', 'first version')
+        self.index.add('edgar/data/1/2.txt', 'second version')
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search('first'), [])
+        self.assertEqual(len(self.index.search('second')), 1)
+
+    def test_index_forms(self):
+        items = [('edgar/data/1/{}.txt'.format(i), 'form {}'.format(i)) for i in range(5)]
+        self.assertEqual(formsearch.index_forms(self.index, items, batch_size=2), 5)
+        self.index.optimize()
+        self.assertEqual(len(self.index.search('form', limit=3)), 3)
+
+
+class TestIndexOnSave(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, value in (('FORM_CACHE_DIR', self.directory),
+                            ('FORM_SEARCH_DB', os.path.join(self.directory, 'search.db')),
+                            ('FORM_SEARCH_INDEX', True)):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('boardroom.ingestdata._form_index_writer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        ingestdata._get_form_index_writer().close()
+        shutil.rmtree(self.directory)
+
+    def _search(self, query):
+        index = formsearch.FormSearchIndex(os.path.join(self.directory, 'search.db'))
+        results = [r['form_loc'] for r in index.search(query)]
+        index.close()
+        return results
+
+    def test_save_indexes_form(self):
+        ingestdata._save_sec_form_cache('edgar/data/1/1.txt', b'Insider remarks here')
+        ingestdata._get_form_index_writer().flush()
+        self.assertEqual(self._search('remarks'), ['edgar/data/1/1.txt'])
+
+    def test_index_error_does_not_fail_save(self):
+        error = formsearch.sqlite3.OperationalError('database is locked')
+        with mock.patch('boardroom.formsearch.FormSearchIndex.add_many',
+                        side_effect=error) as add_many, \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            ingestdata._save_sec_form_cache('edgar/data/1/1.txt', b'Insider remarks here')
+            ingestdata._get_form_index_writer().flush()
+        self.assertTrue(add_many.called)
+        self.assertIn('database is locked', stderr.getvalue())
+        self.assertEqual(ingestdata._get_sec_form_cache('edgar/data/1/1.txt'),
+                         'Insider remarks here')
+        # the writer keeps going after an error
+        ingestdata._save_sec_form_cache('edgar/data/1/2.txt', b'More remarks')
+        ingestdata._get_form_index_writer().flush()
+        self.assertEqual(self._search('remarks'), ['edgar/data/1/2.txt'])
+
+    def test_new_database_closes_writer(self):
+        writer = ingestdata._get_form_index_writer()
+        with mock.patch('boardroom.config.FORM_SEARCH_DB',
+                        os.path.join(self.directory, 'other.db')):
+            self.assertIsNot(ingestdata._get_form_index_writer(), writer)
+        self.assertFalse(writer._thread.is_alive())
+
+    def test_disabled(self):
+        with mock.patch('boardroom.config.FORM_SEARCH_INDEX', False), \
+                mock.patch('boardroom.formsearch.IndexWriter') as index_writer:
+            ingestdata._save_sec_form_cache('edgar/data/1/1.txt', b'Insider remarks here')
+        self.assertFalse(index_writer.called)
+
+    def test_writer_batches(self):
+        writer = formsearch.IndexWriter(os.path.join(self.directory, 'batch.db'), batch_size=2)
+        for i in range(5):
+            writer.add('edgar/data/1/{}.txt'.format(i), 'form {}'.format(i))
+        writer.close()
+        index = formsearch.FormSearchIndex(os.path.join(self.directory, 'batch.db'))
+        self.assertEqual(len(index), 5)
+        index.close()
@@ -0,0 +1,195 @@
+import os
+import time
+import random
+import sqlite3
+import shutil
+import datetime
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import get_trades, tradestore, tradedb
+
+
+def _slow_get_form_dict(form_loc, cache_file=False):
+    time.sleep(random.uniform(0, 0.01))
+    return {'form_loc': form_loc}, True
+
+
+class TestFormsFromLocsIter(unittest.TestCase):
+    def setUp(self):
+        self.form_locs = ['edgar/data/1/{}.txt'.format(i) for i in range(50)]
+
+    @mock.patch('boardroom.parse_secform.get_form_dict', side_effect=_slow_get_form_dict)
+    def test_ordered(self, _):
+        forms = get_trades.forms_from_locs_iter(self.form_locs, max_workers=4, ordered=True)
+        output = [f['form_loc'] for f in forms]
+        self.assertEqual(output, self.form_locs)
+
+    @mock.patch('boardroom.parse_secform.get_form_dict', side_effect=_slow_get_form_dict)
+    def test_unordered(self, _):
+        forms = get_trades.forms_from_locs_iter(iter(self.form_locs), max_workers=4)
+        output = [f['form_loc'] for f in forms]
+        self.assertEqual(sorted(output), sorted(self.form_locs))
+
+    @mock.patch('boardroom.parse_secform.get_form_dict', side_effect=ValueError('bad form'))
+    def test_error_propagates(self, _):
+        forms = get_trades.forms_from_locs_iter(self.form_locs, max_workers=2)
+        self.assertRaises(ValueError, list, forms)
+
+
+
+class TestYearsToIngest(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.TRADE_STORE_DIR', self.store_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.this_year = datetime.date.today().year
+        for year in (2015, self.this_year):
+            os.makedirs(tradestore.partition_dir(year, 1131324))
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_years_to_ingest(self):
+        years = get_trades.years_to_ingest(1131324, 2015, 2016)
+        self.assertEqual(years, [2016])
+        years = get_trades.years_to_ingest(1131324, 2015, self.this_year)
+        self.assertEqual(years, list(range(2016, self.this_year+1)))
+        years = get_trades.years_to_ingest(1131324, self.this_year, self.this_year,
+                                           refresh_after=60)
+        self.assertEqual(years, [])
+
+
+def _form(issuer_cik, owner_ciks, date):
+    trade = {'sec_type': 'Common Stock', 'date': date, 'transaction_code': 'P',
+             'num_shares': '100', 'price_per_share': '10', 'acquired_disposed_code': 'A',
+             'shares_owned_after': '1000', 'direct_or_indirect': 'D'}
+    return {'issuer': {issuer_cik: {'cik': issuer_cik, 'name': 'ISSUER', 'symbol': 'X'}},
+            'owner': {cik: {'cik': cik, 'name': 'OWNER'} for cik in owner_ciks},
+            'nonderivative': {'holdings': [], 'trades': [trade]}}
+
+
+class TestTradesFromInsider(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        for name, value in (('TRADE_STORE_DIR', os.path.join(self.data_dir, 'trade_store')),
+                            ('TRADE_DB', os.path.join(self.data_dir, 'trades.db'))):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.forms = {
+            '1': [('edgar/data/1/a.txt', _form('0000000001', ['0000000007'], '2016-02-01'))],
+            '2': [('edgar/data/2/b.txt', _form('0000000002', ['0000000008', '0000000007'],
+                                               '2016-03-01'))],
+            }
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def _ingest(self, backend):
+        with mock.patch('boardroom.config.TRADE_BACKEND', backend), \
+                mock.patch('boardroom.get_trades.form_locs_from_cik_iter',
+                           side_effect=lambda cik, ys, ye: [cik]), \
+                mock.patch('boardroom.get_trades.forms_from_locs_iter',
+                           side_effect=lambda locs, **kwargs: iter(self.forms[locs[0]])):
+            for cik in ('1', '2'):
+                get_trades.ingest_trades(cik, 2016)
+            trades = get_trades.get_trades_from_insider(7, 2016, 2016)
+            self.assertEqual(len(get_trades.get_trades_from_insider(7, 2017, 2017)), 0)
+        return trades
+
+    def test_column_store(self):
+        trades = self._ingest('columns')
+        self.assertEqual([(t.issuer_cik, t.owner_index) for t in trades], [(1, 0), (2, 1)])
+        issuers = get_trades.get_issuers_from_insider(7)
+        self.assertEqual([i['cik'] for i in issuers], [1, 2])
+
+    def test_sqlite(self):
+        trades = self._ingest('sqlite')
+        self.assertEqual([(t.issuer_cik, t.owner_index) for t in trades], [(1, 0), (2, 1)])
+
+    def test_connections_closed(self):
+        connections = []
+        open_trade_db = tradedb.open_trade_db
+
+        def open_and_record(fpath=None):
+            connections.append(open_trade_db(fpath))
+            return connections[-1]
+        with mock.patch('boardroom.tradedb.open_trade_db', side_effect=open_and_record), \
+                mock.patch('boardroom.tradedb.connect_trade_db',
+                           wraps=tradedb.connect_trade_db) as connect:
+            self._ingest('sqlite')
+            get_trades.get_issuers_from_insider(7)
+        self.assertEqual(connect.call_count, 1)
+        self.assertGreater(len(connections), 1)
+        for db in connections:
+            self.assertRaises(sqlite3.ProgrammingError, db.execute, 'select 1')
+
+    def test_index_owners(self):
+        self._ingest('columns')
+        db = tradedb.connect_trade_db()
+        with db:
+            db.execute('delete from filing_owner')
+        self.assertEqual(get_trades.get_issuers_from_insider(7, db), [])
+        with mock.patch('boardroom.config.TRADE_BACKEND', 'columns'), \
+                mock.patch('boardroom.get_trades.form_locs_from_cik_iter',
+                           side_effect=lambda cik, ys, ye: [str(cik)]), \
+                mock.patch('boardroom.get_trades.forms_from_locs_iter',
+                           side_effect=lambda locs, **kwargs: iter(self.forms[locs[0]])):
+            self.assertEqual(get_trades.index_owners(db=db), 2)
+        issuers = get_trades.get_issuers_from_insider(7, db)
+        self.assertEqual([i['cik'] for i in issuers], [1, 2])
+        db.close()
+
+
+class TestBackendsAgree(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        for name, value in (('TRADE_STORE_DIR', os.path.join(self.data_dir, 'trade_store')),
+                            ('TRADE_DB', os.path.join(self.data_dir, 'trades.db'))):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        joint = _form('0000000001', ['0000000007', '0000000008'], '2016-03-01')
+        # a trade of late 2015 filed in 2016, and a form listed under both its issuer and
+        # its owner in the form index
+        self.partitions = {
+            (2015, '1'): [('edgar/data/1/a.txt', _form('0000000001', ['0000000007'],
+                                                       '2015-06-01'))],
+            (2016, '1'): [('edgar/data/1/b.txt', _form('0000000001', ['0000000007'],
+                                                       '2015-12-30')),
+                          ('edgar/data/1/c.txt', joint)],
+            (2016, '7'): [('edgar/data/1/c.txt', joint)],
+            }
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def _read(self, backend):
+        with mock.patch('boardroom.config.TRADE_BACKEND', backend), \
+                mock.patch('boardroom.get_trades.form_locs_from_cik_iter',
+                           side_effect=lambda cik, ys, ye: [(int(ys), cik)]), \
+                mock.patch('boardroom.get_trades.forms_from_locs_iter',
+                           side_effect=lambda locs, **kwargs: iter(self.partitions[locs[0]])):
+            for year, cik in sorted(self.partitions):
+                get_trades.ingest_trades(cik, year)
+            # ingesting a partition again keeps the forms other partitions list
+            get_trades.ingest_trades('7', 2016)
+            return [[t.to_dict() for t in batch] for batch in (
+                get_trades.read_trade_batch(1, 2016, 2016),
+                get_trades.read_trade_batch(1, 2015, 2016, first_owner_only=True),
+                get_trades.read_trade_batch(7, 2015, 2016),
+                get_trades.get_trades_from_insider(7, 2016, 2016))]
+
+    def test_same_trades(self):
+        columns = self._read('columns')
+        self.assertEqual([t['date'] for t in columns[0]],
+                         ['2015-12-30', '2016-03-01', '2016-03-01'])
+        self.assertEqual(len(columns[1]), 3)
+        self.assertEqual(len(columns[2]), 2)
+        self.assertEqual(self._read('sqlite'), columns)
@@ -1,8 +1,22 @@
 import os
+import io
+import json
+import gzip
+import shutil
+import datetime
+import tempfile
 import unittest
 import filecmp
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
-from boardroom.ingestdata import ticker_to_cik, write_forms_index, get_forms_index
+import requests
+
+from boardroom import utils
+from boardroom.ingestdata import (ticker_to_cik, write_forms_index, get_forms_index,
+                                  sync_forms_index, TickerCikMap)
 from boardroom.tests.utils import TEST_DIRECTORY, internet_on
 import boardroom.config
 
@@ -29,6 +43,56 @@ class TestTickerToCik(unittest.TestCase):
         self.assertRaises(TypeError, ticker_to_cik, 123)
 
 
+COMPANY_TICKERS = {
+    '0': {'cik_str': 21344, 'ticker': 'KO', 'title': 'COCA COLA CO'},
+    '1': {'cik_str': 1652044, 'ticker': 'GOOGL', 'title': 'Alphabet Inc.'},
+    '2': {'cik_str': 1652044, 'ticker': 'GOOG', 'title': 'Alphabet Inc.'},
+    }
+
+
+class TestTickerCikMap(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.DATA_DIR', self.data_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = mock.Mock(content=json.dumps(COMPANY_TICKERS).encode('utf8'))
+        patcher = mock.patch('boardroom.ingestdata.download_url', return_value=response)
+        self.download = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_lookups(self):
+        ticker_map = TickerCikMap()
+        self.assertEqual(ticker_map.get('ko'), '0000021344')
+        self.assertIsNone(ticker_map.get('NOPE'))
+        self.assertEqual(ticker_map.get_many(['GOOG', 'KO', 'NOPE']),
+                         {'GOOG': '0001652044', 'KO': '0000021344', 'NOPE': None})
+        self.assertEqual(sorted(ticker_map.tickers('1652044')), ['GOOG', 'GOOGL'])
+        self.assertEqual(self.download.call_count, 1)
+
+    def test_loads_saved_file(self):
+        TickerCikMap().refresh()
+        ticker_map = TickerCikMap()
+        self.assertEqual(ticker_map.get('KO'), '0000021344')
+        self.assertEqual(self.download.call_count, 1)
+
+    def test_refresh_when_stale(self):
+        ticker_map = TickerCikMap(max_age=0)
+        ticker_map.get('KO')
+        ticker_map.get('KO')
+        self.assertEqual(self.download.call_count, 2)
+
+    def test_download_failure(self):
+        self.download.side_effect = requests.exceptions.ConnectionError('offline')
+        ticker_map = TickerCikMap()
+        self.assertIsNone(ticker_map.get('KO'))
+        self.assertIsNone(ticker_map.get('KO'))
+        self.assertEqual(self.download.call_count, 1)
+
+
 class TestWriteFormsIndex(unittest.TestCase):
     def setUp(self):
         self.sample_formindex_path = os.path.join(TEST_DIRECTORY, 'data_tests/sample_formindex.txt')
@@ -102,3 +166,121 @@ class TestGetFormsIndex(unittest.TestCase):
         path_to_expected = os.path.join(TEST_DIRECTORY, 'data_tests/2014.psv')
         self.assertTrue(filecmp.cmp(path_to_output, path_to_expected))
 
+
+
+INDEX_HEADER = (
+    'Form Type   Company Name                CIK         Date Filed  File Name\n'
+    '-------------------------------------------------------------------------\n')
+
+
+def _index_line(date, accession):
+    return '4           Foo Corp                    1234        {}    ' \
+           'edgar/data/1234/{}.txt\n'.format(date, accession)
+
+
+class _DroppedStream(io.BytesIO):
+    """A response body whose connection drops after its content was read."""
+    def read(self, *args):
+        data = super(_DroppedStream, self).read(*args)
+        if not data:
+            raise requests.exceptions.ConnectionError('connection dropped')
+        return data
+
+    read1 = read
+
+
+class TestSyncFormsIndex(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.FORM_INDEX_DIR', self.index_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.published = {
+            'edgar/full-index/2016/QTR1/form.gz': _index_line('2016-03-31', 'a'),
+            'edgar/full-index/2016/QTR2/form.gz': _index_line('2016-04-05', 'b'),
+            'edgar/daily-index/2016/QTR2/form.20160406.idx': _index_line('20160406', 'c'),
+            }
+        patcher = mock.patch('boardroom.ingestdata.stream_sec_file', side_effect=self._download)
+        self.download = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def _download(self, index_loc):
+        if index_loc not in self.published:
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.exceptions.HTTPError('404', response=response)
+        content = (INDEX_HEADER + self.published[index_loc]).encode('utf8')
+        if index_loc.endswith('.gz'):
+            content = gzip.compress(content)
+        return io.BytesIO(content)
+
+    def _form_locs(self):
+        return [row[4] for row in utils.form_loc_iter(2016)]
+
+    def test_incremental(self):
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 8))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abc'])
+        self.assertEqual(list(utils.form_loc_iter(2016, cik='1234'))[-1][3], '2016-04-06')
+
+        self.published['edgar/daily-index/2016/QTR2/form.20160407.idx'] = \
+            _index_line('20160407', 'd')
+        self.published['edgar/daily-index/2016/QTR2/form.20160408.idx'] = \
+            _index_line('20160408', 'e')
+        self.download.reset_mock()
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 11))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abcde'])
+        requested = [call[0][0] for call in self.download.call_args_list]
+        self.assertEqual(requested, ['edgar/daily-index/2016/QTR2/form.20160407.idx',
+                                     'edgar/daily-index/2016/QTR2/form.20160408.idx',
+                                     'edgar/daily-index/2016/QTR2/form.20160411.idx'])
+
+    def test_starts_from_existing_file(self):
+        with open(utils.get_form_index_fpath(2016), 'w') as f:
+            f.write('4|Foo Corp|1234|2016-03-31|edgar/data/1234/a.txt\n')
+            f.write('4|Foo Corp|1234|2016-04-05|edgar/data/1234/b.txt\n')
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 8))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abc'])
+
+    def test_server_error_is_retried(self):
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 6))
+        self.published['edgar/daily-index/2016/QTR2/form.20160408.idx'] = \
+            _index_line('20160408', 'e')
+        response = requests.Response()
+        response.status_code = 503
+        failing = 'edgar/daily-index/2016/QTR2/form.20160407.idx'
+
+        def download(index_loc):
+            if index_loc == failing:
+                raise requests.exceptions.HTTPError('503', response=response)
+            return self._download(index_loc)
+        self.download.side_effect = download
+        self.assertRaises(requests.exceptions.HTTPError, sync_forms_index, years=[2016],
+                          today=datetime.date(2016, 4, 11))
+
+        self.published[failing] = _index_line('20160407', 'd')
+        self.download.side_effect = self._download
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 11))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abcde'])
+
+    def test_dropped_connection_writes_nothing(self):
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 6))
+        dropped = 'edgar/daily-index/2016/QTR2/form.20160407.idx'
+        self.published[dropped] = _index_line('20160407', 'd')
+
+        def download(index_loc):
+            if index_loc == dropped:
+                content = (INDEX_HEADER + self.published[index_loc]).encode('utf8')
+                return _DroppedStream(content)
+            return self._download(index_loc)
+        self.download.side_effect = download
+        self.assertRaises(requests.exceptions.ConnectionError, sync_forms_index,
+                          years=[2016], today=datetime.date(2016, 4, 7))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abc'])
+        self.assertFalse(os.path.exists(utils.get_form_index_fpath(2016) + '.part'))
+
+        self.download.side_effect = self._download
+        sync_forms_index(years=[2016], today=datetime.date(2016, 4, 7))
+        self.assertEqual(self._form_locs(), ['edgar/data/1234/{}.txt'.format(a) for a in 'abcd'])
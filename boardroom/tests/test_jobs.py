@@ -0,0 +1,64 @@
+import io
+import os
+import time
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import jobs
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        for name, value in (('DATA_DIR', self.data_dir),
+                            ('JOB_QUEUE_DB', os.path.join(self.data_dir, 'jobs.db')),
+                            ('TRADE_DB', os.path.join(self.data_dir, 'trades.db'))):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = jobs.connect_job_queue_db()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.data_dir)
+
+    def test_enqueue_dedupes_pending_jobs(self):
+        job_id = jobs.enqueue('ko', 2015, 2016, db=self.db)
+        self.assertEqual(jobs.enqueue('KO', '2015', '2016', db=self.db), job_id)
+        self.assertNotEqual(jobs.enqueue('KO', 2015, 2017, db=self.db), job_id)
+        job = jobs.get_job(job_id, db=self.db)
+        self.assertEqual((job['ticker'], job['status']), ('KO', jobs.QUEUED))
+
+    def test_claim_in_order(self):
+        first = jobs.enqueue('KO', 2015, 2016, db=self.db)
+        second = jobs.enqueue('GHDX', 2015, 2016, db=self.db)
+        self.assertEqual(jobs.claim_next(db=self.db)['id'], first)
+        self.assertEqual(jobs.get_job(first, db=self.db)['status'], jobs.RUNNING)
+        self.assertEqual(jobs.claim_next(db=self.db)['id'], second)
+        self.assertIsNone(jobs.claim_next(db=self.db))
+        # a finished job is queued again on request
+        jobs.finish(first, db=self.db)
+        self.assertNotEqual(jobs.enqueue('KO', 2015, 2016, db=self.db), first)
+
+    def test_stale_job_is_claimed_again(self):
+        job_id = jobs.enqueue('KO', 2015, 2016, db=self.db)
+        jobs.claim_next(db=self.db)
+        self.assertIsNone(jobs.claim_next(db=self.db, stale_after=60))
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(jobs.claim_next(db=self.db, stale_after=60)['id'], job_id)
+
+    @mock.patch('boardroom.jobs.run_job')
+    def test_run_worker(self, run_job):
+        run_job.side_effect = [None, ValueError('no such ticker')]
+        done = jobs.enqueue('KO', 2015, 2016, db=self.db)
+        failed = jobs.enqueue('XXXX', 2015, 2016, db=self.db)
+        self.assertEqual(jobs.run_worker(once=True, log=io.StringIO()), 2)
+        self.assertEqual(jobs.get_job(done, db=self.db)['status'], jobs.DONE)
+        job = jobs.get_job(failed, db=self.db)
+        self.assertEqual(job['status'], jobs.FAILED)
+        self.assertIn('no such ticker', job['error'])
@@ -0,0 +1,138 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import main, jobs, tradestore, tradedb, pricestore
+from boardroom.tests.test_pricestore import PRICE_DICTS
+from boardroom.tests.test_tradestore import FORMS
+from boardroom.tests.utils import TEST_DIRECTORY
+
+
+class TestApi(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        for name, value in (('TRADE_STORE_DIR', os.path.join(self.data_dir, 'trade_store')),
+                            ('STOCK_PRICE_DIR', os.path.join(self.data_dir, 'stock_price')),
+                            ('TRADE_BACKEND', 'columns'),
+                            ('DATA_DIR', self.data_dir),
+                            ('JOB_QUEUE_DB', os.path.join(self.data_dir, 'jobs.db')),
+                            ('API_GZIP_MIN_SIZE', 1)):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('boardroom.ingestdata.ticker_to_cik', return_value='1131324')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(main.app.config,
+                                  {'DATABASE': os.path.join(self.data_dir, 'trades.db')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tradestore.write_partition(2016, '1131324', FORMS)
+        pricestore.write_prices('GHDX', PRICE_DICTS)
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def test_trades_pagination(self):
+        r = self.client.get('/api/trades/ghdx?year_start=2016&per_page=1&page=2')
+        self.assertEqual(r.status_code, 200)
+        data = r.get_json()
+        self.assertEqual((data['total'], data['page'], data['missing_years']), (2, 2, []))
+        self.assertEqual([t['date'] for t in data['trades']], ['2016-12-01'])
+        self.assertEqual(self.client.get('/api/trades/ghdx?per_page=0').status_code, 400)
+
+    def test_etag(self):
+        r = self.client.get('/api/trades/ghdx?year_start=2016')
+        etag = r.headers['ETag']
+        r = self.client.get('/api/trades/ghdx?year_start=2016',
+                            headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.data, b'')
+        # the ETag changes with the data
+        os.utime(tradestore.partition_dir(2016, '1131324'), (0, 0))
+        r = self.client.get('/api/trades/ghdx?year_start=2016',
+                            headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 200)
+
+    def test_prices_gzip(self):
+        r = self.client.get('/api/prices/ghdx?start=2017-01-01',
+                            headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(r.data).decode('utf8'))
+        self.assertEqual(data['prices']['date'], ['2017-01-03', '2017-01-04'])
+        self.assertEqual(data['prices']['close'], [42.0, 42.3])
+        self.assertEqual(self.client.get('/api/prices/xxxx').status_code, 404)
+
+    def test_graph(self):
+        r = self.client.get('/api/graph/ghdx?year_start=2016&year_end=2017')
+        graph = r.get_json()
+        self.assertEqual([d['name'] for d in graph['data']], ['Close', 'Bought', 'Sold'])
+        etag = r.headers['ETag']
+        pricestore.write_prices('GHDX', PRICE_DICTS[:1])
+        os.utime(pricestore.ticker_dir('GHDX'), (1, 1))
+        r = self.client.get('/api/graph/ghdx?year_start=2016&year_end=2017',
+                            headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 200)
+
+    def test_metrics(self):
+        self.client.get('/api/graph/ghdx?year_start=2016&year_end=2017')
+        r = self.client.get('/metrics')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.headers['Content-Type'].startswith('text/plain'))
+        text = r.get_data(as_text=True)
+        self.assertIn('boardroom_render_seconds_count{view="api_graph"}', text)
+        self.assertIn('boardroom_request_seconds_count{endpoint="api_graph",status="200"}',
+                      text)
+
+    def test_joint_filing_listed_once(self):
+        form4_dict_path = os.path.join(TEST_DIRECTORY, 'data_tests', 'form4_dict.json')
+        with open(form4_dict_path, 'r') as f:
+            form = json.load(f)
+        self.assertEqual(len(form['owner']), 10)
+        tradestore.write_partition(2016, '1131324', FORMS + [form])
+        data = self.client.get('/api/trades/ghdx?year_start=2016').get_json()
+        self.assertEqual(data['total'], 2 + 7)
+        self.assertEqual(set(t['owner_index'] for t in data['trades']), {0})
+        self.assertEqual(sum(t['is_derivative'] for t in data['trades']), 1)
+
+        r = self.client.post('/', data={'ticker': 'ghdx', 'year_start': '2016',
+                                        'year_end': '2016'})
+        page = r.get_data(as_text=True)
+        self.assertEqual(page.count('<td>2016-'), 2 + 7)
+        self.assertEqual(page.count('(derivative)'), 1)
+
+    def test_page_shows_exact_share_counts(self):
+        form = json.loads(json.dumps(FORMS[0]))
+        form['nonderivative']['trades'][0]['num_shares'] = '1234567'
+        tradestore.write_partition(2016, '1131324', [form])
+        r = self.client.post('/', data={'ticker': 'ghdx', 'year_start': '2016',
+                                        'year_end': '2016'})
+        page = r.get_data(as_text=True)
+        self.assertIn('<td>1234567</td>', page)
+        self.assertIn('<td>7.25</td>', page)
+
+    def test_schema_created_once(self):
+        with mock.patch('boardroom.config.TRADE_BACKEND', 'sqlite'), \
+                mock.patch('boardroom.tradedb.connect_trade_db',
+                           wraps=tradedb.connect_trade_db) as connect:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(connect.call_count, 1)
+
+    def test_job_status(self):
+        job_id = jobs.enqueue('ghdx', 2016, 2016)
+        with mock.patch('boardroom.jobs.connect_job_queue_db',
+                        wraps=jobs.connect_job_queue_db) as connect:
+            for _ in range(3):
+                r = self.client.get('/jobs/{}'.format(job_id))
+                self.assertEqual(r.get_json()['status'], jobs.QUEUED)
+            self.assertEqual(self.client.get('/jobs/{}'.format(job_id + 1)).status_code, 404)
+        self.assertEqual(connect.call_count, 1)
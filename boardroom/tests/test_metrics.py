@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import metrics, ingestdata
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.register(metrics.Counter('test_total', 'Test counter'))
+        self.histogram = self.registry.register(
+            metrics.Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1.0)))
+
+    def test_counter(self):
+        self.counter.inc(result='hit')
+        self.counter.inc(2, result='hit')
+        self.counter.inc(result='miss')
+        self.assertEqual(self.counter.value(result='hit'), 3)
+        self.assertEqual(self.counter.value(), 0)
+
+    def test_histogram(self):
+        for value in (0.05, 0.1, 0.5, 3.0):
+            self.histogram.observe(value)
+        sample, = self.histogram.snapshot()
+        self.assertEqual(sample['buckets'], [2, 1, 1])
+        self.assertEqual(sample['count'], 4)
+        self.assertAlmostEqual(sample['sum'], 3.65)
+        with metrics.timer(self.histogram, stage='parse'):
+            pass
+        self.assertEqual(self.histogram.count(stage='parse'), 1)
+        with self.assertRaises(ValueError):
+            with metrics.timer(self.histogram, result='ok'):
+                raise ValueError('bad form')
+        self.assertEqual(self.histogram.count(result='error'), 1)
+        self.assertEqual(self.histogram.count(result='ok'), 0)
+
+    def test_prometheus_text(self):
+        self.counter.inc(result='hit')
+        self.histogram.observe(0.5, view='graph')
+        text = self.registry.prometheus_text()
+        self.assertIn('# TYPE test_total counter\ntest_total{result="hit"} 1\n', text)
+        self.assertIn('test_seconds_bucket{view="graph",le="0.1"} 0\n', text)
+        self.assertIn('test_seconds_bucket{view="graph",le="1.0"} 1\n', text)
+        self.assertIn('test_seconds_bucket{view="graph",le="+Inf"} 1\n', text)
+        self.assertIn('test_seconds_count{view="graph"} 1\n', text)
+
+    def test_merge(self):
+        self.counter.inc(5)
+        self.histogram.observe(0.5)
+        snapshot = json.loads(json.dumps(self.registry.snapshot()))
+        self.registry.merge(snapshot)
+        self.assertEqual(self.counter.value(), 10)
+        self.assertEqual(self.histogram.snapshot()[0]['buckets'], [0, 2, 0])
+
+    def test_disabled(self):
+        with mock.patch('boardroom.config.METRICS_ENABLED', False):
+            self.counter.inc()
+            self.histogram.observe(0.5)
+        self.assertEqual(self.registry.snapshot()['test_total']['samples'], [])
+        self.assertEqual(self.histogram.count(), 0)
+
+    def test_dump_json(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.counter.inc()
+        fpath = os.path.join(directory, 'metrics.json')
+        metrics.dump_json(fpath, self.registry)
+        with open(fpath, 'r') as f:
+            data = json.load(f)
+        self.assertEqual(data['metrics']['test_total']['samples'], [{'labels': {}, 'value': 1}])
+        self.assertEqual(data['forms_per_second'], 0.0)
+        # forms are counted in the registry dumped
+        parse_seconds = self.registry.register(
+            metrics.Histogram(metrics.FORM_PARSE_SECONDS.name, 'Parse seconds'))
+        parse_seconds.observe(0.01, result='ok')
+        metrics.dump_json(fpath, self.registry)
+        with open(fpath, 'r') as f:
+            self.assertGreater(json.load(f)['forms_per_second'], 0)
+
+    def test_cache_misses_are_not_reads(self):
+        metrics.REGISTRY.reset()
+        with mock.patch('boardroom.ingestdata._get_sec_form_cache',
+                        side_effect=FileNotFoundError), \
+                mock.patch('boardroom.ingestdata.download_sec_file', return_value=b'form'):
+            ingestdata.get_sec_form('edgar/data/1/1.txt')
+        self.assertEqual(metrics.FORM_CACHE_REQUESTS.value(result='miss'), 1)
+        self.assertEqual(metrics.FORM_CACHE_READ_SECONDS.count(), 0)
+        metrics.REGISTRY.reset()
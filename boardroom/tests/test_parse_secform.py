@@ -1,11 +1,19 @@
 import os
 import unittest
 import json
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
-from boardroom.parse_secform import (get_xml, _get_single_xml_element, _get_single_xml_value,
-                                     _xpath_to_value_mapping, get_trade_holdings_dict, get_transaction_dict,
-                                     get_owner_dict, get_issuer_dict, get_issuer_dict_from_xmltree, get_owner_dict_from_xmltree,
-                                     get_nonderivative_info_dict_from_xmltree, get_form_dict)
+from lxml import etree
+
+from boardroom.parse_secform import (FORM_DICT_CACHE, get_xml, get_issuer_dict_from_xmltree,
+                                     get_owner_dict_from_xmltree,
+                                     get_nonderivative_info_dict_from_xmltree,
+                                     get_derivative_info_dict_from_xmltree, get_form_dict,
+                                     parse_form, parse_form_xml, peek_header,
+                                     SUPPORTED_SCHEMA_VERSIONS)
 from boardroom.tests.utils import TEST_DIRECTORY, internet_on
 
 class TestGetFormDict(unittest.TestCase):
@@ -20,3 +28,97 @@ class TestGetFormDict(unittest.TestCase):
         output, _ = get_form_dict(form_loc)
         self.assertEqual(output, self.form4_dict)
 
+
+
+class TestParseForm(unittest.TestCase):
+    def setUp(self):
+        form4_dict_path = os.path.join(TEST_DIRECTORY, 'data_tests', 'form4_dict.json')
+        with open(form4_dict_path, 'r') as f:
+            self.form4_dict = json.load(f)
+        form4_path = os.path.join(TEST_DIRECTORY, 'data_tests', 'sample_form4.txt')
+        with open(form4_path, 'r') as f:
+            self.form4 = f.read()
+
+    def test_get_xml(self):
+        xml = get_xml(self.form4)
+        self.assertTrue(xml.startswith('<?xml version="1.0"?>'))
+        self.assertTrue(xml.endswith('</ownershipDocument>'))
+        self.assertRaises(ValueError, get_xml, 'no xml here')
+
+    def test_basic_case_form4(self):
+        self.assertEqual(parse_form(self.form4), self.form4_dict)
+
+    def test_matches_xpath_parsers(self):
+        tree = etree.fromstring(get_xml(self.form4))
+        expected = {
+            'issuer':           get_issuer_dict_from_xmltree(tree),
+            'owner':            get_owner_dict_from_xmltree(tree),
+            'nonderivative':    get_nonderivative_info_dict_from_xmltree(tree),
+            'derivative':       get_derivative_info_dict_from_xmltree(tree),
+            }
+        self.assertEqual(parse_form(self.form4), expected)
+
+    def test_derivative_table(self):
+        derivative = parse_form(self.form4)['derivative']
+        self.assertEqual(len(derivative['trades']), 1)
+        self.assertEqual(len(derivative['holdings']), 1)
+        trade = derivative['trades'][0]
+        self.assertEqual(trade['conversion_price'], '35.2')
+        self.assertEqual(trade['underlying_shares'], '10000')
+        # the exercise date is only given in a footnote
+        self.assertEqual(trade['exercise_date'], '')
+
+    def test_missing_required_field(self):
+        xml = get_xml(self.form4).replace('<issuerName>GENOMIC HEALTH INC</issuerName>', '')
+        self.assertRaises(ValueError, parse_form_xml, xml)
+
+    def test_unsupported_schema_version(self):
+        xml = get_xml(self.form4).replace('X0306', 'X0000')
+        self.assertRaises(ValueError, parse_form_xml, xml)
+
+    def test_peek_header(self):
+        self.assertEqual(peek_header(get_xml(self.form4)), ('X0306', '4'))
+        self.assertEqual(peek_header('<ownershipDocument/>'), (None, None))
+
+    def test_schema_versions(self):
+        for version in ('X0201', 'X0203', 'X0305', 'X0508'):
+            self.assertIn(version, SUPPORTED_SCHEMA_VERSIONS)
+            xml = get_xml(self.form4).replace('X0306', version)
+            self.assertEqual(parse_form_xml(xml), self.form4_dict)
+
+    def test_older_schema_optional_fields(self):
+        xml = get_xml(self.form4).replace('<issuerTradingSymbol>GHDX</issuerTradingSymbol>', '')
+        self.assertRaises(ValueError, parse_form_xml, xml)
+        form = parse_form_xml(xml.replace('X0306', 'X0201'))
+        self.assertEqual(form['issuer']['0001131324']['symbol'], '')
+
+    def test_form3_without_securities(self):
+        xml = get_xml(self.form4)
+        start = xml.index('<nonDerivativeTable>')
+        end = xml.index('</derivativeTable>') + len('</derivativeTable>')
+        xml = (xml[:start] + '<noSecuritiesOwned>1</noSecuritiesOwned>' + xml[end:]) \
+            .replace('<documentType>4</documentType>', '<documentType>3</documentType>')
+        form = parse_form_xml(xml)
+        self.assertEqual(form['nonderivative'], {'holdings': [], 'trades': []})
+        self.assertEqual(form['derivative'], {'holdings': [], 'trades': []})
+
+    def test_unsupported_form_is_not_parsed(self):
+        xml = get_xml(self.form4).replace('<documentType>4</documentType>',
+                                          '<documentType>144</documentType>')
+        with mock.patch('boardroom.parse_secform.etree.fromstring') as fromstring:
+            self.assertRaises(ValueError, parse_form_xml, xml)
+            self.assertRaises(ValueError, parse_form_xml, xml.replace('X0306', 'X0000'))
+        self.assertFalse(fromstring.called)
+
+    def test_get_form_dict_memory_cache(self):
+        form_loc = 'edgar/data/1551138/0001144204-16-074214.txt'
+        FORM_DICT_CACHE.clear()
+        with mock.patch('boardroom.ingestdata.get_sec_form',
+                        return_value=(self.form4, False)) as get_sec_form:
+            first, used_cache = get_form_dict(form_loc)
+            self.assertFalse(used_cache)
+            second, used_cache = get_form_dict(form_loc)
+            self.assertTrue(used_cache)
+        self.assertIs(first, second)
+        self.assertEqual(get_sec_form.call_count, 1)
+        FORM_DICT_CACHE.clear()
@@ -0,0 +1,86 @@
+import json
+import unittest
+
+import numpy as np
+import plotly
+
+from boardroom import plot_data, records
+
+
+def _trade(date, num_shares, code):
+    return records.Trade(records.parse_date(date), num_shares, 10.0, 100.0, 'Common Stock',
+                         'P' if code == 'A' else 'S', code, 'D', 1, 2)
+
+
+class TestDownsample(unittest.TestCase):
+    def test_keeps_extremes(self):
+        dates = np.datetime64('2000-01-01') + np.arange(10000)
+        values = np.sin(np.arange(10000) / 100.)
+        values[1234] = 5
+        values[4321] = -5
+        values[50] = np.nan
+        out_dates, out_values = plot_data.downsample_minmax(dates, values, 500)
+        self.assertLessEqual(len(out_values), 500)
+        self.assertIn(5, out_values)
+        self.assertIn(-5, out_values)
+        self.assertTrue(np.all(np.diff(out_dates.astype('i8')) > 0))
+
+    def test_short_series_unchanged(self):
+        dates = np.datetime64('2000-01-01') + np.arange(10)
+        values = np.arange(10.)
+        out_dates, out_values = plot_data.downsample_minmax(dates, values, 500)
+        self.assertEqual(out_values.tolist(), values.tolist())
+
+
+class TestBuildGraph(unittest.TestCase):
+    def setUp(self):
+        self.dates = np.datetime64('1995-01-01') + np.arange(25 * 365)
+        self.prices = np.linspace(10, 50, len(self.dates))
+        start = np.datetime64('1995-01-01')
+        trades = [_trade(str(start + i), 100, 'A' if i % 3 else 'D')
+                  for i in range(0, 25 * 365, 2)]
+        self.trades = records.TradeBatch.from_trades(trades)
+
+    def test_payload_is_bounded(self):
+        graph = plot_data.build_graph('ko', self.dates, self.prices, self.trades,
+                                      max_points=1000, max_bars=400)
+        prices, bought, sold = graph['data']
+        self.assertLessEqual(len(prices['x']), 1000)
+        self.assertLessEqual(len(bought['x']), 400)
+        self.assertEqual(bought['y'].sum() - sold['y'].sum(), 100 * len(self.trades))
+        self.assertNotIn('shapes', graph['layout'])
+        payload = json.dumps(graph, cls=plotly.utils.PlotlyJSONEncoder)
+        self.assertLess(len(payload), 100000)
+
+    def test_viewport(self):
+        graph = plot_data.build_graph('ko', self.dates, self.prices, self.trades,
+                                      date_start='2016-01-01', date_end='2016-03-31')
+        prices, bought, sold = graph['data']
+        self.assertEqual(len(prices['x']), 91)
+        # daily bars for a short range
+        self.assertEqual(str(bought['x'][0]), '2016-01-01')
+
+    def test_trade_window(self):
+        self.assertEqual(plot_data._trade_window('2016-01-01', '2016-03-31', 400), ('D', 1))
+        self.assertEqual(plot_data._trade_window('1993-01-01', '2026-12-31', 400), ('M', 3))
+        self.assertEqual(plot_data._trade_window('2016-01-01', '2016-12-31', 10), ('M', 3))
+        self.assertEqual(plot_data._trade_window('1993-01-01', '2026-12-31', 20), ('Y', 2))
+        for max_bars in (1, 2, 3, 10, 50, 400):
+            for date_start, date_end in (('1993-01-01', '2026-12-31'),
+                                         ('2015-12-31', '2016-01-01'),
+                                         ('2016-03-30', '2016-10-02')):
+                window, step = plot_data._trade_window(date_start, date_end, max_bars)
+                self.assertLessEqual(plot_data._num_windows(date_start, date_end, window,
+                                                            step), max_bars)
+
+    def test_long_history_is_bounded(self):
+        graph = plot_data.build_graph('ko', self.dates, self.prices, self.trades,
+                                      date_start='1993-01-01', date_end='2026-12-31',
+                                      max_bars=30)
+        prices, bought, sold = graph['data']
+        self.assertLessEqual(len(bought['x']), 30)
+        self.assertEqual(bought['y'].sum() - sold['y'].sum(), 100 * len(self.trades))
+
+    def test_without_trades(self):
+        graph = plot_data.build_graph('ko', (), (), [])
+        self.assertEqual(len(graph['data']), 1)
@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import numpy as np
+
+from boardroom import pricestore, ingestdata, get_stock_prices
+
+# as returned by Yahoo Finance, newest first, with a dividend entry
+PRICE_DICTS = [
+    {'date': 1483540200, 'open': 42.0, 'high': 42.5, 'low': 41.9, 'close': 42.3,
+     'volume': 1200, 'adjclose': 40.1},
+    {'date': 1483453800, 'amount': 0.35, 'type': 'DIVIDEND', 'data': 0.35},
+    {'date': 1483453800, 'open': 41.5, 'high': 42.1, 'low': 41.4, 'close': 42.0,
+     'volume': 1500, 'adjclose': 39.8},
+    {'date': 1483021800, 'open': 41.6, 'high': 41.7, 'low': 41.3, 'close': None,
+     'volume': None},
+    {'date': 1482935400, 'open': 41.4, 'high': 41.9, 'low': 41.2, 'close': 41.6,
+     'volume': None},
+    ]
+
+
+class TestPriceStore(unittest.TestCase):
+    def setUp(self):
+        self.price_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.STOCK_PRICE_DIR', self.price_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.price_dir)
+
+    def test_round_trip(self):
+        self.assertEqual(pricestore.write_prices('ko', PRICE_DICTS), 3)
+        self.assertTrue(pricestore.has_prices('KO'))
+        columns = pricestore.read_prices('KO')
+        self.assertIsInstance(columns['close'], np.memmap)
+        self.assertEqual(np.datetime_as_string(columns['date']).tolist(),
+                         ['2016-12-28', '2017-01-03', '2017-01-04'])
+        self.assertEqual(columns['close'].tolist(), [41.6, 42.0, 42.3])
+        self.assertEqual(columns['volume'].tolist(), [0, 1500, 1200])
+
+    def test_slice_by_date(self):
+        pricestore.write_prices('KO', PRICE_DICTS)
+        columns = pricestore.read_prices('KO')
+        sliced = pricestore.slice_by_date(columns, '2017-01-01', '2017-01-03')
+        self.assertEqual(sliced['close'].tolist(), [42.0])
+        self.assertTrue(np.shares_memory(sliced['close'], columns['close']))
+        self.assertEqual(len(pricestore.slice_by_date(columns, None, '2016-12-28')['date']), 1)
+        self.assertEqual(len(pricestore.slice_by_date(columns, '2018-01-01')['date']), 0)
+
+    def test_legacy_json_is_copied(self):
+        with open(os.path.join(self.price_dir, 'KO.json'), 'w') as f:
+            json.dump(PRICE_DICTS, f)
+        dates, prices = get_stock_prices.get_stock_price_timeseries('ko', allow_download=False,
+                                                                    date_start='2017-01-04')
+        self.assertEqual(prices.tolist(), [42.3])
+        self.assertTrue(pricestore.has_prices('KO'))
+        self.assertEqual(ingestdata.get_stock_price_dicts('KO')[0]['date'], '2016-12-28')
+
+    def test_missing_without_download(self):
+        self.assertRaises(FileNotFoundError, get_stock_prices.get_stock_price_timeseries, 'KO',
+                          allow_download=False)
+
+
+class TestRefreshStockPrices(unittest.TestCase):
+    def setUp(self):
+        self.price_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.STOCK_PRICE_DIR', self.price_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.price_dir)
+
+    def test_merge_prices(self):
+        pricestore.write_prices('KO', PRICE_DICTS[2:])
+        # the last stored day is replaced, one day is added
+        new = [dict(PRICE_DICTS[2], close=42.1), PRICE_DICTS[0]]
+        self.assertEqual(pricestore.merge_prices('KO', new), 1)
+        self.assertEqual(pricestore.read_prices('KO')['close'].tolist(), [41.6, 42.1, 42.3])
+
+    @mock.patch('boardroom.ingestdata.parse_stock_prices_yahoo', side_effect=lambda c: c)
+    @mock.patch('boardroom.ingestdata.download_stock_prices_yahoo_page')
+    def test_refresh_fetches_only_new_days(self, download, _):
+        download.side_effect = lambda ticker, date_range=None: \
+            PRICE_DICTS[2:] if date_range is None else PRICE_DICTS[:3]
+        self.assertEqual(ingestdata.refresh_stock_prices('KO'), 2)
+        download.assert_called_with('KO')
+        self.assertEqual(ingestdata.refresh_stock_prices('KO'), 1)
+        self.assertEqual(download.call_args[0][1][0], '2017-01-03')
+        self.assertEqual(pricestore.tickers(), ['KO'])
+
+    def test_rewrite_leaves_one_ticker_dir(self):
+        pricestore.merge_prices('KO', PRICE_DICTS[2:])
+        pricestore.merge_prices('KO', PRICE_DICTS[:2])
+        self.assertEqual(os.listdir(self.price_dir), ['KO'])
+        os.makedirs(os.path.join(self.price_dir, 'PEP.old'))
+        self.assertEqual(pricestore.tickers(), ['KO'])
+
+    @mock.patch('boardroom.ingestdata.refresh_stock_prices')
+    def test_refresh_many(self, refresh):
+        def _refresh(ticker, provider):
+            if ticker != 'KO':
+                raise ValueError('no prices')
+            return 0
+        refresh.side_effect = _refresh
+        with mock.patch('sys.stdout'):
+            results = ingestdata.refresh_stock_prices_many(
+                ['KO', 'XXXX'], max_workers=2, provider=ingestdata.YahooPriceProvider())
+        self.assertEqual(results, {'KO': 0, 'XXXX': None})
+
+
+PRICE_CSV = """date,symbol,open,high,low,close,volume
+2017-01-04,KO,42.0,42.5,41.9,42.3,1200
+2017-01-03,KO,41.5,42.1,41.4,42.0,1500
+2017-01-03,"GE",31.0,31.5,30.9,,
+2017-01-04,GE,31.6,31.9,31.2,31.8,900
+2016-12-28,KO,41.4,41.9,41.2,41.6,
+"""
+
+
+class TestPriceProviders(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.STOCK_PRICE_DIR',
+                             os.path.join(self.tmpdir, 'stock_price'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with open(os.path.join(self.tmpdir, 'eod.csv'), 'w') as f:
+            f.write(PRICE_CSV)
+        column_map = {name: name for name in ('date', 'open', 'high', 'low', 'close',
+                                              'volume')}
+        column_map['ticker'] = 'symbol'
+        self.provider = ingestdata.FilePriceProvider(os.path.join(self.tmpdir, '*.csv'),
+                                                     column_map)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_yahoo_page(self):
+        content = ('<script>root.App.main = {"HistoricalPriceStore":{"prices":' +
+                   json.dumps(PRICE_DICTS) + ',"isPending":false}}</script>').encode('utf8')
+        self.assertEqual(ingestdata.parse_stock_prices_yahoo(content), PRICE_DICTS)
+        self.assertRaises(ValueError, ingestdata.parse_stock_prices_yahoo, b'<html></html>')
+
+    def test_file_provider(self):
+        prices = self.provider.get_prices('ko')
+        self.assertEqual(np.datetime_as_string(prices['date']).tolist(),
+                         ['2016-12-28', '2017-01-03', '2017-01-04'])
+        self.assertEqual(prices['volume'].tolist(), [0, 1500, 1200])
+        prices = self.provider.get_prices('GE', np.datetime64('2017-01-01'))
+        self.assertEqual(prices['close'].tolist(), [31.8])
+        self.assertRaises(ValueError, self.provider.get_prices, 'XXXX')
+
+    def test_bulk_refresh(self):
+        results = ingestdata.refresh_stock_prices_many(provider=self.provider)
+        self.assertEqual(results, {'GE': 1, 'KO': 3})
+        results = ingestdata.refresh_stock_prices_many(['KO', 'XXXX'], provider=self.provider)
+        self.assertEqual(results, {'KO': 0, 'XXXX': None})
+        self.assertEqual(pricestore.read_prices('KO')['close'].tolist(), [41.6, 42.0, 42.3])
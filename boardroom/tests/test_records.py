@@ -0,0 +1,86 @@
+import sys
+import math
+import unittest
+
+from boardroom import records
+
+
+def _trade_dict(date, num_shares, price='12.5'):
+    return {'sec_type': 'Common Stock', 'date': date, 'transaction_code': 'P',
+            'num_shares': num_shares, 'price_per_share': price,
+            'acquired_disposed_code': 'A', 'shares_owned_after': '1000',
+            'direct_or_indirect': 'D'}
+
+
+FORM = {
+    'issuer': {'0001131324': {'cik': '0001131324', 'name': 'GENOMIC HEALTH INC',
+                              'symbol': 'GHDX'}},
+    'owner': {'0001087940': {'cik': '0001087940', 'name': 'BAKER FELIX'}},
+    'nonderivative': {'holdings': [], 'trades': [_trade_dict('2016-11-30', '200'),
+                                                 _trade_dict('2016-12-01-05:00', '7.25', ''),
+                                                 _trade_dict('', '3')]}}
+
+
+class TestTrade(unittest.TestCase):
+    def test_from_dict(self):
+        trade = list(records.trades_from_form(FORM))[0]
+        self.assertEqual(trade.date, 17135)
+        self.assertEqual(trade.isodate, '2016-11-30')
+        self.assertEqual(trade.num_shares, 200.0)
+        self.assertEqual(trade.issuer_cik, 1131324)
+        self.assertEqual(trade.insider_cik, 1087940)
+        self.assertFalse(hasattr(trade, '__dict__'))
+
+    def test_missing_values(self):
+        trades = list(records.trades_from_form(FORM))
+        self.assertTrue(math.isnan(trades[1].price_per_share))
+        self.assertIsNone(trades[2].date)
+        self.assertIsNone(trades[2].isodate)
+
+    def test_to_dict(self):
+        trade = list(records.trades_from_form(FORM))[1]
+        expected = _trade_dict('2016-12-01', '7.25', None)
+        expected.update(issuer_cik='0001131324', insider_cik='0001087940',
+                        conversion_price=None, underlying_shares=None, is_derivative=False,
+                        owner_index=0)
+        self.assertEqual(trade.to_dict(), expected)
+
+    def test_num_shares_display(self):
+        trades = list(records.trades_from_form(FORM))
+        self.assertEqual([t.num_shares_display for t in trades], ['200', '7.25', '3'])
+        trades[0].num_shares = float('nan')
+        self.assertEqual(trades[0].num_shares_display, '')
+
+    def test_every_owner_and_derivatives(self):
+        form = dict(FORM, owner={'0001087940': {}, '0001551138': {}}, derivative={
+            'holdings': [], 'trades': [dict(_trade_dict('2016-11-30', '10000'),
+                                            conversion_price='35.2',
+                                            underlying_shares='10000')]})
+        trades = list(records.trades_from_form(form))
+        self.assertEqual([(t.insider_cik, t.owner_index, t.is_derivative) for t in trades],
+                         [(1087940, 0, False)] * 3 + [(1087940, 0, True)] +
+                         [(1551138, 1, False)] * 3 + [(1551138, 1, True)])
+        self.assertEqual(trades[3].conversion_price, 35.2)
+        self.assertTrue(math.isnan(trades[0].conversion_price))
+        batch = records.TradeBatch.from_trades(trades)
+        self.assertEqual(list(batch), trades)
+
+    def test_smaller_than_dict(self):
+        trade = list(records.trades_from_form(FORM))[0]
+        as_dict = FORM['nonderivative']['trades'][0]
+        self.assertLess(sys.getsizeof(trade), sys.getsizeof(as_dict))
+
+
+class TestTradeBatch(unittest.TestCase):
+    def test_round_trip(self):
+        trades = list(records.trades_from_form(FORM))
+        batch = records.TradeBatch.from_trades(trades)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(str(batch.columns['date'].dtype), 'datetime64[D]')
+        self.assertEqual(list(batch), trades)
+        self.assertEqual(batch.to_dicts(), [t.to_dict() for t in trades])
+
+    def test_empty(self):
+        batch = records.TradeBatch.from_trades([])
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(list(batch), [])
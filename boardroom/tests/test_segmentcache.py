@@ -0,0 +1,107 @@
+import os
+import shutil
+import multiprocessing
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import segmentcache, ingestdata, utils
+
+
+def _put_forms(directory, forms):
+    cache = segmentcache.SegmentCache(directory, segment_size=2000)
+    for form_loc, content in forms:
+        cache.put(form_loc, content)
+    cache.close()
+
+
+class TestSegmentCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = segmentcache.SegmentCache(self.directory, segment_size=20)
+        self.forms = {'edgar/data/1/{}.txt'.format(i): ('form {} '.format(i) * 50).encode('utf8')
+                      for i in range(10)}
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        for form_loc, content in self.forms.items():
+            self.cache.put(form_loc, content)
+        for form_loc, content in self.forms.items():
+            self.assertIn(form_loc, self.cache)
+            self.assertEqual(self.cache.get(form_loc), content)
+        self.assertEqual(list(self.cache.iter_form_locs()), sorted(self.forms))
+        segments = [f for f in os.listdir(self.directory) if f.startswith('segment-')]
+        self.assertGreater(len(segments), 1)
+
+    def test_missing(self):
+        self.assertNotIn('edgar/data/1/missing.txt', self.cache)
+        self.assertRaises(KeyError, self.cache.get, 'edgar/data/1/missing.txt')
+
+    def test_reopen(self):
+        for form_loc, content in self.forms.items():
+            self.cache.put(form_loc, content)
+        self.cache.close()
+        self.cache = segmentcache.SegmentCache(self.directory, segment_size=20)
+        self.cache.put('edgar/data/2/new.txt', b'new form')
+        for form_loc, content in self.forms.items():
+            self.assertEqual(self.cache.get(form_loc), content)
+        self.assertEqual(self.cache.get('edgar/data/2/new.txt'), b'new form')
+
+    @unittest.skipIf(segmentcache.fcntl is None, 'requires fcntl')
+    def test_concurrent_writers(self):
+        forms = [('edgar/data/{}/{}.txt'.format(p, i), ('form {} {} '.format(p, i) * 40)
+                  .encode('utf8')) for p in range(4) for i in range(50)]
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_put_forms, args=(self.directory, forms[p::4]))
+                     for p in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        for form_loc, content in forms:
+            self.assertEqual(self.cache.get(form_loc), content)
+
+    def test_pack_file_cache(self):
+        file_cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, file_cache_dir)
+        for form_loc, content in self.forms.items():
+            outpath = os.path.join(file_cache_dir, form_loc)
+            utils.makedirs(os.path.dirname(outpath))
+            utils.save_file(outpath, content)
+        self.assertEqual(segmentcache.pack_file_cache(self.cache, file_cache_dir), 10)
+        self.assertEqual(segmentcache.pack_file_cache(self.cache, file_cache_dir), 0)
+        for form_loc, content in self.forms.items():
+            self.assertEqual(self.cache.get(form_loc), content)
+
+
+class TestSegmentCacheBackend(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, value in (('FORM_CACHE_BACKEND', 'segments'),
+                            ('FORM_SEGMENT_CACHE_DIR', self.directory),
+                            ('FORM_SEARCH_INDEX', False)):
+            patcher = mock.patch('boardroom.config.' + name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('boardroom.ingestdata._segment_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        ingestdata._get_segment_cache().close()
+        shutil.rmtree(self.directory)
+
+    def test_save_and_get(self):
+        form_loc = 'edgar/data/1551138/0001144204-16-074214.txt'
+        self.assertRaises(FileNotFoundError, ingestdata._get_sec_form_cache, form_loc)
+        ingestdata._save_sec_form_cache(form_loc, u'form é'.encode('utf8'))
+        self.assertEqual(ingestdata._get_sec_form_cache(form_loc), u'form é')
+        self.assertEqual(list(ingestdata._iter_sec_form_cache()), [form_loc])
+
@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from boardroom import tradedb
+from boardroom.tests.utils import TEST_DIRECTORY
+
+
+def _load_form4():
+    with open(os.path.join(TEST_DIRECTORY, 'data_tests', 'form4_dict.json'), 'r') as f:
+        return json.load(f)
+
+
+def _form(trades, owner_cik='0001087940'):
+    return {'issuer': {'0001131324': {'cik': '0001131324', 'name': 'GENOMIC HEALTH INC',
+                                      'symbol': 'GHDX'}},
+            'owner': {owner_cik: {'cik': owner_cik, 'name': 'BAKER FELIX'}},
+            'nonderivative': {'holdings': [], 'trades': trades}}
+
+
+def _trade(date, code='P', num_shares='100'):
+    return {'sec_type': 'Common Stock', 'date': date, 'transaction_code': code,
+            'num_shares': num_shares, 'price_per_share': None,
+            'acquired_disposed_code': 'A', 'shares_owned_after': '1000',
+            'direct_or_indirect': 'D'}
+
+
+FORM_ITEMS = [
+    ('edgar/data/1131324/1.txt', _form([_trade('2015-12-30'), _trade('2016-01-04', 'S')])),
+    ('edgar/data/1131324/2.txt', _form([_trade('2016-06-01', 'A')], '0001551138')),
+    ]
+
+
+class TestTradeDb(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = tradedb.connect_trade_db(os.path.join(self.tmpdir, 'trades.db'))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_and_read_partition(self):
+        self.assertFalse(tradedb.has_partition(2016, 1131324, self.db))
+        self.assertEqual(tradedb.write_partition(2016, '1131324', FORM_ITEMS, self.db), 3)
+        self.assertTrue(tradedb.has_partition(2016, '0001131324', self.db))
+        # years are those of the form index partition, not of the trade dates
+        trades = tradedb.read_trade_batch('1131324', 2016, 2016, self.db)
+        self.assertEqual([t.isodate for t in trades], ['2015-12-30', '2016-01-04', '2016-06-01'])
+        self.assertEqual(len(tradedb.read_trade_batch('1131324', 2015, 2015, self.db)), 0)
+        trade = trades[1].to_dict()
+        self.assertEqual(trade['num_shares'], '100')
+        self.assertIsNone(trade['price_per_share'])
+        self.assertEqual(trade['insider_cik'], '0001087940')
+
+    def test_rewrite_partition_replaces_trades(self):
+        tradedb.write_partition(2016, '1131324', FORM_ITEMS, self.db)
+        tradedb.write_partition(2016, '1131324', FORM_ITEMS[:1], self.db)
+        self.assertEqual(len(tradedb.query_trades(issuer_cik=1131324, db=self.db)), 2)
+
+    def test_query_filters(self):
+        tradedb.load_forms(FORM_ITEMS, self.db, batch_size=1)
+        trades = tradedb.query_trades(issuer_cik=1131324, transaction_codes=('P', 'S'),
+                                      db=self.db)
+        self.assertEqual([t.transaction_code for t in trades], ['P', 'S'])
+        trades = tradedb.query_trades(insider_cik=1551138, db=self.db)
+        self.assertEqual([t.isodate for t in trades], ['2016-06-01'])
+        trades = tradedb.query_trades(issuer_cik=1131324, date_start='2016-01-01',
+                                      date_end='2016-05-31', db=self.db)
+        self.assertEqual([t.isodate for t in trades], ['2016-01-04'])
+        self.assertEqual(len(tradedb.query_trades(issuer_cik=1, db=self.db)), 0)
+
+    def test_insider_index(self):
+        form = _form([_trade('2016-03-01')], '0001551138')
+        form['issuer'] = {'0000320193': {'cik': '0000320193', 'name': 'APPLE INC',
+                                         'symbol': 'AAPL'}}
+        form['owner']['0001551138']['is_director'] = '1'
+        tradedb.write_partition(2016, '1131324', FORM_ITEMS, self.db)
+        tradedb.write_owner_index(2016, '320193', [('edgar/data/320193/1.txt', form)], self.db)
+        filings = tradedb.owner_filings(1551138, self.db, 2016, 2016)
+        self.assertEqual([f['form_loc'] for f in filings],
+                         ['edgar/data/1131324/2.txt', 'edgar/data/320193/1.txt'])
+        self.assertEqual(tradedb.owner_partitions(1551138, db=self.db),
+                         [(2016, 320193), (2016, 1131324)])
+        issuers = tradedb.insider_issuers(1551138, self.db)
+        self.assertEqual([(i['ticker'], i['is_director']) for i in issuers],
+                         [('AAPL', True), ('GHDX', False)])
+        self.assertEqual(tradedb.owner_filings(1551138, self.db, 2017, 2017), [])
+        # rewriting a partition replaces its index entries
+        tradedb.write_partition(2016, '1131324', FORM_ITEMS[:1], self.db)
+        self.assertEqual(len(tradedb.owner_filings(1551138, db=self.db)), 1)
+
+    def test_migrate_old_database(self):
+        fpath = os.path.join(self.tmpdir, 'old.db')
+        db = tradedb.sqlite3.connect(fpath)
+        db.execute('create table trade (id integer primary key, form_loc text, date text, '
+                   'issuer_cik integer, insider_cik integer)')
+        db.close()
+        db = tradedb.connect_trade_db(fpath)
+        columns = [row[1] for row in db.execute('pragma table_info(trade)')]
+        db.close()
+        self.assertIn('owner_index', columns)
+
+    def test_load_bulk_parse_output(self):
+        lines = [json.dumps({'form_loc': 'edgar/data/1131324/3.txt', 'form': _load_form4()}),
+                 json.dumps({'form_loc': 'edgar/data/1131324/4.txt', 'error': 'bad form'})]
+        num_trades = tradedb.load_forms(tradedb.bulk_parse_items_iter(lines), self.db)
+        # 6 stock and 1 option trades, filed jointly by 10 owners
+        self.assertEqual(num_trades, 70)
+        trades = tradedb.query_trades(insider_cik=1551138, db=self.db)
+        self.assertEqual(len(trades), 7)
+        self.assertEqual(trades.columns['is_derivative'].sum(), 1)
+        self.assertEqual(set(trades.columns['owner_index'].tolist()), {1})
+        trades = tradedb.query_trades(issuer_cik=1131324, first_owner_only=True, db=self.db)
+        self.assertEqual(len(trades), 7)
+        num_insiders = self.db.execute('select count(*) from insider').fetchone()[0]
+        self.assertEqual(num_insiders, 10)
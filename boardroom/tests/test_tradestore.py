@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from boardroom import tradestore
+
+
+def _trade(date, num_shares, code='A'):
+    return {'sec_type': 'Common Stock', 'date': date, 'transaction_code': 'P',
+            'num_shares': num_shares, 'price_per_share': '12.5',
+            'acquired_disposed_code': code, 'shares_owned_after': '1000',
+            'direct_or_indirect': 'D'}
+
+
+FORMS = [
+    {'issuer': {'0001131324': {'cik': '0001131324', 'name': 'GENOMIC HEALTH INC',
+                               'symbol': 'GHDX'}},
+     'owner': {'0001087940': {'cik': '0001087940', 'name': 'BAKER FELIX'}},
+     'nonderivative': {'holdings': [], 'trades': [_trade('2016-11-30', '200'),
+                                                  _trade('2016-12-01-05:00', '7.25', 'D')]}},
+    {'issuer': {'0001131324': {'cik': '0001131324', 'name': 'GENOMIC HEALTH INC',
+                               'symbol': 'GHDX'}},
+     'owner': {'0001551138': {'cik': '0001551138', 'name': '14159, L.P.'}},
+     'nonderivative': {'holdings': [], 'trades': []}},
+    ]
+
+
+class TestTradeStore(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.TRADE_STORE_DIR', self.store_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir)
+
+    def test_round_trip(self):
+        num_trades = tradestore.write_partition(2016, '1131324', FORMS)
+        self.assertEqual(num_trades, 2)
+        self.assertTrue(tradestore.has_partition(2016, '0001131324'))
+        trades = tradestore.columns_to_trade_dicts(tradestore.read_trades('1131324', 2015, 2017))
+        expected = _trade('2016-11-30', '200')
+        expected.update({'price_per_share': '12.5', 'issuer_cik': '0001131324',
+                         'insider_cik': '0001087940', 'conversion_price': None,
+                         'underlying_shares': None, 'is_derivative': False,
+                         'owner_index': 0})
+        self.assertEqual(trades[0], expected)
+        self.assertEqual(trades[1]['date'], '2016-12-01')
+        self.assertEqual(trades[1]['num_shares'], '7.25')
+
+    def test_read_selected_columns(self):
+        tradestore.write_partition(2016, '1131324', FORMS)
+        columns = tradestore.read_trades('1131324', 2016, 2016, columns=('num_shares',))
+        self.assertEqual(list(columns), ['num_shares'])
+        self.assertEqual(columns['num_shares'].tolist(), [200.0, 7.25])
+
+    def test_owners_and_issuers(self):
+        tradestore.write_partition(2016, '1131324', FORMS)
+        self.assertEqual(sorted(tradestore.read_owners(2016, '1131324')),
+                         ['0001087940', '0001551138'])
+        self.assertIn('0001131324', tradestore.read_issuers(2016, '1131324'))
+
+    def test_partition_without_new_columns(self):
+        tradestore.write_partition(2016, '1131324', FORMS)
+        os.remove(os.path.join(tradestore.partition_dir(2016, '1131324'), 'owner_index.npy'))
+        columns = tradestore.read_trades('1131324', 2016, 2016)
+        self.assertEqual(columns['owner_index'].tolist(), [0, 0])
+
+    def test_missing_partitions(self):
+        columns = tradestore.read_trades('1131324', 2010, 2011)
+        self.assertEqual(tradestore.columns_to_trade_dicts(columns), [])
+
@@ -0,0 +1,89 @@
+import io
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import requests
+
+from boardroom import transport
+
+
+def _response(status_code, headers=None):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(b'')
+    response.headers.update(headers or {})
+    return response
+
+
+class TestRetryAfterSeconds(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(transport.retry_after_seconds(_response(503, {'Retry-After': '7'})), 7)
+
+    def test_http_date_in_past(self):
+        response = _response(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(transport.retry_after_seconds(response), 0)
+
+    def test_missing_or_bad(self):
+        self.assertIsNone(transport.retry_after_seconds(_response(503)))
+        self.assertIsNone(transport.retry_after_seconds(_response(503, {'Retry-After': 'soon'})))
+
+
+class TestBackoffDelay(unittest.TestCase):
+    def test_bounds(self):
+        for attempt in range(10):
+            delay = transport.backoff_delay(attempt, backoff_factor=0.5, backoff_max=8)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8, 0.5 * 2 ** attempt))
+
+
+class TestGet(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        patcher = mock.patch('boardroom.transport.get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep_patcher = mock.patch('boardroom.transport.time.sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_retries_and_honors_retry_after(self):
+        self.session.get.side_effect = [_response(503, {'Retry-After': '3'}), _response(200)]
+        response = transport.get('https://www.sec.gov/', backoff_factor=0.01)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.get.call_count, 2)
+        self.sleep.assert_called_once_with(3)
+
+    def test_connection_error_raised_after_last_attempt(self):
+        self.session.get.side_effect = requests.exceptions.ConnectionError('down')
+        self.assertRaises(requests.exceptions.ConnectionError, transport.get,
+                          'https://www.sec.gov/', num_retries=3)
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_client_error_not_retried(self):
+        self.session.get.return_value = _response(403)
+        self.assertRaises(requests.exceptions.HTTPError, transport.get, 'https://www.sec.gov/')
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_accepted_status_returned(self):
+        self.session.get.return_value = _response(404)
+        response = transport.get('https://www.sec.gov/', accept_status_codes=(200, 404))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestNewSession(unittest.TestCase):
+    def test_user_agent(self):
+        with mock.patch('boardroom.config.HTTP_USER_AGENT', 'Jane Doe jane@example.org'), \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            session = transport.new_session()
+        self.assertEqual(session.headers['User-Agent'], 'Jane Doe jane@example.org')
+        self.assertEqual(stderr.getvalue(), '')
+
+    def test_warns_without_user_agent(self):
+        with mock.patch('boardroom.config.HTTP_USER_AGENT',
+                        transport.config.DEFAULT_HTTP_USER_AGENT), \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            transport.new_session()
+        self.assertIn('BOARDROOM_USER_AGENT', stderr.getvalue())
@@ -1,6 +1,13 @@
 import os
 import unittest
 import json
+import time
+import shutil
+import tempfile
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 from boardroom import utils
 from boardroom.tests.utils import TEST_DIRECTORY
@@ -51,3 +58,113 @@ class TestSilentremove(unittest.TestCase):
         utils.silentremove(self.tmpfile)
         self.assertFalse(os.path.exists(self.tmpfile))
 
+
+
+class TestReplaceDir(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.directory, 'new')
+        self.dstdir = os.path.join(self.directory, 'dst')
+        for dirpath, content in ((self.srcdir, 'new'), (self.dstdir, 'old')):
+            os.makedirs(dirpath)
+            with open(os.path.join(dirpath, 'f.txt'), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _content(self):
+        with open(os.path.join(self.dstdir, 'f.txt')) as f:
+            return f.read()
+
+    def test_replace(self):
+        utils.replace_dir(self.srcdir, self.dstdir)
+        self.assertEqual(self._content(), 'new')
+        self.assertEqual(os.listdir(self.directory), ['dst'])
+
+    def test_new_directory(self):
+        shutil.rmtree(self.dstdir)
+        utils.replace_dir(self.srcdir, self.dstdir)
+        self.assertEqual(self._content(), 'new')
+
+    def test_failed_rename_keeps_old(self):
+        rename = os.rename
+
+        def failing_rename(src, dst):
+            if src == self.srcdir:
+                raise OSError('rename failed')
+            rename(src, dst)
+        with mock.patch('os.rename', side_effect=failing_rename):
+            self.assertRaises(OSError, utils.replace_dir, self.srcdir, self.dstdir)
+        self.assertEqual(self._content(), 'old')
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_within_capacity(self):
+        bucket = utils.TokenBucket(rate=5)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_rate_limited(self):
+        bucket = utils.TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+
+class TestFormLocIter(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        patcher = mock.patch('boardroom.config.FORM_INDEX_DIR', self.index_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sample = os.path.join(TEST_DIRECTORY, 'data_tests', 'sample_formindex_output345.csv')
+        shutil.copy(sample, utils.get_form_index_fpath(2016))
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def _scan(self, cik):
+        return [row for row in utils.form_loc_iter(2016) if row[2] == cik]
+
+    def test_indexed_lookup_matches_scan(self):
+        utils.build_form_index_db(2016)
+        for cik in ('1551138', '1671019', '0'):
+            self.assertEqual(list(utils.form_loc_iter(2016, cik=cik)), self._scan(cik))
+        self.assertGreater(len(self._scan('1551138')), 0)
+
+    def test_lookup_without_index(self):
+        self.assertIsNone(utils._form_index_db_rows(2016, '1551138'))
+        self.assertEqual(list(utils.form_loc_iter(2016, cik='1551138')), self._scan('1551138'))
+
+    def test_stale_index_not_used(self):
+        utils.build_form_index_db(2016)
+        with open(utils.get_form_index_fpath(2016), 'a') as f:
+            f.write('4|14159, L.P.|1551138|2016-12-30|edgar/data/1551138/new.txt\n')
+        self.assertIsNone(utils._form_index_db_rows(2016, '1551138'))
+        self.assertEqual(list(utils.form_loc_iter(2016, cik='1551138'))[-1][4],
+                         'edgar/data/1551138/new.txt')
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = utils.LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2})
+
+    def test_ttl(self):
+        cache = utils.LRUCache(maxsize=2, ttl=0.05)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.06)
+        self.assertEqual(cache.get('a', 'expired'), 'expired')
+        self.assertEqual(len(cache), 0)
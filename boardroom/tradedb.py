@@ -0,0 +1,413 @@
+"""
+SQLite database of issuers, insiders, filings and trades parsed from SEC forms.
+
+The schema is ``schema.sql``.  Forms are loaded in large transactions with ``executemany``,
+either per form index partition at ingest (see ``get_trades.ingest_trades`` with
+``config.TRADE_BACKEND = 'sqlite'``) or from the output of ``boardroom.bulk_parse``::
+
+    python -m boardroom.tradedb load forms.jsonl
+
+    # index the owners of the partitions stored before the insider index existed
+    python -m boardroom.tradedb index-owners
+
+Queries filter by issuer, insider, trade date and transaction code in SQL, using the
+indexes on (issuer_cik, date) and insider_cik.  ``read_trade_batch`` reads the trades of
+ingested partitions, by form index year and CIK, so that it returns the same trades as
+``tradestore.read_trade_batch``.
+
+Functions take an open connection: callers open one per command or request with
+``get_trade_db``, which creates the schema once per process, and close it when done.
+
+The ``filing_owner`` table indexes the filings by reporting owner, so the filings and
+issuers of an insider are found without reading the form index or parsing forms.  It is
+written at every ingest, also with the column store backend (see ``write_owner_index``).
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import itertools
+from contextlib import closing
+
+import numpy as np
+
+from boardroom import config, utils, records
+
+SCHEMA_FPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+INSIDER_FIELDS = ('cik', 'name', 'addr1', 'addr2', 'city', 'state', 'zipcode', 'is_officer',
+                  'is_director', 'is_ten_percent_owner', 'is_other_exec_type')
+ROLE_FIELDS = INSIDER_FIELDS[7:]
+# Columns added to the trade table after it was first created: name -> definition
+TRADE_MIGRATIONS = (
+    ('conversion_price',    'real'),
+    ('underlying_shares',   'real'),
+    ('is_derivative',       'integer not null default 0'),
+    ('owner_index',         'integer not null default 0'),
+    )
+# databases whose schema was created or migrated by this process, see get_trade_db
+_initialized_dbs = set()
+
+
+def open_trade_db(fpath=None):
+    """
+    Connects to the existing trade database, ``config.TRADE_DB`` by default, without
+    checking its schema, e.g. once per web request.  See ``connect_trade_db``.
+    """
+    db = sqlite3.connect(fpath or config.TRADE_DB, timeout=30)
+    db.execute('pragma foreign_keys=on')
+    return db
+
+
+def connect_trade_db(fpath=None):
+    """Connects to the trade database, ``config.TRADE_DB`` by default, creating it if needed."""
+    fpath = fpath or config.TRADE_DB
+    utils.makedirs(os.path.dirname(fpath))
+    db = open_trade_db(fpath)
+    # the journal mode is kept in the database file, for every later connection
+    db.execute('pragma journal_mode=wal')
+    with open(SCHEMA_FPATH, 'r') as f:
+        db.executescript(f.read())
+    _migrate(db)
+    return db
+
+
+def get_trade_db(fpath=None):
+    """
+    Connects to the trade database, ``config.TRADE_DB`` by default.  It is created or
+    migrated with ``connect_trade_db`` on the first connection of the process only.
+    """
+    fpath = fpath or config.TRADE_DB
+    if fpath not in _initialized_dbs:
+        connect_trade_db(fpath).close()
+        _initialized_dbs.add(fpath)
+    return open_trade_db(fpath)
+
+
+def _migrate(db):
+    """
+    Adds the columns of ``TRADE_MIGRATIONS`` missing from a database created before them,
+    and lists the filings ingested before ``partition_filing`` existed in their partition.
+    """
+    existing = set(row[1] for row in db.execute('pragma table_info(trade)'))
+    with db:
+        for name, definition in TRADE_MIGRATIONS:
+            if name not in existing:
+                db.execute('alter table trade add column {} {}'.format(name, definition))
+        if db.execute('select 1 from partition_filing limit 1').fetchone() is None:
+            db.execute('insert into partition_filing select year, index_cik, rowid, form_loc '
+                       'from filing where year is not null')
+
+
+def _rows(form_items, year=None, index_cik=None, with_trades=True):
+    issuers, insiders, owners, filings, trades = [], [], [], [], []
+    for form_loc, form in form_items:
+        for cik, issuer in form['issuer'].items():
+            issuers.append((int(cik), issuer['name'] or '', issuer['symbol']))
+        issuer_cik = int(next(iter(form['issuer'])))
+        for owner_index, (cik, owner) in enumerate(form['owner'].items()):
+            insiders.append((int(cik), owner['name'] or '') +
+                            tuple(owner.get(field) for field in INSIDER_FIELDS[2:]))
+            owners.append((form_loc, year, index_cik, issuer_cik, int(cik), owner_index) +
+                          tuple(owner.get(field) for field in ROLE_FIELDS))
+        if not with_trades:
+            continue
+        # the filing is listed under its first owner, its trades under every owner
+        filings.append((form_loc, year, index_cik, issuer_cik, int(next(iter(form['owner'])))))
+        trades.extend((form_loc, t.isodate, t.num_shares, t.price_per_share, t.sec_type,
+                       t.direct_or_indirect, t.acquired_disposed_code, t.transaction_code,
+                       t.shares_owned_after, t.issuer_cik, t.insider_cik, t.conversion_price,
+                       t.underlying_shares, t.is_derivative, t.owner_index)
+                      for t in records.trades_from_form(form))
+    return issuers, insiders, owners, filings, trades
+
+
+def _insert_owners(db, issuers, insiders, owners):
+    db.executemany('insert or replace into issuer values (?, ?, ?)', issuers)
+    db.executemany('insert or replace into insider values ({})'.format(
+        ', '.join('?' * len(INSIDER_FIELDS))), insiders)
+    db.executemany('delete from filing_owner where form_loc = ?',
+                   sorted(set((o[0],) for o in owners)))
+    db.executemany('insert or replace into filing_owner values ({})'.format(
+        ', '.join('?' * (6 + len(ROLE_FIELDS)))), owners)
+
+
+def _insert(db, form_items, year=None, index_cik=None):
+    """Inserts the forms of ``form_items``, (form_loc, form dict) pairs, in the open transaction."""
+    issuers, insiders, owners, filings, trades = _rows(form_items, year, index_cik)
+    _insert_owners(db, issuers, insiders, owners)
+    # replacing a filing deletes its trades through the foreign key cascade
+    db.executemany('delete from filing where form_loc = ?', [(f[0],) for f in filings])
+    db.executemany('insert into filing values (?, ?, ?, ?, ?)', filings)
+    db.executemany('insert into trade (form_loc, date, num_shares, price_per_share, sec_type, '
+                   'direct_or_indirect, acquired_disposed_code, transaction_code, '
+                   'shares_owned_after, issuer_cik, insider_cik, conversion_price, '
+                   'underlying_shares, is_derivative, owner_index) '
+                   'values ({})'.format(', '.join('?' * 15)), trades)
+    return len(trades)
+
+
+def load_forms(form_items, db, batch_size=None):
+    """
+    Loads parsed forms into the database, ``batch_size`` forms per transaction.
+
+    Args:
+        form_items (Iterable): (form_loc, form dict) pairs.
+
+    Returns:
+        int: number of trades loaded.
+    """
+    batch_size = batch_size or config.TRADE_DB_BATCH_SIZE
+    form_items = iter(form_items)
+    num_trades = 0
+    while True:
+        batch = list(itertools.islice(form_items, batch_size))
+        if not batch:
+            return num_trades
+        with db:
+            num_trades += _insert(db, batch)
+
+
+def bulk_parse_items_iter(lines):
+    """Yields (form_loc, form dict) pairs from ``bulk_parse`` output, skipping errors."""
+    for line in lines:
+        result = json.loads(line)
+        if 'form' in result:
+            yield result['form_loc'], result['form']
+
+
+def has_partition(year, cik, db):
+    return partition_mtime(year, cik, db) is not None
+
+
+def partition_mtime(year, cik, db):
+    """Returns when the partition for ``year`` and ``cik`` was written, or None."""
+    row = db.execute('select mtime from ingested_partition where year = ? and cik = ?',
+                     (int(year), int(cik))).fetchone()
+    return row[0] if row is not None else None
+
+
+def write_partition(year, cik, form_items, db):
+    """
+    Replaces the filings ingested for ``year`` and ``cik`` with ``form_items``, in a single
+    transaction.
+
+    Returns:
+        int: number of trades written.
+    """
+    form_items = list(form_items)
+    partition = (int(year), int(cik))
+    with db:
+        db.execute('delete from partition_filing where year = ? and index_cik = ?', partition)
+        db.execute('delete from filing_owner where year = ? and index_cik = ?', partition)
+        num_trades = _insert(db, form_items, *partition)
+        db.executemany('insert or replace into partition_filing values (?, ?, ?, ?)',
+                       [partition + (position, form_loc)
+                        for position, (form_loc, _) in enumerate(form_items)])
+        # filings dropped from the partition, unless another partition still lists them
+        db.execute('delete from filing where year = ? and index_cik = ? and form_loc not in '
+                   '(select form_loc from partition_filing)', partition)
+        db.execute('insert or replace into ingested_partition values (?, ?, ?)',
+                   partition + (time.time(),))
+    return num_trades
+
+
+def ingested_partitions(db):
+    """Returns the (year, cik) of every partition written with ``write_partition``."""
+    return db.execute('select year, cik from ingested_partition order by year, cik').fetchall()
+
+
+def write_owner_index(year, cik, form_items, db):
+    """
+    Replaces the insider index entries of the partition for ``year`` and ``cik`` with the
+    owners of ``form_items``, (form_loc, form dict) pairs.  Used when the trades themselves
+    are written to the column store, ``write_partition`` indexes them too.
+    """
+    issuers, insiders, owners, _, _ = _rows(form_items, int(year), int(cik), with_trades=False)
+    with db:
+        db.execute('delete from filing_owner where year = ? and index_cik = ?',
+                   (int(year), int(cik)))
+        _insert_owners(db, issuers, insiders, owners)
+
+
+def _year_filter(year_start, year_end):
+    where, params = [], []
+    if year_start is not None:
+        where.append('year >= ?')
+        params.append(int(year_start))
+    if year_end is not None:
+        where.append('year <= ?')
+        params.append(int(year_end))
+    return where, params
+
+
+def owner_filings(insider_cik, db, year_start=None, year_end=None):
+    """
+    Returns the ingested filings that list ``insider_cik`` as a reporting owner, by form
+    location.  Years are those of the form index partition the filings were ingested with.
+
+    Returns:
+        list: of dicts with keys form_loc, year, index_cik, issuer_cik, owner_index and the
+        roles of ``ROLE_FIELDS``.
+    """
+    where, params = _year_filter(year_start, year_end)
+    fields = ('form_loc', 'year', 'index_cik', 'issuer_cik', 'owner_index') + ROLE_FIELDS
+    rows = db.execute('select {} from filing_owner where {} order by form_loc'.format(
+        ', '.join(fields), ' and '.join(['insider_cik = ?'] + where)),
+        [int(insider_cik)] + params).fetchall()
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def owner_partitions(insider_cik, db, year_start=None, year_end=None):
+    """Returns the (year, index_cik) partitions with filings of ``insider_cik``."""
+    where, params = _year_filter(year_start, year_end)
+    return db.execute('select distinct year, index_cik from filing_owner where {} and '
+                      'year is not null order by year, index_cik'.format(
+                          ' and '.join(['insider_cik = ?'] + where)),
+                      [int(insider_cik)] + params).fetchall()
+
+
+def insider_issuers(insider_cik, db):
+    """
+    Returns the issuers of the ingested filings of ``insider_cik``, e.g. the boards the
+    insider sits on are those with ``is_director``.
+
+    Returns:
+        list: of dicts with keys cik, name, ticker, num_filings, and for each of
+        ``ROLE_FIELDS`` whether the insider reported that role in any filing, by issuer CIK.
+    """
+    roles = ', '.join("max(lower(trim(coalesce(o.{0}, ''))) in ('1', 'true')) as {0}"
+                      .format(field) for field in ROLE_FIELDS)
+    rows = db.execute('select o.issuer_cik, i.name, i.ticker, count(*), {} '
+                      'from filing_owner o left join issuer i on i.cik = o.issuer_cik '
+                      'where o.insider_cik = ? group by o.issuer_cik '
+                      'order by o.issuer_cik'.format(roles), (int(insider_cik),)).fetchall()
+    fields = ('cik', 'name', 'ticker', 'num_filings') + ROLE_FIELDS
+    return [dict(zip(fields, row[:4] + tuple(bool(v) for v in row[4:]))) for row in rows]
+
+
+def _trade_filters(transaction_codes, first_owner_only, prefix=''):
+    where, params = [], []
+    if transaction_codes is not None:
+        transaction_codes = list(transaction_codes)
+        where.append('{}transaction_code in ({})'.format(
+            prefix, ', '.join('?' * len(transaction_codes))))
+        params.extend(transaction_codes)
+    if first_owner_only:
+        where.append('{}owner_index = 0'.format(prefix))
+    return where, params
+
+
+def _trade_batch(rows):
+    if not rows:
+        return records.TradeBatch(records.empty_columns())
+    columns = {}
+    for (name, dtype), values in zip(records.TRADE_COLUMNS, zip(*rows)):
+        columns[name] = np.array(values, dtype=None if dtype == 'U' else dtype)
+    return records.TradeBatch(columns)
+
+
+def query_trades(db, issuer_cik=None, insider_cik=None, date_start=None, date_end=None,
+                 transaction_codes=None, first_owner_only=False):
+    """
+    Returns the trades matching every given filter as a ``records.TradeBatch``, by date.
+
+    Args:
+        issuer_cik: CIK of the company whose stock was traded.
+        insider_cik: CIK of the insider who traded.
+        date_start (str): first trade date, YYYY-MM-DD.
+        date_end (str): last trade date, YYYY-MM-DD.
+        transaction_codes (Iterable): e.g. ('P', 'S') for open market purchases and sales.
+        first_owner_only (bool): only the rows of the first owner of each filing, which
+            count each trade once.
+    """
+    where, params = [], []
+    for column, op, value in (('issuer_cik', '=', issuer_cik),
+                              ('insider_cik', '=', insider_cik),
+                              ('date', '>=', date_start),
+                              ('date', '<=', date_end)):
+        if value is not None:
+            where.append('{} {} ?'.format(column, op))
+            params.append(int(value) if column.endswith('cik') else value)
+    filters, filter_params = _trade_filters(transaction_codes, first_owner_only)
+    where.extend(filters)
+    params.extend(filter_params)
+    query = 'select {} from trade'.format(', '.join(records.TRADE_COLUMN_NAMES))
+    if where:
+        query += ' where ' + ' and '.join(where)
+    return _trade_batch(db.execute(query + ' order by date, id', params).fetchall())
+
+
+def read_trade_batch(cik, year_start, year_end, db, transaction_codes=None,
+                     first_owner_only=False):
+    """
+    Returns the trades of the forms ingested for ``cik`` in the form index years of the
+    range, in the order of the partitions, as ``tradestore.read_trade_batch`` does.  A trade
+    filed in January of a year is in that year whatever its trade date.
+    """
+    where, params = _trade_filters(transaction_codes, first_owner_only, 't.')
+    rows = db.execute(
+        'select {} from partition_filing p join trade t on t.form_loc = p.form_loc '
+        'where {} order by p.year, p.position, t.id'.format(
+            ', '.join('t.' + name for name in records.TRADE_COLUMN_NAMES),
+            ' and '.join(['p.index_cik = ?', 'p.year >= ?', 'p.year <= ?'] + where)),
+        [int(cik), int(year_start), int(year_end)] + params).fetchall()
+    return _trade_batch(rows)
+
+
+def read_insider_trades(insider_cik, year_start, year_end, db, transaction_codes=None):
+    """
+    Returns the trades reported by ``insider_cik`` in the forms ingested in the form index
+    years of the range, as ``tradestore.read_insider_trades`` reads them from the partitions
+    of ``owner_partitions``.
+    """
+    where, params = _trade_filters(transaction_codes, False, 't.')
+    rows = db.execute(
+        'select {} from (select distinct year, index_cik from filing_owner '
+        'where insider_cik = ? and year >= ? and year <= ?) o '
+        'join partition_filing p on p.year = o.year and p.index_cik = o.index_cik '
+        'join trade t on t.form_loc = p.form_loc '
+        'where {} order by p.year, p.index_cik, p.position, t.id'.format(
+            ', '.join('t.' + name for name in records.TRADE_COLUMN_NAMES),
+            ' and '.join(['t.insider_cik = ?'] + where)),
+        [int(insider_cik), int(year_start), int(year_end), int(insider_cik)] + params
+        ).fetchall()
+    return _trade_batch(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load parsed SEC forms into the trade '
+                                                 'database.')
+    subparsers = parser.add_subparsers(dest='command')
+    load = subparsers.add_parser('load', help='load the JSON lines output of bulk_parse')
+    load.add_argument('input', help='bulk_parse output file, - for stdin')
+    load.add_argument('--db', default=None, help='database file, defaults to config.TRADE_DB')
+    load.add_argument('--batch-size', type=int, default=config.TRADE_DB_BATCH_SIZE,
+                      help='number of forms per transaction')
+    index_owners = subparsers.add_parser('index-owners',
+                                         help='rebuild the insider index of the stored trades')
+    index_owners.add_argument('--db', default=None,
+                              help='database file, defaults to config.TRADE_DB')
+    args = parser.parse_args(argv)
+
+    if args.command == 'load':
+        with closing(connect_trade_db(args.db)) as db:
+            if args.input == '-':
+                num_trades = load_forms(bulk_parse_items_iter(sys.stdin), db, args.batch_size)
+            else:
+                with open(args.input, 'r') as f:
+                    num_trades = load_forms(bulk_parse_items_iter(f), db, args.batch_size)
+        print('Loaded {} trades'.format(num_trades))
+    elif args.command == 'index-owners':
+        # get_trades writes the partitions with this module
+        from boardroom import get_trades
+        with closing(connect_trade_db(args.db)) as db:
+            num_partitions = get_trades.index_owners(db=db)
+        print('Indexed the owners of {} partitions'.format(num_partitions))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Columnar on-disk store of the trades parsed from SEC forms.
+
+Forms are parsed once at ingest and their trades written as one ``.npy`` array per column,
+partitioned by form index year and CIK::
+
+    <TRADE_STORE_DIR>/<year>/<cik>/<column>.npy
+    <TRADE_STORE_DIR>/<year>/<cik>/issuers.json
+    <TRADE_STORE_DIR>/<year>/<cik>/owners.json
+
+The partition CIK is the one the forms are listed under in the form index, i.e. the issuer
+when looking up a ticker.  Reads memory-map only the columns and partitions asked for.
+"""
+import os
+import shutil
+import datetime
+
+import numpy as np
+
+from boardroom import config, utils, records
+
+TRADE_COLUMNS = records.TRADE_COLUMNS
+TRADE_COLUMN_NAMES = records.TRADE_COLUMN_NAMES
+
+
+def partition_dir(year, cik):
+    return os.path.join(config.TRADE_STORE_DIR, str(year), str(int(cik)))
+
+
+def has_partition(year, cik):
+    return os.path.isdir(partition_dir(year, cik))
+
+
+def iter_partitions():
+    """Yields the (year, cik) of every partition written, sorted."""
+    if not os.path.isdir(config.TRADE_STORE_DIR):
+        return
+    for year in sorted(int(y) for y in os.listdir(config.TRADE_STORE_DIR) if y.isdigit()):
+        # partitions being written are in <cik>.tmp, replaced ones in <cik>.old
+        ciks = os.listdir(os.path.join(config.TRADE_STORE_DIR, str(year)))
+        for cik in sorted(int(c) for c in ciks if c.isdigit()):
+            yield year, cik
+
+
+def partition_mtime(year, cik):
+    """Returns when the partition for ``year`` and ``cik`` was written, or None."""
+    try:
+        return os.path.getmtime(partition_dir(year, cik))
+    except OSError:
+        return None
+
+
+def forms_to_columns(forms):
+    """
+    Flattens the trades of ``forms`` into a dict mapping column name to numpy array.
+
+    Also returns the issuers and owners of the forms, each a dict keyed by CIK.
+    """
+    trades = []
+    issuers = {}
+    owners = {}
+    for form in forms:
+        issuers.update(form['issuer'])
+        owners.update(form['owner'])
+        trades.extend(records.trades_from_form(form))
+    return records.TradeBatch.from_trades(trades).columns, issuers, owners
+
+
+def write_partition(year, cik, forms):
+    """
+    Writes the trades, issuers and owners of ``forms`` as the partition for ``year`` and
+    ``cik``, replacing any existing partition.
+
+    Returns:
+        int: number of trades written.
+    """
+    columns, issuers, owners = forms_to_columns(forms)
+    outdir = partition_dir(year, cik)
+    tmpdir = outdir + '.tmp'
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    utils.makedirs(tmpdir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmpdir, name + '.npy'), values)
+    utils.save_cache_dict(issuers, 'issuers.json', tmpdir)
+    utils.save_cache_dict(owners, 'owners.json', tmpdir)
+    utils.replace_dir(tmpdir, outdir)
+    return len(columns['date'])
+
+
+def read_partition(year, cik, columns=TRADE_COLUMN_NAMES):
+    """
+    Returns a dict mapping each name in ``columns`` to its memory-mapped array.
+
+    Columns added since the partition was written are filled with their default values.
+
+    Raises:
+        FileNotFoundError: if the partition has not been written.
+    """
+    indir = partition_dir(year, cik)
+    result = {}
+    for name in columns:
+        fpath = os.path.join(indir, name + '.npy')
+        if name in records.COLUMN_DEFAULTS and not os.path.exists(fpath):
+            length = len(np.load(os.path.join(indir, 'date.npy'), mmap_mode='r'))
+            result[name] = records.default_column(name, length)
+        else:
+            result[name] = np.load(fpath, mmap_mode='r')
+    return result
+
+
+def read_trades(cik, year_start, year_end, columns=TRADE_COLUMN_NAMES):
+    """
+    Returns the trade columns for ``cik`` concatenated over the partitions in the year range.
+
+    Years without a partition are skipped.
+    """
+    parts = [read_partition(year, cik, columns)
+             for year in range(int(year_start), int(year_end)+1)
+             if has_partition(year, cik)]
+    if not parts:
+        return records.empty_columns(columns)
+    return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+
+def read_owners(year, cik):
+    return utils.load_cache_dict('owners.json', partition_dir(year, cik))
+
+
+def read_issuers(year, cik):
+    return utils.load_cache_dict('issuers.json', partition_dir(year, cik))
+
+
+def read_trade_batch(cik, year_start, year_end, transaction_codes=None,
+                     first_owner_only=False):
+    """
+    Returns the trades for ``cik`` in the year range as a ``records.TradeBatch``, only
+    those with one of ``transaction_codes`` if it is given, and only the rows of the first
+    owner of each form, each trade once, if ``first_owner_only``.
+    """
+    columns = read_trades(cik, year_start, year_end)
+    mask = np.ones(len(columns['date']), dtype=bool)
+    if transaction_codes is not None:
+        mask &= np.isin(columns['transaction_code'], list(transaction_codes))
+    if first_owner_only:
+        mask &= columns['owner_index'] == 0
+    if not mask.all():
+        columns = {name: values[mask] for name, values in columns.items()}
+    return records.TradeBatch(columns)
+
+
+def read_insider_trades(insider_cik, partitions, transaction_codes=None):
+    """
+    Returns the trades reported by ``insider_cik`` in the (year, cik) ``partitions`` as a
+    ``records.TradeBatch``, see ``tradedb.owner_partitions``.
+    """
+    parts = []
+    for year, cik in partitions:
+        if not has_partition(year, cik):
+            continue
+        columns = read_partition(year, cik)
+        mask = columns['insider_cik'] == int(insider_cik)
+        if transaction_codes is not None:
+            mask &= np.isin(columns['transaction_code'], list(transaction_codes))
+        parts.append({name: values[mask] for name, values in columns.items()})
+    if not parts:
+        return records.TradeBatch(records.empty_columns())
+    return records.TradeBatch({name: np.concatenate([part[name] for part in parts])
+                               for name in TRADE_COLUMN_NAMES})
+
+
+def columns_to_trade_dicts(columns):
+    """
+    Converts trade columns back to the trade dicts produced by ``get_trades``.
+    """
+    return records.TradeBatch(columns).to_dicts()
+
+
+def is_partition_final(year):
+    """Partitions for past years never change, the current year's keeps growing."""
+    return int(year) < datetime.date.today().year
@@ -0,0 +1,147 @@
+"""
+Shared HTTP transport.
+
+All downloads go through one pooled ``requests.Session`` so that connections to EDGAR and
+the price sources are kept alive and reused instead of paying a TCP and TLS handshake for
+every file.
+"""
+import sys
+import time
+import random
+import datetime
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from boardroom import config
+
+# Status codes that are worth retrying, any other unexpected status fails immediately.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def new_session(pool_size=config.HTTP_POOL_SIZE):
+    """
+    Returns a ``requests.Session`` keeping up to ``pool_size`` connections alive per host.
+
+    Warns if ``config.HTTP_USER_AGENT`` is the placeholder, which does not declare who
+    downloads as the SEC requires.
+    """
+    if config.HTTP_USER_AGENT == config.DEFAULT_HTTP_USER_AGENT:
+        print('BOARDROOM_USER_AGENT is not set, EDGAR may refuse the downloads: set it to '
+              '"<company or name> <contact email>"', file=sys.stderr)
+    session = requests.Session()
+    session.headers['User-Agent'] = config.HTTP_USER_AGENT
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Returns the session shared by every thread in the process."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def set_pool_size(pool_size):
+    """Replaces the shared session with one using a connection pool of ``pool_size``."""
+    global _session
+    with _session_lock:
+        old_session, _session = _session, new_session(pool_size)
+    if old_session is not None:
+        old_session.close()
+
+
+def retry_after_seconds(response):
+    """
+    Returns the number of seconds requested by the ``Retry-After`` header of ``response``,
+    or None if the header is missing or unreadable.
+    """
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    now = datetime.datetime.now(retry_at.tzinfo)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+def backoff_delay(attempt, backoff_factor=config.HTTP_BACKOFF_FACTOR,
+                  backoff_max=config.HTTP_BACKOFF_MAX):
+    """
+    Returns the delay before retry number ``attempt`` (starting at 0).
+
+    Uses exponential backoff with full jitter, so that many threads failing at once do not
+    retry in lockstep.
+    """
+    return random.uniform(0, min(backoff_max, backoff_factor * 2 ** attempt))
+
+
+def get(url, accept_status_codes=(200,), num_retries=config.HTTP_NUM_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR, rate_limiter=None, stream=False,
+        timeout=config.HTTP_TIMEOUT, headers=None):
+    """
+    Performs a GET request through the shared session, retrying on failure.
+
+    Connection errors, timeouts and the status codes in ``RETRY_STATUS_CODES`` are retried
+    up to ``num_retries`` attempts in total with exponential backoff.  If the server sends a
+    ``Retry-After`` header the wait is at least that long.
+
+    Args:
+        url (str): URL to request.
+        accept_status_codes (Iterable): Status codes returned to the caller as is.
+        num_retries (int): Maximum number of attempts.
+        backoff_factor (float): Base delay in seconds of the exponential backoff.
+        rate_limiter (utils.TokenBucket): If set, a token is taken before every attempt.
+        stream (bool): If True, the body is not read up front (see ``requests``).
+        timeout (float): Seconds to wait for the server to send data.
+        headers (dict): Extra request headers.
+
+    Returns:
+        requests.Response
+
+    Raises:
+        requests.exceptions.RequestException: if the last attempt failed.
+    """
+    session = get_session()
+    for attempt in range(num_retries):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        response = None
+        try:
+            response = session.get(url, headers=headers, stream=stream, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        else:
+            if response.status_code in accept_status_codes:
+                return response
+            error = requests.exceptions.HTTPError(
+                'Unexpected status code {} for url: {}'.format(response.status_code, url),
+                response=response)
+            if response.status_code not in RETRY_STATUS_CODES:
+                raise error
+        if attempt == num_retries-1:
+            raise error
+        delay = backoff_delay(attempt, backoff_factor)
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            response.close()
+        print('There was an error with request: {}, retrying in {:.1f}s'.format(error, delay))
+        time.sleep(delay)
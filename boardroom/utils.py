@@ -3,7 +3,12 @@ import errno
 import json
 import gzip
 import csv
+import time
+import shutil
+import collections
 import datetime
+import sqlite3
+import threading
 
 from boardroom import config
 
@@ -61,12 +66,126 @@ def silentremove(filepath):
             raise # re-raise exception if a different error occured
 
 
+def replace_dir(srcdir, dstdir):
+    """
+    Renames the directory ``srcdir`` to ``dstdir``, replacing any directory there.
+
+    The old directory is renamed aside before the new one is renamed in, and deleted last,
+    so ``dstdir`` is never left deleted or half deleted, and is restored if the new one
+    cannot be renamed in.
+    """
+    olddir = dstdir + '.old'
+    shutil.rmtree(olddir, ignore_errors=True)
+    try:
+        os.rename(dstdir, olddir)
+    except FileNotFoundError:
+        olddir = None
+    try:
+        os.rename(srcdir, dstdir)
+    except OSError:
+        if olddir is not None:
+            os.rename(olddir, dstdir)
+        raise
+    if olddir is not None:
+        shutil.rmtree(olddir, ignore_errors=True)
+
+
 def get_form_index_fpath(year):
     fname = '{}.psv'.format(year)
     return os.path.join(config.FORM_INDEX_DIR, fname)
 
 
+FORM_INDEX_DB_SCHEMA = """
+create table if not exists form_index (
+    year          integer not null,
+    form_type     text not null,
+    company_name  text not null,
+    cik           text not null,
+    date          text not null,
+    form_loc      text not null
+);
+create index if not exists form_index_cik_year on form_index (cik, year);
+
+create table if not exists indexed_year (
+    year    integer primary key,
+    mtime   real not null,
+    size    integer not null
+);
+"""
+
+
+def get_form_index_db_fpath():
+    return os.path.join(config.FORM_INDEX_DIR, 'form_index.db')
+
+
+def connect_form_index_db():
+    """
+    Connects to the SQLite database indexing the rows of the ``{year}.psv`` files by CIK.
+    """
+    makedirs(config.FORM_INDEX_DIR)
+    conn = sqlite3.connect(get_form_index_db_fpath())
+    conn.executescript(FORM_INDEX_DB_SCHEMA)
+    return conn
+
+
+def build_form_index_db(year, delimiter='|'):
+    """
+    Loads the rows of the form index file for ``year`` into the form index database,
+    replacing any rows previously loaded for that year.
+    """
+    fpath = get_form_index_fpath(year)
+    stat = os.stat(fpath)
+    conn = connect_form_index_db()
+    try:
+        with conn, open(fpath, 'r') as f:
+            csvreader = csv.reader(f, delimiter=delimiter)
+            conn.execute('delete from form_index where year = ?', (int(year),))
+            conn.executemany('insert into form_index values (?, ?, ?, ?, ?, ?)',
+                             ([int(year)] + row for row in csvreader))
+            conn.execute('insert or replace into indexed_year values (?, ?, ?)',
+                         (int(year), stat.st_mtime, stat.st_size))
+    finally:
+        conn.close()
+
+
+def _form_index_db_rows(year, cik):
+    """
+    Returns the form index rows for ``cik`` in ``year`` from the form index database, or
+    None if the year is not indexed or its file has changed since it was indexed.
+    """
+    if not os.path.exists(get_form_index_db_fpath()):
+        return None
+    try:
+        stat = os.stat(get_form_index_fpath(year))
+    except FileNotFoundError:
+        return None
+    conn = connect_form_index_db()
+    try:
+        indexed = conn.execute('select mtime, size from indexed_year where year = ?',
+                               (int(year),)).fetchone()
+        if indexed is None or indexed != (stat.st_mtime, stat.st_size):
+            return None
+        rows = conn.execute('select form_type, company_name, cik, date, form_loc '
+                            'from form_index where cik = ? and year = ? order by rowid',
+                            (cik, int(year))).fetchall()
+    finally:
+        conn.close()
+    return [list(row) for row in rows]
+
+
 def form_loc_iter(year, delimiter='|', cik=None):
+    """
+    Yields the rows of the form index file for ``year``, only those for ``cik`` if given.
+
+    Lookups by CIK use the form index database when it is up to date for ``year``, so they
+    cost time proportional to the number of matches instead of a scan of the whole file.
+    """
+    if cik is not None:
+        rows = _form_index_db_rows(year, cik)
+        if rows is not None:
+            for row in rows:
+                yield row
+            return
     fpath = get_form_index_fpath(year)
     with open(fpath, 'r') as f:
         csvreader = csv.reader(f, delimiter=delimiter)
@@ -99,3 +218,95 @@ def epoch_time_to_datetime(epoch_time):
 
 def epoch_time_to_date_str(epoch_time, fmt='%Y-%m-%d'):
     return epoch_time_to_datetime(epoch_time).strftime(fmt)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket limiting the rate of some action.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``.  Each call to
+    :meth:`acquire` takes a token, blocking until one is available, so that all threads
+    sharing a bucket together stay at or under ``rate`` actions per second.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens held, i.e. the allowed burst size.
+            Defaults to ``rate``.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """Blocks until ``tokens`` are available and takes them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LRUCache(object):
+    """
+    Thread-safe, size-bounded cache evicting the least recently used entries first.
+
+    Entries also expire ``ttl`` seconds after being set.  Hits and misses are counted, see
+    :meth:`stats`.
+
+    Args:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Seconds an entry stays valid, or None for no expiry.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Returns a dict with the hits, misses, size and maxsize of the cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._data), 'maxsize': self.maxsize}